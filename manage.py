@@ -1,6 +1,13 @@
 from flask_script import Manager
 from register.main import app
+from register.utilities import outbox, validation
+from register.utilities.data.connection import start, commit, rollback
+from register.utilities.data.idempotency import purge_stored_responses
+from register.utilities.data.merkle_data import rebuild_merkle_frontier as rebuild_frontier
+from register.utilities.data.sequencer import lock_appends
 import os
+import time
+import timeit
 # ***** For Alembic start ******
 from flask_migrate import Migrate, MigrateCommand
 from register.extensions import db
@@ -25,5 +32,59 @@ def runserver(port=10000):
     app.run(debug=True, port=int(port))
 
 
+@manager.command
+def dispatch_outbox():
+    """Publish outbox messages to the exchange until stopped"""
+    batch_size = app.config['OUTBOX_BATCH_SIZE']
+    while True:
+        if outbox.dispatch_outbox(batch_size) < batch_size:
+            time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+
+
+@manager.command
+def purge_idempotency_keys():
+    """Delete idempotency keys older than IDEMPOTENCY_TTL"""
+    cursor = start()
+    try:
+        purge_stored_responses(cursor, app.config['IDEMPOTENCY_TTL'])
+        commit(cursor)
+    except Exception:
+        rollback(cursor)
+        raise
+
+
+@manager.command
+def rebuild_merkle_frontier():
+    """Rebuild the merkle frontier and perfect subtree hashes from the leaf hashes"""
+    cursor = start()
+    try:
+        lock_appends(cursor)
+        rebuild_frontier(cursor)
+        commit(cursor)
+    except Exception:
+        rollback(cursor)
+        raise
+
+
+@manager.command
+def benchmark_validation(count=10000):
+    """Time the in-process checks applied to each item before it is sent to the validation API"""
+    item = {
+        "local-land-charge": 1,
+        "statutory-provisions": ["Law 342"],
+        "geometry": {"type": "Polygon", "coordinates": [[[x, x + 1] for x in range(500)]]},
+        "registration-date": "2012-09-01",
+        "charge-type": "Smoke Control Order",
+        "originating-authority": "Dave's Charge Shop",
+        "further-information": []
+    }
+    envelope = {"item": item, "item-hash": "sha-256:0", "item-signature": "rs256:0"}
+    count = int(count)
+    for name, check in [('envelope', lambda: validation.get_envelope_errors(envelope)),
+                        ('item', lambda: validation.get_local_item_errors(item))]:
+        seconds = timeit.timeit(check, number=count)
+        print("{}: {:.1f} microseconds per item".format(name, seconds * 1000000 / count))
+
+
 if __name__ == "__main__":
     manager.run()
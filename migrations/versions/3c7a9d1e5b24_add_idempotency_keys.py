@@ -0,0 +1,33 @@
+"""Add idempotency keys
+
+Revision ID: 3c7a9d1e5b24
+Revises: 8e4f2b7a6c13
+Create Date: 2026-10-18 14:20:41.803512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c7a9d1e5b24'
+down_revision = '8e4f2b7a6c13'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from flask import current_app
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+                    sa.Column('idempotency_key', sa.String(), primary_key=True),
+                    sa.Column('request_hash', sa.String(), nullable=False),
+                    sa.Column('response_status', sa.Integer(), nullable=False),
+                    sa.Column('response_headers', postgresql.JSONB(), nullable=True),
+                    sa.Column('response_body', sa.Text(), nullable=False),
+                    sa.Column('created', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+    op.create_index('ix_idempotency_key_created', 'idempotency_key', ['created'])
+    op.execute("GRANT SELECT, INSERT, DELETE ON idempotency_key TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_key_created')
+    op.drop_table('idempotency_key')
@@ -0,0 +1,32 @@
+"""Add record table
+
+Revision ID: 5d1c8e2f4a90
+Revises: bfd417c0cb8a
+Create Date: 2026-10-18 10:02:17.553108
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d1c8e2f4a90'
+down_revision = 'bfd417c0cb8a'
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+def upgrade():
+    op.create_table('record',
+                    sa.Column('key', sa.String(), primary_key=True),
+                    sa.Column('entry_number', sa.Integer(), nullable=False),
+                    sa.Column('item_hash', sa.String(), nullable=False))
+    op.create_index('ix_record_entry_number', 'record', ['entry_number'])
+    op.execute("INSERT INTO record (key, entry_number, item_hash) "
+               "SELECT DISTINCT ON (key) key, entry_number, item_hash FROM entry "
+               "ORDER BY key, entry_number DESC")
+    op.execute("GRANT SELECT, INSERT, UPDATE ON record TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_index('ix_record_entry_number')
+    op.drop_table('record')
@@ -0,0 +1,45 @@
+"""Add ingest jobs
+
+Revision ID: 8e4f2b7a6c13
+Revises: 5d1c8e2f4a90
+Create Date: 2026-10-18 10:48:55.120447
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2b7a6c13'
+down_revision = '5d1c8e2f4a90'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from flask import current_app
+
+
+def upgrade():
+    op.create_table('ingest_job',
+                    sa.Column('job_id', sa.String(), primary_key=True),
+                    sa.Column('status', sa.String(), nullable=False),
+                    sa.Column('created', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+                    sa.Column('updated', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+                    sa.Column('item_count', sa.Integer(), nullable=False),
+                    sa.Column('processed_count', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('items', postgresql.JSONB(), nullable=True),
+                    sa.Column('errors', postgresql.JSONB(), nullable=True))
+    op.create_index('ix_ingest_job_status_created', 'ingest_job', ['status', 'created'])
+
+    op.create_table('ingest_job_entry',
+                    sa.Column('job_id', sa.String(), nullable=False),
+                    sa.Column('item_index', sa.Integer(), nullable=False),
+                    sa.Column('item_hash', sa.String(), nullable=False),
+                    sa.Column('entry_number', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('job_id', 'item_index'))
+
+    op.execute("GRANT SELECT, INSERT, UPDATE ON ingest_job TO " + current_app.config.get('APP_SQL_USERNAME'))
+    op.execute("GRANT SELECT, INSERT ON ingest_job_entry TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_table('ingest_job_entry')
+    op.drop_index('ix_ingest_job_status_created')
+    op.drop_table('ingest_job')
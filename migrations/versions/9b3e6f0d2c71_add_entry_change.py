@@ -0,0 +1,34 @@
+"""Add entry change log
+
+Revision ID: 9b3e6f0d2c71
+Revises: 3c7a9d1e5b24
+Create Date: 2026-10-18 21:05:33.190274
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b3e6f0d2c71'
+down_revision = '3c7a9d1e5b24'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from flask import current_app
+
+
+def upgrade():
+    op.create_table('entry_change',
+                    sa.Column('entry_number', sa.Integer(), primary_key=True),
+                    sa.Column('action_type', sa.String(), nullable=False),
+                    sa.Column('previous_entry_number', sa.Integer(), nullable=True),
+                    sa.Column('changes', postgresql.JSONB(), nullable=True))
+    # Existing entries get their action and previous entry; their diffs are worked out when first needed
+    op.execute("INSERT INTO entry_change (entry_number, action_type, previous_entry_number) "
+               "SELECT entry_number, CASE WHEN previous IS NULL THEN 'NEW' ELSE 'UPDATED' END, previous "
+               "FROM (SELECT entry_number, "
+               "lag(entry_number) OVER (PARTITION BY key ORDER BY entry_number) AS previous FROM entry) AS e")
+    op.execute("GRANT SELECT, INSERT ON entry_change TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_table('entry_change')
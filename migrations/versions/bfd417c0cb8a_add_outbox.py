@@ -0,0 +1,29 @@
+"""Add outbox
+
+Revision ID: bfd417c0cb8a
+Revises: 2771629f25c0
+Create Date: 2026-10-18 09:12:41.402215
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'bfd417c0cb8a'
+down_revision = '2771629f25c0'
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+def upgrade():
+    # The message is text rather than JSONB so that it is published exactly as it was written
+    op.create_table('outbox',
+                    sa.Column('entry_number', sa.Integer(), primary_key=True),
+                    sa.Column('routing_key', sa.String(), nullable=False),
+                    sa.Column('message', sa.Text(), nullable=False),
+                    sa.Column('created', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+    op.execute("GRANT SELECT, INSERT, DELETE ON outbox TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_table('outbox')
@@ -0,0 +1,64 @@
+"""Add merkle frontier
+
+Revision ID: c41f7a2e9d58
+Revises: 9b3e6f0d2c71
+Create Date: 2026-10-18 22:14:09.662130
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c41f7a2e9d58'
+down_revision = '9b3e6f0d2c71'
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+from register.utilities.merkle_tree import extend_frontier
+from base64 import b16encode
+
+BATCH_SIZE = 10000
+
+
+def upgrade():
+    op.create_table('merkle_frontier',
+                    sa.Column('height', sa.Integer(), primary_key=True),
+                    sa.Column('branch_hash', sa.String(), nullable=False))
+
+    # Built from the existing leaves once; the application extends it with each append from now on. The hash of every
+    # perfect subtree of the existing leaves is stored on the way, replacing any copy cached by a read, as appends
+    # store those they complete.
+    connection = op.get_bind()
+    count, latest = connection.execute("SELECT COUNT(*), COALESCE(MAX(entry_number), 0) FROM leaf_hashes").first()
+    if count != latest:
+        # Proofs take leaf index to be entry number - 1, so a frontier folded over missing leaves would be wrong
+        raise Exception("leaf_hashes has {} rows up to entry {}; fill the gaps before building the merkle frontier"
+                        .format(count, latest))
+    connection.execute(sa.text("DELETE FROM branch_hashes "
+                               "WHERE ((end_entry_number - start_entry_number + 1) & "
+                               "(end_entry_number - start_entry_number)) = 0 "
+                               "AND (start_entry_number - 1) % (end_entry_number - start_entry_number + 1) = 0"))
+    frontier = {}
+    size = 0
+    rows = connection.execution_options(stream_results=True).execute(
+        "SELECT entry_hash FROM leaf_hashes ORDER BY entry_number")
+    while True:
+        batch = rows.fetchmany(BATCH_SIZE)
+        if not batch:
+            break
+        completed = []
+        frontier = extend_frontier(frontier, size, [bytes.fromhex(row[0]) for row in batch], completed)
+        size += len(batch)
+        if completed:
+            connection.execute(sa.text("INSERT INTO branch_hashes (start_entry_number, end_entry_number, branch_hash) "
+                                       "VALUES (:start, :end, :hash)"),
+                               [{'start': start + 1, 'end': start + length, 'hash': b16encode(branch_hash).decode()}
+                                for start, length, branch_hash in completed])
+    for height, branch_hash in frontier.items():
+        connection.execute(sa.text("INSERT INTO merkle_frontier (height, branch_hash) VALUES (:height, :hash)"),
+                           height=height, hash=b16encode(branch_hash).decode())
+
+    op.execute("GRANT SELECT, INSERT, DELETE ON merkle_frontier TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_table('merkle_frontier')
@@ -0,0 +1,40 @@
+"""Add tree head history
+
+Revision ID: e7a5c3b19f42
+Revises: c41f7a2e9d58
+Create Date: 2026-10-18 23:31:52.074418
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e7a5c3b19f42'
+down_revision = 'c41f7a2e9d58'
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+from register.utilities.merkle_tree import frontier_root, frontier_size
+from base64 import b16encode
+
+
+def upgrade():
+    op.create_table('tree_head',
+                    sa.Column('tree_size', sa.Integer(), primary_key=True),
+                    sa.Column('root_hash', sa.String(), nullable=False),
+                    sa.Column('timestamp', sa.DateTime(), nullable=False),
+                    sa.Column('signature', sa.String(), nullable=True))
+
+    # The current head, unsigned; heads are recorded with each append from now on
+    connection = op.get_bind()
+    frontier = {row[0]: bytes.fromhex(row[1])
+                for row in connection.execute("SELECT height, branch_hash FROM merkle_frontier")}
+    if frontier:
+        connection.execute(sa.text("INSERT INTO tree_head (tree_size, root_hash, timestamp) "
+                                   "VALUES (:size, :root, now())"),
+                           size=frontier_size(frontier), root=b16encode(frontier_root(frontier)).decode())
+
+    op.execute("GRANT SELECT, INSERT ON tree_head TO " + current_app.config.get('APP_SQL_USERNAME'))
+
+
+def downgrade():
+    op.drop_table('tree_head')
@@ -0,0 +1,63 @@
+from register.app import app
+from register.dependencies.rabbitmq import get_queue_count
+from register.exceptions import ApplicationError
+from functools import wraps
+import threading
+import time
+
+
+class QueueDepthMonitor(object):
+    """Tracks the depth of the queues consuming register events, sampling at most every BACKPRESSURE_SAMPLE_INTERVAL.
+
+    Only one thread samples at a time; the others carry on with the last sample rather than waiting for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sampled_at = None
+        self._depths = {}
+
+    def depths(self):
+        if self._sampled_at is None or \
+                time.monotonic() - self._sampled_at >= app.config['BACKPRESSURE_SAMPLE_INTERVAL']:
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._depths = self._sample()
+                    self._sampled_at = time.monotonic()
+                finally:
+                    self._lock.release()
+        return self._depths
+
+    def _sample(self):
+        depths = {}
+        for queue_name in app.config['BACKPRESSURE_QUEUES']:
+            try:
+                depths[queue_name] = get_queue_count(app.config['RABBIT_URL'], queue_name)
+            except Exception as e:
+                # Can't tell, so don't hold writes up
+                app.logger.warning("Unable to read depth of queue %s: %s", queue_name, repr(e))
+        app.logger.debug("Queue depths: %s", str(depths))
+        return depths
+
+    def overloaded_queue(self):
+        """Returns the name of a queue deeper than BACKPRESSURE_MAX_DEPTH, or None."""
+        for queue_name, depth in self.depths().items():
+            if depth > app.config['BACKPRESSURE_MAX_DEPTH']:
+                return queue_name
+        return None
+
+
+queue_monitor = QueueDepthMonitor()
+
+
+def admission_control(f):
+    # Turns writes away with a 503 and Retry-After while a consuming queue is over BACKPRESSURE_MAX_DEPTH
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        queue_name = queue_monitor.overloaded_queue()
+        if queue_name is not None:
+            app.logger.warning("Refusing write while queue %s is backed up", queue_name)
+            raise ApplicationError("Register is busy, try again later", "E503", 503,
+                                   headers={'Retry-After': str(app.config['BACKPRESSURE_RETRY_AFTER'])})
+        return f(*args, **kwargs)
+    return decorated
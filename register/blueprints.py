@@ -1,5 +1,6 @@
 # Import every blueprint file
-from register.views import general, item, items, entry, record, proof, register, entries, records, proofs
+from register.views import general, item, items, entry, record, proof, register, entries, records, proofs, jobs, \
+    metrics
 
 
 def register_blueprints(app):
@@ -13,6 +14,8 @@ def register_blueprints(app):
     app.register_blueprint(records.records, url_prefix='/records')
     app.register_blueprint(proof.proof, url_prefix='/proof')
     app.register_blueprint(proofs.proofs, url_prefix='/proofs')
+    app.register_blueprint(jobs.jobs, url_prefix='/jobs')
+    app.register_blueprint(metrics.metrics, url_prefix='/metrics')
     app.register_blueprint(register.register_blueprint, url_prefix='/register')
     # All done!
     app.logger.info("Blueprints registered")
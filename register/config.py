@@ -4,8 +4,10 @@ from urllib.parse import quote_plus
 # RULES OF CONFIG:
 # 1. No region specific code. Regions are defined by setting the OS environment variables appropriately to build up the
 # desired behaviour.
-# 2. No use of defaults when getting OS environment variables. They must all be set to the required values prior to the
-# app starting.
+# 2. No use of defaults when getting OS environment variables that describe where the app runs (database, broker,
+# register, keys). They must all be set to the required values prior to the app starting. Optional settings that tune
+# or switch on a feature may be read with os.getenv and a default, which must keep the app's existing behaviour and be
+# described in the comment above the setting, so that a deployment only sets those it changes.
 # 3. This is the only file in the app where os.environ should be used.
 
 # For logging
@@ -45,6 +47,20 @@ EXCHANGE_NAME = os.environ['EXCHANGE_NAME']
 EXCHANGE_TYPE = os.environ['EXCHANGE_TYPE']
 RABBIT_URL = os.environ['RABBIT_URL']
 
+# Entry events are written to the outbox table with the entry and published once the transaction commits, by
+# 'manage.py dispatch_outbox' running as a separate process. Alternatively set OUTBOX_DISPATCHER to 'yes' on a
+# designated web worker to run a dispatcher thread there.
+OUTBOX_DISPATCHER = os.getenv('OUTBOX_DISPATCHER', 'no') == 'yes'
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+# With ROUTING_PARTITIONS set to N, events are published to REGISTER_ROUTEKEY (or a republish routing key) plus a
+# '.<partition>' suffix from 0 to N-1, derived from the record key, so each record's events share a partition.
+ROUTING_PARTITIONS = int(os.getenv('ROUTING_PARTITIONS', '0'))
+# Messages of at least MESSAGE_COMPRESSION_MIN_SIZE bytes are compressed with MESSAGE_COMPRESSION ('gzip' or 'bzip2')
+# if it is set. Kombu consumers decompress them transparently; others must check the 'compression' header.
+MESSAGE_COMPRESSION = os.getenv('MESSAGE_COMPRESSION', None)
+MESSAGE_COMPRESSION_MIN_SIZE = int(os.getenv('MESSAGE_COMPRESSION_MIN_SIZE', '4096'))
+
 REGISTER_NAME = os.environ['REGISTER_NAME']
 REGISTER_KEY_FIELD = os.environ['REGISTER_KEY_FIELD']
 REGISTER_RECORD = os.environ['REGISTER_RECORD']
@@ -52,9 +68,81 @@ REGISTER_ROUTEKEY = os.environ['REGISTER_ROUTEKEY']
 
 PUBLIC_KEY = os.environ['PUBLIC_KEY']
 PUBLIC_PASSPHRASE = os.environ['PUBLIC_PASSPHRASE']
+# Tree heads are recorded with each append and signed with this private key (rs256) if it is given
+TREE_HEAD_PRIVATE_KEY = os.getenv('TREE_HEAD_PRIVATE_KEY', None)
+TREE_HEAD_PRIVATE_PASSPHRASE = os.getenv('TREE_HEAD_PRIVATE_PASSPHRASE', None)
+
+# When 'yes', the signatures of items submitted in batches (POST /records and POST /jobs) are checked, spread over
+# SIGNATURE_WORKERS processes. POST /record always checks the signature.
+VERIFY_BATCH_SIGNATURES = os.getenv('VERIFY_BATCH_SIGNATURES', 'no') == 'yes'
+SIGNATURE_WORKERS = int(os.getenv('SIGNATURE_WORKERS', str(os.cpu_count() or 1)))
+# Signatures that have verified are remembered, so resubmitted items skip the RSA work. 0 disables the cache.
+SIGNATURE_CACHE_SIZE = int(os.getenv('SIGNATURE_CACHE_SIZE', '10000'))
+
+# When 'yes', POST /records writes the whole batch with set-based statements rather than item by item
+BULK_INGEST = os.getenv('BULK_INGEST', 'no') == 'yes'
+
+# When 'yes', the JSON array posted to POST /records is parsed and written STREAM_INGEST_CHUNK_SIZE items at a time
+# rather than loaded whole. Newline delimited JSON (Content-Type: application/x-ndjson) is always streamed.
+STREAM_INGEST = os.getenv('STREAM_INGEST', 'no') == 'yes'
+STREAM_INGEST_CHUNK_SIZE = int(os.getenv('STREAM_INGEST_CHUNK_SIZE', '500'))
+# The longest single record accepted when streaming, in characters of the JSON array or bytes of an ndjson line.
+# Parsing stops with a 400 once a record passes it, rather than buffering a malformed one to the end of the body.
+STREAM_MAX_ITEM_SIZE = int(os.getenv('STREAM_MAX_ITEM_SIZE', '1048576'))
+
+# When above 0, concurrent POST /record requests arriving within this many milliseconds of each other are written in
+# one transaction (of at most GROUP_COMMIT_MAX_SIZE items). Only useful with threaded workers.
+GROUP_COMMIT_WINDOW_MS = int(os.getenv('GROUP_COMMIT_WINDOW_MS', '0'))
+GROUP_COMMIT_MAX_SIZE = int(os.getenv('GROUP_COMMIT_MAX_SIZE', '100'))
+
+# Batches submitted to POST /jobs are appended by a worker thread in each web worker, JOB_CHUNK_SIZE items per
+# transaction. A running job not updated for JOB_STALE_AFTER seconds is assumed abandoned and picked up again.
+JOB_WORKER = os.getenv('JOB_WORKER', 'yes') == 'yes'
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '5'))
+JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', '500'))
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '600'))
 
 VALIDATION_BASE_URI = os.getenv('VALIDATION_BASE_URI', None)
 VALIDATION_ENDPOINT = os.getenv('VALIDATION_ENDPOINT', '')
+# Items in a batch are validated VALIDATION_CONCURRENCY at a time over pooled keep-alive connections. After
+# VALIDATION_BREAKER_THRESHOLD consecutive failures, calls fail fast for VALIDATION_BREAKER_RESET seconds.
+VALIDATION_CONCURRENCY = int(os.getenv('VALIDATION_CONCURRENCY', '8'))
+VALIDATION_TIMEOUT = float(os.getenv('VALIDATION_TIMEOUT', '30'))
+VALIDATION_BREAKER_THRESHOLD = int(os.getenv('VALIDATION_BREAKER_THRESHOLD', '5'))
+VALIDATION_BREAKER_RESET = float(os.getenv('VALIDATION_BREAKER_RESET', '30'))
+# Items that passed validation are remembered by content hash, so resubmitting them skips the call. Change
+# VALIDATION_VERSION when the validation rules change (or DELETE /metrics/caches/validation). 0 disables the cache.
+VALIDATION_VERSION = os.getenv('VALIDATION_VERSION', '1')
+VALIDATION_CACHE_SIZE = int(os.getenv('VALIDATION_CACHE_SIZE', '10000'))
+# Items are checked against a schema in process before the validation API is called. The schema requires the key field
+# and leaves other fields to the validation API, unless a JSON schema file is given in ITEM_SCHEMA. With
+# ITEM_SCHEMA_CLOSED=yes it also rejects fields not listed in REGISTER_RECORD.
+LOCAL_VALIDATION = os.getenv('LOCAL_VALIDATION', 'yes') == 'yes'
+ITEM_SCHEMA = os.getenv('ITEM_SCHEMA', None)
+ITEM_SCHEMA_CLOSED = os.getenv('ITEM_SCHEMA_CLOSED', 'no') == 'yes'
+
+# When any of the (comma separated) BACKPRESSURE_QUEUES holds more than BACKPRESSURE_MAX_DEPTH messages, POST /record
+# and POST /records answer 503 with a Retry-After of BACKPRESSURE_RETRY_AFTER seconds and ingest jobs wait. Queue
+# depths are sampled at most every BACKPRESSURE_SAMPLE_INTERVAL seconds.
+BACKPRESSURE_QUEUES = [queue for queue in os.getenv('BACKPRESSURE_QUEUES', '').split(',') if queue]
+BACKPRESSURE_MAX_DEPTH = int(os.getenv('BACKPRESSURE_MAX_DEPTH', '100000'))
+BACKPRESSURE_SAMPLE_INTERVAL = float(os.getenv('BACKPRESSURE_SAMPLE_INTERVAL', '5'))
+BACKPRESSURE_RETRY_AFTER = int(os.getenv('BACKPRESSURE_RETRY_AFTER', '30'))
+
+# A POST /record or POST /records carrying an Idempotency-Key header stores its response with the entries it
+# appended; a retry with the same key (and body) within IDEMPOTENCY_TTL seconds gets that response back instead of
+# appending again. Expired keys are removed by the purge_idempotency_keys command.
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+
+# UPDATED messages carry the old and new value of each changed field as item-changes. ITEM_CHANGES_FORMAT=json-patch
+# sends an RFC 6902 patch from the previous item as item-patch instead, which for a moved geometry holds only the
+# coordinates that changed. Patches longer than ITEM_PATCH_MAX_OPERATIONS replace each changed field whole.
+ITEM_CHANGES_FORMAT = os.getenv('ITEM_CHANGES_FORMAT', 'fields')
+ITEM_PATCH_MAX_OPERATIONS = int(os.getenv('ITEM_PATCH_MAX_OPERATIONS', '1000'))
+
+# JSON encoder for responses, logs, messages and leaf hashes: 'orjson', 'ujson', 'json' (the standard library) or
+# 'auto' for the fastest installed. Leaf hashes are the same whichever is used.
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
 
 MAX_HEALTH_CASCADE = os.environ['MAX_HEALTH_CASCADE']
 DEPENDENCIES = {
@@ -1,57 +1,183 @@
 from Crypto.PublicKey import RSA
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA256
-from base64 import b64decode
+from base64 import b64decode, b64encode
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from flask import current_app
+from itertools import repeat
+from register.utilities.cache import LRUCache
+import os
 import re
+import threading
+
+# Below this many signatures a batch is checked in process, as it isn't worth the round trip to the pool
+SIGNATURE_POOL_THRESHOLD = 50
+
+MATCH_MESSAGE = "Signature and payload match."
+
+_verifiers = {}
 
 
 class CryptographicSigning(object):
     """Pseudo extension which gives persistent signer instances
 
+    The verifier is built from PUBLIC_KEY by init_app, and signatures that have verified are remembered (by payload
+    digest, signature and supplied hash) in a cache of SIGNATURE_CACHE_SIZE entries so repeats skip the RSA work.
+    Tree heads are signed with TREE_HEAD_PRIVATE_KEY, if it is set.
     """
     def __init__(self, app=None):
         self.app = app
+        self._lock = threading.Lock()
+        self.cyptosign_validate = None
+        self.signature_cache = None
+        self.signer = None
+        self._process_pool = None
+        self._pool_pid = None
         if app is not None:
             self.init_app(app)
 
-    # Currently don't need to do anything here
     def init_app(self, app):
-        pass
+        app.logger.info("Create validator")
+        self.cyptosign_validate = _load_verifier(app.config['PUBLIC_KEY'], app.config['PUBLIC_PASSPHRASE'])
+        self.signature_cache = LRUCache('signatures', app.config['SIGNATURE_CACHE_SIZE'])
+        if app.config['TREE_HEAD_PRIVATE_KEY']:
+            app.logger.info("Create tree head signer")
+            self.signer = _load_verifier(app.config['TREE_HEAD_PRIVATE_KEY'],
+                                         app.config['TREE_HEAD_PRIVATE_PASSPHRASE'])
+
+    def sign(self, payload):
+        # Returns None when there is no signing key
+        if self.signer is None:
+            return None
+        return 'rs256:' + b64encode(self.signer.sign(SHA256.new(payload.encode('UTF-8')))).decode()
 
     def validate_signature(self, payload, signature, payload_hash=None):
         current_app.logger.info("Validate the signature")
-        if not hasattr(self, 'cyptosign_validate'):
-            self.cyptosign_validate = self._create_validator()
-        sha256 = None
-        if payload_hash:
-            current_app.logger.info("Checking supplied payload hash")
-            hash_match = re.search('sha-256:(.+)', payload_hash)
-            if not hash_match:
-                current_app.logger.warning("Invalid payload hash supplied")
-                return False, "Invalid hash string '{0}'.".format(payload_hash)
-            current_app.logger.info("Found payload hash with valid format")
-            sha256 = hash_match.group(1)
-        current_app.logger.info("Checking supplied signature")
-        sig_match = re.search('rs256:(.+)', signature)
-        if not sig_match:
-            current_app.logger.warning("Invalid signature supplied")
-            return False, "Invalid signature string '{0}'.".format(signature)
-        current_app.logger.info("Found signature with valid format")
-        digest = SHA256.new()
-        digest.update(payload.encode('UTF-8'))
-        if sha256 and digest.hexdigest() != sha256:
-            current_app.logger.warning("Supplied hash does not match calculated hash")
-            return False, "Supplied hash does not match calculated hash."
-        if self.cyptosign_validate.verify(digest, b64decode(sig_match.group(1))):
-            current_app.logger.info("Signature and payload match")
-            return True, "Signature and payload match."
-        current_app.logger.warning("Signature and payload do not match")
-        return False, "Signature and payload do not match."
-
-    def _create_validator(self):
-        current_app.logger.info("Create validator")
-        key_data = open(current_app.config['PUBLIC_KEY'], 'rb').read()
-        rsakey = RSA.importKey(key_data, current_app.config['PUBLIC_PASSPHRASE'])
-        signer = PKCS1_v1_5.new(rsakey)
-        return signer
+        cache_key = _cache_key(payload, signature, payload_hash)
+        if self._cached(cache_key):
+            current_app.logger.info("Signature previously verified")
+            return True, MATCH_MESSAGE
+        valid, message = check_signature(self._verifier(), payload, signature, payload_hash)
+        if valid:
+            current_app.logger.info(message)
+            self._remember(cache_key)
+        else:
+            current_app.logger.warning(message)
+        return valid, message
+
+    def validate_signatures(self, signed_payloads):
+        """Checks a list of (payload, signature, payload_hash) tuples, returning (valid, message) for each.
+
+        Large lists are split across a pool of SIGNATURE_WORKERS processes.
+        """
+        current_app.logger.info("Validate %d signatures", len(signed_payloads))
+        results = [None] * len(signed_payloads)
+        cache_keys = [_cache_key(*signed_payload) for signed_payload in signed_payloads]
+        unverified = []
+        for index, cache_key in enumerate(cache_keys):
+            if self._cached(cache_key):
+                results[index] = (True, MATCH_MESSAGE)
+            else:
+                unverified.append(index)
+        current_app.logger.info("%d signatures previously verified", len(signed_payloads) - len(unverified))
+
+        unverified_payloads = [signed_payloads[index] for index in unverified]
+        for index, result in zip(unverified, self._check_signatures(unverified_payloads)):
+            results[index] = result
+            if result[0]:
+                self._remember(cache_keys[index])
+        return results
+
+    def _check_signatures(self, signed_payloads):
+        workers = current_app.config['SIGNATURE_WORKERS']
+        if workers <= 1 or len(signed_payloads) < SIGNATURE_POOL_THRESHOLD:
+            verifier = self._verifier()
+            return [check_signature(verifier, *signed_payload) for signed_payload in signed_payloads]
+
+        # A few chunks per worker evens out the load without paying to send each payload separately
+        key_path = current_app.config['PUBLIC_KEY']
+        passphrase = current_app.config['PUBLIC_PASSPHRASE']
+        chunk_size = -(-len(signed_payloads) // (workers * 4))
+        chunks = [signed_payloads[index:index + chunk_size] for index in range(0, len(signed_payloads), chunk_size)]
+        pool = self._pool(workers)
+        try:
+            return _map_chunks(pool, key_path, passphrase, chunks)
+        except BrokenProcessPool:
+            # A worker process died, and a broken pool fails every batch sent to it, so it's replaced
+            current_app.logger.warning("Signature worker pool is broken, rebuilding it")
+            return _map_chunks(self._pool(workers, broken=pool), key_path, passphrase, chunks)
+
+    def _verifier(self):
+        # Only needed when init_app hasn't been called
+        with self._lock:
+            if self.cyptosign_validate is None:
+                current_app.logger.info("Create validator")
+                self.cyptosign_validate = _load_verifier(current_app.config['PUBLIC_KEY'],
+                                                         current_app.config['PUBLIC_PASSPHRASE'])
+            return self.cyptosign_validate
+
+    def _cached(self, cache_key):
+        return self.signature_cache is not None and self.signature_cache.get(cache_key) is not None
+
+    def _remember(self, cache_key):
+        if self.signature_cache is not None:
+            self.signature_cache.put(cache_key, True)
+
+    def _pool(self, workers, broken=None):
+        # Replaces the pool after a fork, or if it's the broken one (unless another thread already has)
+        with self._lock:
+            if self._pool_pid != os.getpid() or self._process_pool is broken:
+                if broken is not None:
+                    broken.shutdown(wait=False)
+                self._process_pool = ProcessPoolExecutor(max_workers=workers)
+                self._pool_pid = os.getpid()
+            return self._process_pool
+
+
+def _map_chunks(pool, key_path, passphrase, chunks):
+    results = []
+    for chunk_results in pool.map(_check_signatures, repeat(key_path), repeat(passphrase), chunks):
+        results.extend(chunk_results)
+    return results
+
+
+def _cache_key(payload, signature, payload_hash=None):
+    # The digest is calculated, so a cached signature can't be reused for a different payload
+    return SHA256.new(payload.encode('UTF-8')).hexdigest(), signature, payload_hash
+
+
+def _load_verifier(key_path, passphrase):
+    # Given a private key, the result can sign as well as verify
+    with open(key_path, 'rb') as key_file:
+        rsakey = RSA.importKey(key_file.read(), passphrase)
+    return PKCS1_v1_5.new(rsakey)
+
+
+def check_signature(verifier, payload, signature, payload_hash=None):
+    # No logging or app context needed, so this can run in a worker process
+    sha256 = None
+    if payload_hash:
+        hash_match = re.search('sha-256:(.+)', payload_hash)
+        if not hash_match:
+            return False, "Invalid hash string '{0}'.".format(payload_hash)
+        sha256 = hash_match.group(1)
+    sig_match = re.search('rs256:(.+)', signature)
+    if not sig_match:
+        return False, "Invalid signature string '{0}'.".format(signature)
+    digest = SHA256.new()
+    digest.update(payload.encode('UTF-8'))
+    if sha256 and digest.hexdigest() != sha256:
+        return False, "Supplied hash does not match calculated hash."
+    if verifier.verify(digest, b64decode(sig_match.group(1))):
+        return True, MATCH_MESSAGE
+    return False, "Signature and payload do not match."
+
+
+def _check_signatures(key_path, passphrase, signed_payloads):
+    # Runs in the worker processes, each of which loads the key once
+    if (key_path, passphrase) not in _verifiers:
+        _verifiers[(key_path, passphrase)] = _load_verifier(key_path, passphrase)
+    verifier = _verifiers[(key_path, passphrase)]
+    return [check_signature(verifier, payload, signature, payload_hash)
+            for payload, signature, payload_hash in signed_payloads]
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while a circuit breaker is open."""
+
+
+class CircuitBreaker(object):
+    """Stops calls to a failing dependency for reset_timeout seconds after failure_threshold consecutive failures.
+
+    Once the timeout has passed a single trial call is let through, and the circuit closes again if it succeeds.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial = True
+                return
+            raise CircuitOpenError("Circuit breaker for {} is open".format(self.name))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class PooledSession(object):
+    """A requests session shared by every thread in the process, keeping up to pool_size connections alive per host.
+
+    A new session is made after a fork, since the parent's connections can't be shared with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def get(self, pool_size):
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
@@ -1,8 +1,15 @@
 import logging
+import os
 import requests
+import socket
+import threading
+import time
 import uuid
+from contextlib import contextmanager
 
 from kombu import Connection, Exchange, Producer, Queue
+from kombu.compression import compress
+from kombu.serialization import dumps
 
 logger = logging.getLogger("gadget_api")
 
@@ -10,6 +17,55 @@ logger = logging.getLogger("gadget_api")
 DEFAULT_PORT = 5672
 DEFAULT_VHOST = '/'
 BROKER_URL_TEMPLATE = 'amqp://{userid}:{password}@{hostname}:{port}/{virtual_host}'
+DEFAULT_POOL_LIMIT = 10
+DEFAULT_COMPRESS_MIN_SIZE = 4096
+
+
+class CompressionStats(object):
+
+    """Thread-safe running totals for the messages Emitters have compressed.
+
+    `stats()` gives the number of messages compressed and left alone,
+    the bytes before and after compression, the overall ratio and the
+    time spent compressing.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def record(self, size, compressed_size=None, seconds=0.0):
+        with self._lock:
+            if compressed_size is None:
+                self._uncompressed += 1
+                return
+            self._compressed += 1
+            self._bytes_in += size
+            self._bytes_out += compressed_size
+            self._seconds += seconds
+
+    def clear(self):
+        with self._lock:
+            self._compressed = 0
+            self._uncompressed = 0
+            self._bytes_in = 0
+            self._bytes_out = 0
+            self._seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "compressed": self._compressed,
+                "uncompressed": self._uncompressed,
+                "bytes-in": self._bytes_in,
+                "bytes-out": self._bytes_out,
+                "ratio": self._bytes_out / self._bytes_in if self._bytes_in else None,
+                "seconds": self._seconds
+            }
+
+
+compression_stats = CompressionStats()
 
 
 def broker_url(hostname, userid, password, port=DEFAULT_PORT, virtual_host=DEFAULT_VHOST): # pragma: no cover
@@ -142,6 +198,8 @@ class Emitter(object):  # pragma: no cover
     SEND_INTERVAL_STEP = 1   # Increase time between send retries by this amount.
     SEND_INTERVAL_MAX = 1    # Maximum time between send retries.
 
+    CONFIRM_TIMEOUT = 30     # Seconds to wait for the broker to confirm a batch of messages.
+
     def __init__(self, url, exchange_name, routing_key, queue_name=None, exchange_type='direct'):
         logger.debug('Initialising {}'.format(self.__class__.__name__))
         self.url = url
@@ -151,6 +209,11 @@ class Emitter(object):  # pragma: no cover
         self.exchange_type = exchange_type
         self._connection = None
         self._producer = None
+        self._pid = os.getpid()
+        self._confirm_channel = None
+        self._delivery_tag = 0
+        self._unconfirmed = {}
+        self._nacked = {}
 
     def conn_errback(self, ex, interval):
         """Callback called upon connection error."""
@@ -203,8 +266,13 @@ class Emitter(object):  # pragma: no cover
 
     def release(self):
         """Disconnect/release."""
-        self._producer.release()
-        self._connection.release()
+        self._confirm_channel = None
+        if self._producer is not None:
+            self._producer.release()
+            self._producer = None
+        if self._connection is not None:
+            self._connection.release()
+            self._connection = None
 
     def __enter__(self):
         """Context manager entry: connect to the broker."""
@@ -215,7 +283,8 @@ class Emitter(object):  # pragma: no cover
         """Context manager exit: disconnect/release."""
         self.release()
 
-    def send_message(self, message, serializer='json', headers=None):
+    def send_message(self, message, serializer='json', headers=None, routing_key=None, compression=None,
+                     compress_min_size=DEFAULT_COMPRESS_MIN_SIZE):
         """Send a message with retries (and connect to broker if necessary).
 
         In case of errors, this will retry sending several times
@@ -228,6 +297,15 @@ class Emitter(object):  # pragma: no cover
         You can use the headers argument to pass in any custom headers. It
         is a dictionary {"a-custom-header": "a-custom-value"}.
 
+        The routing_key argument overrides the routing key the emitter was
+        created with, for this message only.
+
+        If `compression` names a kombu compression method (e.g. 'gzip' or
+        'bzip2') messages of at least `compress_min_size` bytes, once
+        serialized, are compressed.  The method is sent in the
+        `compression` header, which kombu consumers use to decompress the
+        body before decoding it, so they need no changes.
+
         """
 
         logger.debug("Sending message...")
@@ -247,13 +325,251 @@ class Emitter(object):  # pragma: no cover
             interval_step=self.SEND_INTERVAL_STEP,
             interval_max=interval_max)
 
-        publish(message, serializer=serializer, headers=headers)
+        if compression:
+            body, content_type, content_encoding, headers = self._compress(
+                message, serializer, None, headers, compression, compress_min_size)
+            publish(body, serializer=None, headers=headers, routing_key=routing_key or self.routing_key,
+                    content_type=content_type, content_encoding=content_encoding)
+        else:
+            publish(message, serializer=serializer, headers=headers, routing_key=routing_key or self.routing_key)
+        if self._producer.channel is self._confirm_channel:
+            # Keep count of delivery tags in case this channel is later used for a batch.
+            self._delivery_tag += 1
+
+    def send_messages(self, messages, serializer='json', headers=None, content_type=None, compression=None,
+                      compress_min_size=DEFAULT_COMPRESS_MIN_SIZE):
+        """Send a batch of messages on one channel and wait for confirms once.
+
+        `messages` is a list of (message, routing_key) pairs; a routing
+        key of None uses the emitter's own.  The channel is put into
+        publisher confirm mode and all of the messages are published
+        before waiting (up to `CONFIRM_TIMEOUT` seconds) for the broker
+        to confirm them, rather than making a round trip per message.
+
+        Nothing is retried.  Instead a list with one result per message
+        is returned: None if the broker confirmed it, otherwise the
+        exception explaining why it may not have been delivered.  A
+        message the broker nacks fails on its own, without affecting the
+        rest of the batch.  After a connection error the emitter
+        disconnects, so the next send reconnects.
+
+        If `content_type` is given the messages are taken to be already
+        serialized as that type, in UTF-8, and are sent as they are.
+
+        Large messages are compressed as for `send_message()`.
+
+        """
+
+        logger.debug("Sending {} messages...".format(len(messages)))
+
+        if self._producer is None:
+            self.connect()
+
+        channel = self._producer.channel
+        if channel is not self._confirm_channel:
+            channel.confirm_select()
+            channel.events['basic_ack'].add(self._confirm_ack)
+            channel.events['basic_nack'].add(self._confirm_nack)
+            self._confirm_channel = channel
+            self._delivery_tag = 0
+
+        results = [None] * len(messages)
+        self._unconfirmed = {}
+        self._nacked = {}
+        sent = 0
+        try:
+            for message, routing_key in messages:
+                if compression:
+                    body, body_type, body_encoding, body_headers = self._compress(
+                        message, serializer, content_type, headers, compression, compress_min_size)
+                    self._producer.publish(body, serializer=None, headers=body_headers,
+                                           routing_key=routing_key or self.routing_key, content_type=body_type,
+                                           content_encoding=body_encoding)
+                else:
+                    self._producer.publish(message, serializer=serializer, headers=headers,
+                                           routing_key=routing_key or self.routing_key, content_type=content_type,
+                                           content_encoding='utf-8' if content_type else None)
+                self._delivery_tag += 1
+                self._unconfirmed[self._delivery_tag] = sent
+                sent += 1
+
+            deadline = time.time() + self.CONFIRM_TIMEOUT
+            while self._unconfirmed and time.time() < deadline:
+                try:
+                    self._connection.drain_events(timeout=deadline - time.time())
+                except socket.timeout:
+                    break
+        except Exception as ex:
+            self.send_errback(ex, 0)
+            for index in range(sent, len(messages)):
+                results[index] = ex
+            for index in self._unconfirmed.values():
+                results[index] = ex
+            results = self._with_nacks(results)
+            self.release()
+            return results
+
+        for index in self._unconfirmed.values():
+            results[index] = IOError("Message was not confirmed by the broker within {} seconds".format(
+                self.CONFIRM_TIMEOUT))
+        return self._with_nacks(results)
+
+    def _with_nacks(self, results):
+        # Messages the broker rejected failed whatever happened to the rest of the batch
+        for index, ex in self._nacked.items():
+            results[index] = ex
+        self._unconfirmed = {}
+        self._nacked = {}
+        return results
+
+    @staticmethod
+    def _compress(message, serializer, content_type, headers, compression, compress_min_size):
+        """Serialize a message (unless content_type says it already is) and compress it if it's big enough.
+
+        Returns the body, content type, content encoding and headers to publish it with.
+        """
+        if content_type is None:
+            content_type, content_encoding, body = dumps(message, serializer=serializer)
+        else:
+            content_encoding, body = 'utf-8', message
+        if isinstance(body, str):
+            body = body.encode(content_encoding)
+        if len(body) < compress_min_size:
+            compression_stats.record(len(body))
+            return body, content_type, content_encoding, headers
+
+        started = time.perf_counter()
+        compressed, compression_type = compress(body, compression)
+        compression_stats.record(len(body), len(compressed), time.perf_counter() - started)
+        headers = dict(headers or {}, compression=compression_type)
+        return compressed, content_type, content_encoding, headers
+
+    def _confirmed_tags(self, delivery_tag, multiple):
+        if multiple:
+            return [tag for tag in self._unconfirmed if tag <= delivery_tag]
+        return [delivery_tag] if delivery_tag in self._unconfirmed else []
+
+    def _confirm_ack(self, delivery_tag, multiple):
+        """Callback called when the broker confirms one (or, if multiple, all up to delivery_tag) messages."""
+        for tag in self._confirmed_tags(delivery_tag, multiple):
+            del self._unconfirmed[tag]
+
+    def _confirm_nack(self, delivery_tag, multiple):
+        """Callback called when the broker rejects one (or, if multiple, all up to delivery_tag) messages."""
+        for tag in self._confirmed_tags(delivery_tag, multiple):
+            self._nacked[self._unconfirmed.pop(tag)] = IOError("Message was rejected by the broker")
+
+
+class EmitterPool(object):
+
+    """Process-wide pool of long-lived Emitters.
+
+    Idle emitters are kept per broker URL, exchange and queue, so their
+    connection and channel are reused by the next message instead of
+    being set up and torn down each time.  An emitter is only ever used
+    by the thread that checked it out, and at most `limit` idle emitters
+    are kept for each key.
+
+    If sending fails (after the emitter's own retries) the emitter is
+    thrown away rather than returned, so the next message starts with a
+    fresh connection.  After a fork the child drops any emitters
+    inherited from its parent without closing them, as the sockets
+    still belong to the parent.
+
+    Use the `emitter()` context manager to check one out::
+
+        with pool.emitter(url, 'ex_name', 'key') as emitter:
+            emitter.send_message({'status': 'success'})
+
+    """
 
+    def __init__(self, limit=DEFAULT_POOL_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = {}
+
+    def _check_pid(self):
+        # Must be called with the lock held
+        if self._pid != os.getpid():
+            logger.debug('Fork detected, discarding inherited emitters')
+            self._idle = {}
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _key(emitter):
+        return emitter.url, emitter.exchange_name, emitter.exchange_type, emitter.queue_name
+
+    def acquire(self, url, exchange_name, routing_key, queue_name=None, exchange_type='direct'):
+        """Check out an idle emitter, or create a new (unconnected) one."""
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.get((url, exchange_name, exchange_type, queue_name))
+            if idle:
+                return idle.pop()
+        return Emitter(url, exchange_name, routing_key, queue_name, exchange_type=exchange_type)
+
+    def release(self, emitter):
+        """Return a healthy emitter to the pool."""
+        with self._lock:
+            self._check_pid()
+            if emitter._pid != self._pid:
+                return
+            idle = self._idle.setdefault(self._key(emitter), [])
+            if len(idle) < self.limit:
+                idle.append(emitter)
+                return
+        emitter.release()
+
+    def discard(self, emitter):
+        """Disconnect an emitter that failed, rather than returning it to the pool."""
+        if emitter._pid != os.getpid():
+            return
+        try:
+            emitter.release()
+        except Exception as ex:
+            logger.info('Error releasing emitter: {} - {}'.format(ex.__class__.__name__, str(ex)))
+
+    def clear(self):
+        """Disconnect all idle emitters."""
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, {}
+        for emitters in idle.values():
+            for emitter in emitters:
+                self.discard(emitter)
+
+    @contextmanager
+    def emitter(self, url, exchange_name, routing_key, queue_name=None, exchange_type='direct'):
+        emitter = self.acquire(url, exchange_name, routing_key, queue_name, exchange_type=exchange_type)
+        try:
+            yield emitter
+        except Exception:
+            self.discard(emitter)
+            raise
+        self.release(emitter)
 
-def publish_message(message, rabbit_url, exchange_name, routing_key, queue_name=None, exchange_type='direct', serializer="json", headers=None):  # pragma: no cover
-    """Convenience wrapper for sending a single message."""
-    with Emitter(rabbit_url, exchange_name, routing_key, queue_name, exchange_type=exchange_type) as emitter:
-        emitter.send_message(message, serializer, headers=headers)
+
+emitter_pool = EmitterPool()
+
+
+def publish_message(message, rabbit_url, exchange_name, routing_key, queue_name=None, exchange_type='direct', serializer="json", headers=None, compression=None, compress_min_size=DEFAULT_COMPRESS_MIN_SIZE):  # pragma: no cover
+    """Convenience wrapper for sending a single message over a pooled connection."""
+    with emitter_pool.emitter(rabbit_url, exchange_name, routing_key, queue_name,
+                              exchange_type=exchange_type) as emitter:
+        emitter.send_message(message, serializer, headers=headers, routing_key=routing_key,
+                             compression=compression, compress_min_size=compress_min_size)
+
+
+def publish_messages(messages, rabbit_url, exchange_name, routing_key, queue_name=None, exchange_type='direct', serializer="json", headers=None, content_type=None, compression=None, compress_min_size=DEFAULT_COMPRESS_MIN_SIZE):  # pragma: no cover
+    """Convenience wrapper for sending a confirmed batch of (message, routing_key) pairs over a pooled connection.
+
+    Returns a list with one result per message: None if it was confirmed, otherwise the error.
+    """
+    with emitter_pool.emitter(rabbit_url, exchange_name, routing_key, queue_name,
+                              exchange_type=exchange_type) as emitter:
+        return emitter.send_messages(messages, serializer, headers=headers, content_type=content_type,
+                                     compression=compression, compress_min_size=compress_min_size)
 
 
 def get_queue_count(rabbit_url, queue_name):  # pragma: no cover
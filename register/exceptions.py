@@ -1,5 +1,5 @@
 from flask import Response, current_app
-import json
+from register.utilities.json_backend import dumps
 
 
 class ApplicationError(Exception):
@@ -9,24 +9,26 @@ class ApplicationError(Exception):
     The handler method will then create the response body in a standard structure so clients
     will always know what to parse.
     """
-    def __init__(self, message, code, http_code=500):
+    def __init__(self, message, code, http_code=500, headers=None):
         Exception.__init__(self)
         self.message = message
         self.http_code = http_code
         self.code = code
+        self.headers = headers
 
 
 def unhandled_exception(e):
     current_app.logger.exception('Unhandled Exception: %s', repr(e))
-    return Response(response=json.dumps({"error_message": "Unexpected error.", "error_code": "XXX"}),
+    return Response(response=dumps({"error_message": "Unexpected error.", "error_code": "XXX"}),
                     status=500,
                     mimetype='application/json')
 
 
 def application_error(e):
     current_app.logger.error(e.message)
-    return Response(response=json.dumps({"error_message": e.message, "error_code": e.code}),
+    return Response(response=dumps({"error_message": e.message, "error_code": e.code}),
                     status=e.http_code,
+                    headers=e.headers,
                     mimetype='application/json')
 
 
@@ -1,8 +1,8 @@
 from flask_logconfig import LogConfig
 from flask_sqlalchemy import SQLAlchemy
 from register.cryptography import CryptographicSigning
+from register.utilities.json_backend import dumps
 import logging
-import json
 import traceback
 from flask import g, ctx, request
 import collections
@@ -37,10 +37,10 @@ class ContextualFilter(logging.Filter):
     def filter(self, log_record):
         """Provide some extra variables to be placed into the log message"""
 
-        # If we have an app context (because we're servicing an http request) then get the trace id we have
-        # set in g (see app.py)
-        if ctx.has_app_context():
-            log_record.trace_id = g.trace_id
+        # If we have a request context (because we're servicing an http request) then get the trace id we have
+        # set in g (see app.py). Background threads have an app context but no request.
+        if ctx.has_request_context():
+            log_record.trace_id = getattr(g, 'trace_id', 'N/A')
             log_record.msg = "Endpoint: {}, Method: {}, Caller: {}.{}[{}], {}".format(
                 request.endpoint, request.method, log_record.module, log_record.funcName, log_record.lineno,
                 log_record.msg)
@@ -64,7 +64,7 @@ class JsonFormatter(logging.Formatter):
              ('message', record.msg % record.args),
              ('exception', exc)])
 
-        return json.dumps(log_entry)
+        return dumps(log_entry)
 
 
 class JsonAuditFormatter(logging.Formatter):
@@ -76,4 +76,4 @@ class JsonAuditFormatter(logging.Formatter):
              ('traceid', record.trace_id),
              ('message', record.msg % record.args)])
 
-        return json.dumps(log_entry)
+        return dumps(log_entry)
@@ -0,0 +1,95 @@
+from flask import Response, request
+from functools import wraps
+from register.app import app
+from register.exceptions import ApplicationError
+from register.utilities.data.connection import start, commit
+from register.utilities.data.idempotency import read_stored_response, store_response
+import hashlib
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+READ_SIZE = 65536
+
+
+def idempotency_key():
+    return request.headers.get(IDEMPOTENCY_HEADER)
+
+
+def body_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def stream_hash(stream):
+    return HashingStream(stream).hexdigest()
+
+
+class HashingStream(object):
+    """Wraps a request stream, hashing the body as it is read so streamed ingest needn't buffer it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.digest.update(line)
+            yield line
+
+    def hexdigest(self):
+        # Anything the parser left unread (trailing whitespace, say) is still part of the body
+        for data in iter(lambda: self.read(READ_SIZE), b''):
+            pass
+        return self.digest.hexdigest()
+
+
+def stored_response(key):
+    cursor = start()
+    try:
+        return read_stored_response(cursor, key, app.config['IDEMPOTENCY_TTL'])
+    finally:
+        commit(cursor)
+
+
+def replays_stored_responses(f):
+    # Answers a retried write from its stored response before anything else, admission control included, so a retry
+    # of a write that committed gets the original response however busy the register is
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = idempotency_key()
+        if key is not None:
+            row = stored_response(key)
+            if row is not None:
+                return replay(row, stream_hash(request.stream))
+        return f(*args, **kwargs)
+    return decorated
+
+
+def replay(row, request_hash):
+    # The response to the request first made with this key, which must have had the same body
+    key = idempotency_key()
+    if row['request_hash'] != request_hash:
+        app.logger.warning("Idempotency key '%s' reused for a different request", key)
+        raise ApplicationError("Idempotency-Key has already been used for a different request", "E422", 422)
+    app.logger.info("Replay response for idempotency key '%s'", key)
+    headers = row['response_headers'] or {}
+    headers['Idempotent-Replayed'] = 'true'
+    return Response(row['response_body'], status=row['response_status'], headers=headers,
+                    mimetype='application/json')
+
+
+def remember_response(key, request_hash, status, render):
+    """Returns a before_commit callback that stores the response render(result) gives as (body, headers)."""
+    def before_commit(cursor, result):
+        body, headers = render(result)
+        store_response(cursor, key, request_hash, status, headers, body, app.config['IDEMPOTENCY_TTL'])
+    return before_commit
+
+
+def replay_after_conflict(key, request_hash):
+    # For when storing the response failed because a concurrent request with the same key got there first
+    row = stored_response(key)
+    return replay(row, request_hash) if row is not None else None
@@ -4,10 +4,16 @@ from register.app import app
 from register.extensions import register_extensions
 from register.blueprints import register_blueprints
 from register.exceptions import register_exception_handlers
+from register.utilities.outbox import outbox_dispatcher
+from register.utilities.jobs import job_worker
 
 # Now we register any extensions we use into the app
 register_extensions(app)
 # Register the exception handlers
 register_exception_handlers(app)
+# Start draining the outbox and processing ingest jobs when the first request arrives, so that each forked worker
+# starts its own background threads.
+app.before_first_request(outbox_dispatcher.start)
+app.before_first_request(job_worker.start)
 # Finally we register our blueprints to get our routes up and running.
 register_blueprints(app)
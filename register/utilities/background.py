@@ -0,0 +1,51 @@
+import os
+import threading
+from register.app import app
+
+
+class BackgroundWorker(object):
+    """Daemon thread which repeatedly calls work() inside an app context.
+
+    The thread wakes when notify() is called, or every poll_interval seconds regardless, and keeps calling work()
+    until it returns False. It is started lazily so that each forked web worker gets its own thread.
+    """
+
+    def __init__(self, name, poll_interval_setting, enabled_setting):
+        self.name = name
+        self.poll_interval_setting = poll_interval_setting
+        self.enabled_setting = enabled_setting
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def work(self):
+        """Do one unit of work and return True if there may be more to do."""
+        raise NotImplementedError
+
+    def start(self):
+        if not app.config[self.enabled_setting]:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            app.logger.info("Starting %s", self.name)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(float(app.config[self.poll_interval_setting]))
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    while self.work():
+                        pass
+            except Exception as e:
+                app.logger.exception("Error in %s: %s", self.name, repr(e))
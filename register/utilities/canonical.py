@@ -0,0 +1,44 @@
+import json
+from register.utilities.json_backend import dumps
+
+
+class CanonicalItem(dict):
+    """An item that encodes itself to canonical JSON at most once.
+
+    Wrapping an item in this class when it arrives lets signature checks, hashing, storage and outbox messages share
+    one encoding rather than each dumping the item again. The item must not be changed once wrapped.
+    """
+    __slots__ = ('_json',)
+
+    def canonical_json(self):
+        if not hasattr(self, '_json'):
+            self._json = _encode(self)
+        return self._json
+
+
+def _encode(item):
+    # The form that items are signed in: sorted keys, no whitespace, ASCII
+    return json.dumps(item, sort_keys=True, separators=(',', ':'))
+
+
+def canonical_json(item):
+    if isinstance(item, CanonicalItem):
+        return item.canonical_json()
+    return _encode(item)
+
+
+def canonical_records(record_list):
+    # Wraps the item of each record in place. Records without an object item are left for validation to reject.
+    for record in record_list:
+        if isinstance(record, dict) and isinstance(record.get('item'), dict) and \
+                not isinstance(record['item'], CanonicalItem):
+            record['item'] = CanonicalItem(record['item'])
+    return record_list
+
+
+def message_json(message):
+    # Encodes a message, splicing in the item's canonical JSON instead of encoding the item again
+    if 'item' not in message:
+        return dumps(message)
+    rest = dumps({key: value for key, value in message.items() if key != 'item'})
+    return rest[:-1] + (',' if len(rest) > 2 else '') + '"item":' + canonical_json(message['item']) + '}'
@@ -0,0 +1,12 @@
+# Maximum number of rows written by a single multi-row INSERT
+BULK_STATEMENT_ROWS = 500
+
+
+def chunks(rows, size=BULK_STATEMENT_ROWS):
+    for index in range(0, len(rows), size):
+        yield rows[index:index + size]
+
+
+def multi_row_values(cursor, template, rows):
+    # psycopg2 2.6 has no execute_values, so build the VALUES list from individually mogrified rows
+    return ','.join(cursor.mogrify(template, row).decode() for row in rows)
@@ -0,0 +1,29 @@
+import json
+from register.app import app
+from register.utilities.data.bulk import chunks, multi_row_values
+
+# Message fields holding the diff from the previous version of the record, in either ITEM_CHANGES_FORMAT
+CHANGE_FIELDS = ('item-changes', 'item-patch')
+
+
+def _change_row(entry_number, previous_entry_number, message):
+    changes = {field: message[field] for field in CHANGE_FIELDS if field in message}
+    return (entry_number, message['action-type'], previous_entry_number,
+            json.dumps(changes) if len(changes) > 0 else None)
+
+
+def store_entry_change(cursor, entry_number, previous_entry_number, message):
+    # Written with the entry, so republishing and record history don't have to work the change out again
+    app.audit_logger.info("Insert change for entry %s", str(entry_number))
+    cursor.execute('INSERT INTO entry_change (entry_number, action_type, previous_entry_number, changes) '
+                   'VALUES (%s, %s, %s, %s)', _change_row(entry_number, previous_entry_number, message))
+
+
+def store_entry_changes(cursor, changes):
+    # changes is a list of (entry number, previous entry number, message) tuples
+    app.audit_logger.info("Insert %d entry changes", len(changes))
+    rows = [_change_row(*change) for change in changes]
+    for chunk in chunks(rows):
+        cursor.execute('INSERT INTO entry_change '
+                       '(entry_number, action_type, previous_entry_number, changes) '
+                       'VALUES ' + multi_row_values(cursor, '(%s, %s, %s, %s)', chunk))
@@ -0,0 +1,39 @@
+import json
+from register.app import app
+
+
+def read_stored_response(cursor, key, ttl):
+    # A primary key lookup; rows older than ttl seconds are ignored and eventually purged
+    cursor.execute('SELECT request_hash, response_status, response_headers, response_body FROM idempotency_key '
+                   'WHERE idempotency_key = %(key)s AND created > now() - %(ttl)s * interval \'1 second\'', {
+                       'key': key,
+                       'ttl': ttl
+                   })
+    return cursor.fetchone()
+
+
+def store_response(cursor, key, request_hash, status, headers, body, ttl):
+    # Stored in the same transaction as the entries, so a retry sees either both or neither. A concurrent request
+    # with the same key blocks on the insert until this transaction ends, then fails with a unique violation.
+    app.audit_logger.info("Store response for idempotency key '%s'", key)
+    cursor.execute('DELETE FROM idempotency_key '
+                   'WHERE idempotency_key = %(key)s AND created <= now() - %(ttl)s * interval \'1 second\'', {
+                       'key': key,
+                       'ttl': ttl
+                   })
+    cursor.execute('INSERT INTO idempotency_key '
+                   '(idempotency_key, request_hash, response_status, response_headers, response_body) '
+                   'VALUES (%(key)s, %(hash)s, %(status)s, %(headers)s, %(body)s)', {
+                       'key': key,
+                       'hash': request_hash,
+                       'status': status,
+                       'headers': json.dumps(headers) if headers else None,
+                       'body': body
+                   })
+
+
+def purge_stored_responses(cursor, ttl):
+    cursor.execute('DELETE FROM idempotency_key WHERE created <= now() - %(ttl)s * interval \'1 second\'',
+                   {'ttl': ttl})
+    app.audit_logger.info("Purged %d expired idempotency keys", cursor.rowcount)
+    return cursor.rowcount
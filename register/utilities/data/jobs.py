@@ -0,0 +1,88 @@
+import json
+from register.app import app
+from register.utilities.data.bulk import chunks, multi_row_values
+
+
+def create_job(cursor, job_id, item_list):
+    app.audit_logger.info("Create ingest job '%s' for %d items", job_id, len(item_list))
+    cursor.execute("INSERT INTO ingest_job "
+                   "(job_id, status, item_count, items) "
+                   "VALUES (%(job_id)s, 'PENDING', %(count)s, %(items)s)", {
+                       'job_id': job_id,
+                       'count': len(item_list),
+                       'items': json.dumps(item_list)
+                   })
+
+
+def claim_job(cursor, stale_after):
+    # Takes the oldest pending job, or a running job that hasn't made progress for stale_after seconds (its worker
+    # having died). Progress is committed with each chunk of entries, so a reclaimed job carries on where it stopped.
+    cursor.execute("UPDATE ingest_job SET status = 'RUNNING', updated = now() "
+                   "WHERE job_id = ( "
+                   "  SELECT job_id FROM ingest_job "
+                   "  WHERE status = 'PENDING' "
+                   "  OR (status = 'RUNNING' AND updated < now() - %(stale_after)s * interval '1 second') "
+                   "  ORDER BY created LIMIT 1 FOR UPDATE "
+                   ") "
+                   "RETURNING job_id, processed_count, items", {'stale_after': stale_after})
+    return cursor.fetchone()
+
+
+def lock_job_progress(cursor, job_id):
+    # Returns the job's processed count, locking its row for the rest of the transaction, so two workers holding the
+    # same job (one having reclaimed it as stale) can't both append the same chunk
+    cursor.execute('SELECT processed_count FROM ingest_job WHERE job_id = %(job_id)s FOR UPDATE', {'job_id': job_id})
+    return cursor.fetchone()['processed_count']
+
+
+def store_job_entries(cursor, job_id, first_index, results):
+    rows = [(job_id, first_index + offset, result['item-hash'], result['entry-number'])
+            for offset, result in enumerate(results)]
+    for chunk in chunks(rows):
+        cursor.execute('INSERT INTO ingest_job_entry '
+                       '(job_id, item_index, item_hash, entry_number) '
+                       'VALUES ' + multi_row_values(cursor, '(%s, %s, %s, %s)', chunk))
+    cursor.execute('UPDATE ingest_job SET processed_count = processed_count + %(count)s, updated = now() '
+                   'WHERE job_id = %(job_id)s', {'job_id': job_id, 'count': len(results)})
+
+
+def touch_job(cursor, job_id):
+    # Shows the job is still being worked on, so it isn't reclaimed as stale
+    cursor.execute('UPDATE ingest_job SET updated = now() WHERE job_id = %(job_id)s', {'job_id': job_id})
+
+
+def finish_job(cursor, job_id, status, errors=None):
+    app.audit_logger.info("Ingest job '%s' finished with status %s", job_id, status)
+    # The items are no longer needed once the job has finished
+    cursor.execute('UPDATE ingest_job SET status = %(status)s, errors = %(errors)s, items = NULL, updated = now() '
+                   'WHERE job_id = %(job_id)s', {
+                       'job_id': job_id,
+                       'status': status,
+                       'errors': json.dumps(errors) if errors is not None else None
+                   })
+
+
+def read_job(cursor, job_id):
+    app.logger.info("Read ingest job '%s'", job_id)
+    cursor.execute('SELECT job_id, status, created, updated, item_count, processed_count, errors '
+                   'FROM ingest_job WHERE job_id = %(job_id)s', {'job_id': job_id})
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    cursor.execute('SELECT item_index, item_hash, entry_number FROM ingest_job_entry '
+                   'WHERE job_id = %(job_id)s ORDER BY item_index', {'job_id': job_id})
+    return {
+        "job-id": row['job_id'],
+        "status": row['status'],
+        "created": row['created'].strftime('%Y-%m-%d %H:%M:%S.%f'),
+        "updated": row['updated'].strftime('%Y-%m-%d %H:%M:%S.%f'),
+        "item-count": row['item_count'],
+        "processed-count": row['processed_count'],
+        "entries": [{
+            "index": entry_row['item_index'],
+            "item-hash": entry_row['item_hash'],
+            "entry-number": entry_row['entry_number']
+        } for entry_row in cursor.fetchall()],
+        "errors": row['errors']
+    }
@@ -1,6 +1,10 @@
 from register.app import app
+from register.utilities.data.bulk import chunks, multi_row_values
 from register.utilities.data.empty_entry import create_empty_entry
 from register.utilities.leaf_hash import calculate_leaf_hash
+from register.utilities.data.tree_head import record_tree_head
+from register.utilities.merkle_tree import MerkleTree, frontier_root, frontier_size
+from base64 import b16encode
 
 
 class MerkleData(object):
@@ -63,6 +67,48 @@ class MerkleData(object):
             self._leaf_count = self.cursor.fetchone()['count']
         return self._leaf_count
 
+    def latest_entry_number(self):
+        app.logger.info("Get latest leaf entry number")
+        self.cursor.execute('SELECT COALESCE(MAX(entry_number), 0) AS latest FROM leaf_hashes')
+        return self.cursor.fetchone()['latest']
+
+    def frontier(self):
+        return read_merkle_frontier(self.cursor)
+
+    def leaf_hashes_from(self, first_entry, limit):
+        # (entry number, leaf hash) pairs in entry number order
+        app.logger.info("Read %d leaf hashes from entry %s", limit, str(first_entry))
+        self.cursor.execute('SELECT entry_number, entry_hash FROM leaf_hashes WHERE entry_number >= %(first)s '
+                            'ORDER BY entry_number LIMIT %(limit)s', {'first': first_entry, 'limit': limit})
+        return [(row['entry_number'], row['entry_hash']) for row in self.cursor.fetchall()]
+
+    def save_frontier(self, frontier, extended):
+        changed = [height for height in extended if frontier.get(height) != extended[height]]
+        removed = [height for height in frontier if height not in extended]
+        app.audit_logger.info("Update merkle frontier to %s entries", str(frontier_size(extended)))
+        if changed or removed:
+            self.cursor.execute('DELETE FROM merkle_frontier WHERE height = ANY(%(heights)s)',
+                                {'heights': changed + removed})
+        if changed:
+            rows = [(height, b16encode(extended[height]).decode()) for height in changed]
+            self.cursor.execute('INSERT INTO merkle_frontier (height, branch_hash) '
+                                'VALUES ' + multi_row_values(self.cursor, '(%s, %s)', rows))
+
+    def save_branch_hashes(self, branches):
+        # branches is a list of (0-based start, length, hash string) tuples. Any copy of the same range already
+        # cached by a read is replaced.
+        if len(branches) == 0:
+            return
+        app.audit_logger.info("Insert %d branch hashes", len(branches))
+        rows = [(start + 1, start + length, hash_string) for start, length, hash_string in branches]
+        for chunk in chunks(rows):
+            self.cursor.execute('DELETE FROM branch_hashes WHERE (start_entry_number, end_entry_number) IN '
+                                '(VALUES ' + multi_row_values(self.cursor, '(%s, %s)',
+                                                              [row[:2] for row in chunk]) + ')')
+            self.cursor.execute('INSERT INTO branch_hashes '
+                                '(start_entry_number, end_entry_number, branch_hash) '
+                                'VALUES ' + multi_row_values(self.cursor, '(%s, %s, %s)', chunk))
+
     @staticmethod
     def is_power_of_2(value):
         return value != 0 and ((value & (value - 1)) == 0)
@@ -77,12 +123,65 @@ def store_leaf_hash(cursor, entry_number, leaf_hash):
                    })
 
 
+def store_leaf_hashes(cursor, leaf_hashes):
+    app.audit_logger.info("Insert %d leaf_hashes", len(leaf_hashes))
+    for chunk in chunks(leaf_hashes):
+        cursor.execute('INSERT INTO leaf_hashes '
+                       '(entry_number, entry_hash) VALUES ' + multi_row_values(cursor, '(%s, %s)', chunk))
+
+
+# Perfect subtrees (a power of two leaves, starting at a multiple of that power) are stored when they are completed
+# and never change, so pruning keeps them
+PARTIAL_SUBTREE = ('NOT (((end_entry_number - start_entry_number + 1) & (end_entry_number - start_entry_number)) = 0 '
+                   'AND (start_entry_number - 1) %% (end_entry_number - start_entry_number + 1) = 0)')
+
+
 def prune_merkle_tree(cursor, end_entry):
     # Here we benefit from the tables being entry-number rather than index...
     app.logger.info("Prune merkle tree")
     previous_entry = end_entry - 1
     if not MerkleData.is_power_of_2(previous_entry):
         app.audit_logger.info("Delete from branch hashes ranges up to %s", str(end_entry))
-        cursor.execute('DELETE FROM branch_hashes WHERE end_entry_number=%(number)s', {
+        cursor.execute('DELETE FROM branch_hashes WHERE end_entry_number=%(number)s AND ' + PARTIAL_SUBTREE, {
             'number': previous_entry
         })
+
+
+def prune_merkle_tree_range(cursor, first_entry, last_entry):
+    # Equivalent to calling prune_merkle_tree for each entry in the range, in one statement
+    app.logger.info("Prune merkle tree for entries %s to %s", str(first_entry), str(last_entry))
+    previous_entries = [entry_number - 1 for entry_number in range(first_entry, last_entry + 1)
+                        if not MerkleData.is_power_of_2(entry_number - 1)]
+    if previous_entries:
+        app.audit_logger.info("Delete from branch hashes ranges up to %s", str(last_entry))
+        cursor.execute('DELETE FROM branch_hashes WHERE end_entry_number = ANY(%(numbers)s) AND ' + PARTIAL_SUBTREE, {
+            'numbers': previous_entries
+        })
+
+
+def read_merkle_frontier(cursor):
+    # At most one row per bit of the tree size
+    app.logger.info("Read merkle frontier")
+    cursor.execute('SELECT height, branch_hash FROM merkle_frontier')
+    return {row['height']: bytes.fromhex(row['branch_hash']) for row in cursor.fetchall()}
+
+
+def append_merkle_leaves(cursor, first_entry, leaf_hashes):
+    # Must be called in the append transaction, after lock_appends and store_leaf_hash(es)
+    app.logger.info("Append %d leaves to merkle tree from entry %s", len(leaf_hashes), str(first_entry))
+    tree = MerkleTree(MerkleData(cursor))
+    frontier = tree.append_leaves(first_entry, leaf_hashes)
+    if frontier is None:
+        # Otherwise no later append would match it either. The rebuild fails the append if leaves are missing.
+        app.logger.error("Merkle frontier is not for %s entries; rebuilding it", str(first_entry - 1))
+        tree.rebuild_frontier(first_entry - 1)
+        frontier = tree.append_leaves(first_entry, leaf_hashes)
+    record_tree_head(cursor, frontier_size(frontier), frontier_root(frontier))
+
+
+def rebuild_merkle_frontier(cursor):
+    # Must be called after lock_appends
+    data = MerkleData(cursor)
+    size = data.latest_entry_number()
+    app.audit_logger.info("Rebuild merkle frontier for %s entries", str(size))
+    MerkleTree(data).rebuild_frontier(size)
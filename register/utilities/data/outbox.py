@@ -0,0 +1,48 @@
+from register.app import app
+from register.utilities.canonical import message_json
+from register.utilities.data.bulk import chunks, multi_row_values
+
+# Arbitrary key for the advisory lock that allows only one dispatcher at a time to drain the outbox, which is what
+# keeps messages in entry number order across processes.
+OUTBOX_LOCK_ID = 7301
+
+
+def store_outbox_message(cursor, entry_number, routing_key, message):
+    app.audit_logger.info("Insert outbox message for entry %s", str(entry_number))
+    cursor.execute('INSERT INTO outbox '
+                   '(entry_number, routing_key, message) VALUES (%(number)s, %(routing_key)s, %(message)s)', {
+                       'number': entry_number,
+                       'routing_key': routing_key,
+                       'message': message_json(message)
+                   })
+
+
+def store_outbox_messages(cursor, messages):
+    # messages is a list of (entry number, routing key, message) tuples
+    app.audit_logger.info("Insert %d outbox messages", len(messages))
+    rows = [(entry_number, routing_key, message_json(message)) for entry_number, routing_key, message in messages]
+    for chunk in chunks(rows):
+        cursor.execute('INSERT INTO outbox '
+                       '(entry_number, routing_key, message) '
+                       'VALUES ' + multi_row_values(cursor, '(%s, %s, %s)', chunk))
+
+
+def lock_outbox(cursor):
+    # Held until the end of the transaction; returns False if another dispatcher holds it
+    cursor.execute('SELECT pg_try_advisory_xact_lock(%(lock_id)s) AS locked', {'lock_id': OUTBOX_LOCK_ID})
+    return cursor.fetchone()['locked']
+
+
+def read_outbox_messages(cursor, limit):
+    app.logger.info("Read up to %s outbox messages", str(limit))
+    # The message column is text, so it is published as the bytes written, without decoding and encoding it again
+    cursor.execute('SELECT entry_number, routing_key, message FROM outbox '
+                   'ORDER BY entry_number ASC LIMIT %(limit)s', {'limit': limit})
+    return cursor.fetchall()
+
+
+def delete_outbox_messages(cursor, entry_numbers):
+    if len(entry_numbers) == 0:
+        return
+    app.audit_logger.info("Delete %d outbox messages", len(entry_numbers))
+    cursor.execute('DELETE FROM outbox WHERE entry_number = ANY(%(numbers)s)', {'numbers': entry_numbers})
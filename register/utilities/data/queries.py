@@ -1,14 +1,22 @@
 import json
-import os
 from datetime import datetime
 from register import config
 from register.app import app
-from register.dependencies.rabbitmq import publish_message
+from register.dependencies.rabbitmq import publish_messages
+from register.utilities.canonical import canonical_json
+from register.utilities.data.bulk import chunks, multi_row_values
+from register.utilities.data.changes import store_entry_change, store_entry_changes
 from register.utilities.data.connection import start, commit, rollback
 from register.utilities.data.empty_entry import create_empty_entry
-from register.utilities.data.merkle_data import store_leaf_hash, prune_merkle_tree
-from register.utilities.item_helper import get_action_type, get_item_changes
+from register.utilities.data.outbox import store_outbox_message, store_outbox_messages
+from register.utilities.data.sequencer import lock_appends, next_entry_numbers
+from register.utilities.data.merkle_data import store_leaf_hash, store_leaf_hashes, prune_merkle_tree, \
+    prune_merkle_tree_range, append_merkle_leaves
+from register.utilities.item_helper import get_action_type, add_item_changes, item_changes_field
+from register.utilities.json_backend import KOMBU_SERIALIZER
 from register.utilities.leaf_hash import calculate_leaf_hash
+from register.utilities.outbox import outbox_dispatcher
+from register.utilities.routing import routing_key_for
 
 
 def _insert_to_item_table(cursor, item, item_hash):
@@ -27,34 +35,143 @@ def _insert_to_item_table(cursor, item, item_hash):
                    "(item_hash, item) "
                    "VALUES (%(hash)s, %(item)s)", {
                        "hash": item_hash,
-                       "item": json.dumps(item)
+                       "item": canonical_json(item)
                    })
 
 
-def _insert_to_entry_table(cursor, timestamp, item_hash, item_key, item_signature):
+def _insert_to_entry_table(cursor, entry_number, timestamp, item_hash, item_key, item_signature):
     app.audit_logger.info(
-        "Insert entry with timestamp '%s' and item hash '%s'", timestamp, item_hash)
+        "Insert entry %s with timestamp '%s' and item hash '%s'", str(entry_number), timestamp, item_hash)
     cursor.execute("INSERT INTO entry "
-                   "(entry_timestamp, item_hash, key, item_signature) "
-                   "VALUES (%(timestamp)s, %(hash)s, %(key)s, %(signature)s) "
-                   "RETURNING entry_number", {
+                   "(entry_number, entry_timestamp, item_hash, key, item_signature) "
+                   "VALUES (%(number)s, %(timestamp)s, %(hash)s, %(key)s, %(signature)s)", {
+                       "number": entry_number,
                        "timestamp": timestamp,
                        "hash": item_hash,
                        "key": item_key,
                        "signature": item_signature
                    })
 
-    row = cursor.fetchone()
-    return row['entry_number']
+
+def _insert_to_item_table_bulk(cursor, item_list):
+    item_hashes = []
+    items_by_hash = {}
+    for item in item_list:
+        if item['item-hash'] not in items_by_hash:
+            item_hashes.append(item['item-hash'])
+            items_by_hash[item['item-hash']] = item['item']
+
+    app.audit_logger.info("Consider inserting %d items", len(item_hashes))
+    cursor.execute('SELECT item_hash FROM item WHERE item_hash = ANY(%(hashes)s)', {'hashes': item_hashes})
+    existing_hashes = set(row['item_hash'] for row in cursor.fetchall())
+
+    rows = [(item_hash, canonical_json(items_by_hash[item_hash]))
+            for item_hash in item_hashes if item_hash not in existing_hashes]
+    app.audit_logger.info("Insert %d items (%d already exist)", len(rows), len(existing_hashes))
+    for chunk in chunks(rows):
+        cursor.execute("INSERT INTO item "
+                       "(item_hash, item) "
+                       "VALUES " + multi_row_values(cursor, '(%s, %s)', chunk))
+
+
+def _insert_to_entry_table_bulk(cursor, entries):
+    app.audit_logger.info("Insert entries %s to %s", str(entries[0]['entry-number']),
+                          str(entries[-1]['entry-number']))
+    rows = [(entry['entry-number'], entry['entry-timestamp'], entry['item-hash'], str(entry['key']),
+             entry['item-signature']) for entry in entries]
+    for chunk in chunks(rows):
+        cursor.execute("INSERT INTO entry "
+                       "(entry_number, entry_timestamp, item_hash, key, item_signature) "
+                       "VALUES " + multi_row_values(cursor, '(%s, %s, %s, %s, %s)', chunk))
+
+
+def _read_current_item(cursor, key):
+    # Returns the current item and its entry number, or None if the key is new
+    app.logger.info("Read current item for key '%s'", key)
+    cursor.execute('SELECT i.item, r.entry_number '
+                   'FROM record r '
+                   'JOIN item i on r.item_hash = i.item_hash '
+                   'WHERE r.key = %(key)s', {
+                       'key': key
+                   })
+    return cursor.fetchone()
+
+
+def _read_latest_items(cursor, keys):
+    # One query for the current version (item and entry number) of every key in the batch, rather than one per item
+    app.logger.info("Read latest items for %d keys", len(keys))
+    cursor.execute('SELECT r.key, i.item, r.entry_number '
+                   'FROM record r '
+                   'JOIN item i on r.item_hash = i.item_hash '
+                   'WHERE r.key = ANY(%(keys)s)', {
+                       'keys': list(keys)
+                   })
+    return {row['key']: row for row in cursor.fetchall()}
+
+
+def _update_record_table(cursor, key, entry_number, item_hash, is_new):
+    # The record table maps each key to its latest entry, so reads don't have to find it from the entry table
+    app.audit_logger.info("Set record '%s' to entry %s", key, str(entry_number))
+    if is_new:
+        cursor.execute('INSERT INTO record (key, entry_number, item_hash) '
+                       'VALUES (%(key)s, %(number)s, %(hash)s)',
+                       {'key': key, 'number': entry_number, 'hash': item_hash})
+    else:
+        cursor.execute('UPDATE record SET entry_number=%(number)s, item_hash=%(hash)s WHERE key=%(key)s',
+                       {'key': key, 'number': entry_number, 'hash': item_hash})
+
+
+def _update_record_table_bulk(cursor, entries, existing_keys):
+    latest_entries = {}
+    for entry in entries:
+        latest_entries[str(entry['key'])] = entry
+
+    updates = []
+    inserts = []
+    for key, entry in latest_entries.items():
+        row = (key, entry['entry-number'], entry['item-hash'])
+        if key in existing_keys:
+            updates.append(row)
+        else:
+            inserts.append(row)
+
+    app.audit_logger.info("Update %d records and insert %d records", len(updates), len(inserts))
+    for chunk in chunks(updates):
+        cursor.execute("UPDATE record r "
+                       "SET entry_number = v.entry_number, item_hash = v.item_hash "
+                       "FROM (VALUES " + multi_row_values(cursor, '(%s, %s::integer, %s)', chunk) + ") "
+                       "AS v (key, entry_number, item_hash) "
+                       "WHERE r.key = v.key")
+    for chunk in chunks(inserts):
+        cursor.execute("INSERT INTO record "
+                       "(key, entry_number, item_hash) "
+                       "VALUES " + multi_row_values(cursor, '(%s, %s, %s)', chunk))
+
+
+def _create_message(entry, item, item_hash, existing_item):
+    action_type = get_action_type(existing_item)
+
+    message = entry
+    message['action-type'] = action_type
+    message['item'] = item
+
+    if action_type == 'UPDATED':
+        app.logger.info("Item '%s' is updated", item_hash)
+        add_item_changes(message, item, existing_item)
+    return message
 
 
 def insert_item_in_transaction(cursor, item, item_hash, item_signature):
     app.logger.info("Insert item '%s' in transaction", item_hash)
     key_field = app.config['REGISTER_KEY_FIELD']
+    # Appends are serialised, which keeps entry numbers gap-free and the merkle tree pruned in order
+    lock_appends(cursor)
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+    current = _read_current_item(cursor, str(item[key_field]))
+    existing_item = current['item'] if current is not None else None
     _insert_to_item_table(cursor, item, item_hash)
-    entry_number = _insert_to_entry_table(
-        cursor, timestamp, item_hash, item[key_field], item_signature)
+    entry_number = next_entry_numbers(cursor, 1)[0]
+    _insert_to_entry_table(cursor, entry_number, timestamp, item_hash, item[key_field], item_signature)
 
     entry = {
         "entry-number": entry_number,
@@ -66,47 +183,91 @@ def insert_item_in_transaction(cursor, item, item_hash, item_signature):
 
     hash_bin = calculate_leaf_hash(entry)
     store_leaf_hash(cursor, entry_number, hash_bin.decode())
+    _update_record_table(cursor, str(item[key_field]), entry_number, item_hash, existing_item is None)
 
-    existing_item = None
-    key_name = os.environ['REGISTER_KEY_FIELD']
-    existing_record = read_record_by_field_value(str(item[key_name]))
+    message = _create_message(entry, item, item_hash, existing_item)
 
-    if existing_record is not None:
-        existing_item = existing_record['item']
+    prune_merkle_tree(cursor, entry_number)
+    append_merkle_leaves(cursor, entry_number, [hash_bin.decode()])
+    store_entry_change(cursor, entry_number, current['entry_number'] if current is not None else None, message)
 
-    action_type = get_action_type(existing_item)
+    # Published by the outbox dispatcher once this transaction commits
+    store_outbox_message(cursor, entry_number, routing_key_for(config.REGISTER_ROUTEKEY, item[key_field]), message)
+    return entry_number
 
-    message = entry
-    message['action-type'] = action_type
-    message['item'] = item
 
-    if action_type == 'UPDATED':
-        app.logger.info("Item '%s' is updated", item_hash)
-        message['item-changes'] = get_item_changes(item, existing_item)
+def insert_items_bulk_in_transaction(cursor, item_list):
+    # Set-based equivalent of calling insert_item_in_transaction for each item in turn: items, entries and leaf
+    # hashes are written with multi-row statements and the merkle tree is pruned once for the whole batch.
+    app.logger.info("Bulk insert %d items in transaction", len(item_list))
+    if len(item_list) == 0:
+        return []
 
-    prune_merkle_tree(cursor, entry_number)
+    key_field = app.config['REGISTER_KEY_FIELD']
+    lock_appends(cursor)
+    # Must be read before this batch's entries are written
+    latest_items = _read_latest_items(cursor, set(str(item['item'][key_field]) for item in item_list))
+    existing_keys = set(latest_items.keys())
 
-    app.logger.info("Sending message to exchange %s", config.EXCHANGE_NAME)
-    publish_message(message, config.RABBIT_URL, config.EXCHANGE_NAME, config.REGISTER_ROUTEKEY, queue_name=None,
-                    exchange_type=config.EXCHANGE_TYPE, serializer="json",
-                    headers=None)
-    return entry_number
+    _insert_to_item_table_bulk(cursor, item_list)
+    entry_numbers = next_entry_numbers(cursor, len(item_list))
+
+    entries = []
+    for entry_number, item in zip(entry_numbers, item_list):
+        entries.append({
+            "entry-number": entry_number,
+            "entry-timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
+            "item-hash": item['item-hash'],
+            "key": item['item'][key_field],
+            "item-signature": item['item-signature']
+        })
+    _insert_to_entry_table_bulk(cursor, entries)
+    _update_record_table_bulk(cursor, entries, existing_keys)
+
+    leaf_hashes = [calculate_leaf_hash(entry).decode() for entry in entries]
+    store_leaf_hashes(cursor, list(zip(entry_numbers, leaf_hashes)))
+    prune_merkle_tree_range(cursor, entry_numbers[0], entry_numbers[-1])
+    append_merkle_leaves(cursor, entry_numbers[0], leaf_hashes)
+
+    result = []
+    messages = []
+    changes = []
+    for entry, item in zip(entries, item_list):
+        key = str(entry['key'])
+        latest = latest_items.get(key)
+        # Later items in the batch update earlier ones with the same key
+        latest_items[key] = {'item': item['item'], 'entry_number': entry['entry-number']}
+        result.append({
+            'item-hash': item['item-hash'],
+            'entry-number': entry['entry-number']
+        })
+        message = _create_message(entry, item['item'], item['item-hash'],
+                                  latest['item'] if latest is not None else None)
+        changes.append((entry['entry-number'], latest['entry_number'] if latest is not None else None, message))
+        messages.append((entry['entry-number'], routing_key_for(config.REGISTER_ROUTEKEY, entry['key']), message))
+    store_entry_changes(cursor, changes)
+    store_outbox_messages(cursor, messages)
+
+    return result
 
 
-def insert_item(item, item_hash, item_signature):
+def insert_item(item, item_hash, item_signature, before_commit=None):
     app.logger.info("Insert item")
     cursor = start()
     try:
         entry_number = insert_item_in_transaction(
             cursor, item, item_hash, item_signature)
+        if before_commit is not None:
+            before_commit(cursor, entry_number)
         commit(cursor)
     except Exception:  # pragma: no cover
         rollback(cursor)
         raise
+    outbox_dispatcher.notify()
     return entry_number
 
 
-def insert_items(item_list):
+def insert_items(item_list, before_commit=None):
     app.logger.info("Insert items")
     result = []
     cursor = start()
@@ -118,11 +279,30 @@ def insert_items(item_list):
                 'item-hash': item['item-hash'],
                 'entry-number': entry_number
             })
+        if before_commit is not None:
+            before_commit(cursor, result)
         commit(cursor)
     except Exception as e:  # pragma: no cover
         app.logger.exception(str(e))
         rollback(cursor)
         raise
+    outbox_dispatcher.notify()
+    return result
+
+
+def insert_items_bulk(item_list, before_commit=None):
+    app.logger.info("Bulk insert items")
+    cursor = start()
+    try:
+        result = insert_items_bulk_in_transaction(cursor, item_list)
+        if before_commit is not None:
+            before_commit(cursor, result)
+        commit(cursor)
+    except Exception as e:  # pragma: no cover
+        app.logger.exception(str(e))
+        rollback(cursor)
+        raise
+    outbox_dispatcher.notify()
     return result
 
 
@@ -174,9 +354,10 @@ def read_record_by_field_value(field_value):
     cursor = start()
     try:
         cursor.execute('SELECT e.entry_number, e.entry_timestamp, e.item_hash, e.key, i.item '
-                       'FROM entry e, item i '
-                       'WHERE e.item_hash = i.item_hash '
-                       'AND key=%(key)s ORDER BY e.entry_number DESC LIMIT 1', {
+                       'FROM record r '
+                       'JOIN entry e on r.entry_number = e.entry_number '
+                       'JOIN item i on r.item_hash = i.item_hash '
+                       'WHERE r.key=%(key)s', {
                            'key': field_value
                        })
         row = cursor.fetchone()
@@ -273,9 +454,11 @@ def read_record_entries(field_value):
     app.logger.info("Read record entries for '%s'", field_value)
     cursor = start()
     try:
-        cursor.execute('SELECT entry_number, entry_timestamp, item_hash, key '
-                       'FROM entry '
-                       'WHERE key=%(key)s ORDER BY entry_number DESC', {
+        cursor.execute('SELECT e.entry_number, e.entry_timestamp, e.item_hash, e.key, '
+                       'c.action_type, c.previous_entry_number '
+                       'FROM entry e '
+                       'LEFT JOIN entry_change c on e.entry_number = c.entry_number '
+                       'WHERE e.key=%(key)s ORDER BY e.entry_number DESC', {
                            'key': field_value
                        })
         rows = cursor.fetchall()
@@ -285,12 +468,16 @@ def read_record_entries(field_value):
 
         result = []
         for row in rows:
-            result.append({
+            entry = {
                 "entry-number": row['entry_number'],
                 "entry-timestamp": row['entry_timestamp'].strftime('%Y-%m-%d %H:%M:%S.%f'),
                 "item-hash": row['item_hash'],
                 "key": row['key']
-            })
+            }
+            if row['action_type'] is not None:
+                entry['action-type'] = row['action_type']
+                entry['previous-entry-number'] = row['previous_entry_number']
+            result.append(entry)
         app.logger.info("%d record entries returned", len(result))
         return result
 
@@ -298,82 +485,134 @@ def read_record_entries(field_value):
         commit(cursor)
 
 
-def republish_entry(entry_number, routing_key):
-    app.logger.info("Republishing entry '%s'", entry_number)
-    cursor = start()
-    try:
-        max_entry = count_entries(cursor)
+def _read_entry_item(cursor, entry_number):
+    cursor.execute('SELECT i.item '
+                   'FROM entry e '
+                   'JOIN item i on e.item_hash = i.item_hash '
+                   'WHERE e.entry_number=%(entry_number)s', {
+                       'entry_number': entry_number
+                   })
+    row = cursor.fetchone()
+    return row['item'] if row is not None else None
+
+
+def _read_republish_message(cursor, entry_number):
+    cursor.execute('SELECT e.entry_number, e.entry_timestamp, e.item_hash, e.key, i.item, e.item_signature, '
+                   'c.action_type, c.previous_entry_number, c.changes '
+                   'FROM entry e '
+                   'JOIN item i on e.item_hash = i.item_hash '
+                   'LEFT JOIN entry_change c on e.entry_number = c.entry_number '
+                   'WHERE e.entry_number=%(entry_number)s LIMIT 1', {
+                       'entry_number': entry_number
+                   })
+    entry_row = cursor.fetchone()
+    prev_item = None
+    if not entry_row:
+        app.logger.info(
+            "No entry found for '%s', using empty entry", entry_number)
+        entry = create_empty_entry(entry_number)
+    else:
+        entry = {
+            "entry-number": entry_number,
+            "entry-timestamp": entry_row['entry_timestamp'].strftime('%Y-%m-%d %H:%M:%S.%f'),
+            "item-hash": entry_row['item_hash'],
+            "key": entry_row['key'],
+            "item-signature": entry_row['item_signature'],
+            "item": entry_row['item']
+        }
 
-        if entry_number > max_entry:
-            app.logger.warning(
-                "Entry number '%s' is greater than maximum entry '%s'", entry_number, max_entry)
-            return False
+        if entry_row['action_type'] is not None:
+            return _republish_message_from_change(cursor, entry, entry_row)
 
-        cursor.execute('SELECT e.entry_number, e.entry_timestamp, e.item_hash, e.key, i.item, e.item_signature '
+        # Entries written before the change log existed
+        cursor.execute('SELECT e.entry_number, i.item '
                        'FROM entry e '
                        'JOIN item i on e.item_hash = i.item_hash '
-                       'WHERE entry_number=%(entry_number)s LIMIT 1', {
+                       'WHERE e.key=%(key)s AND entry_number < %(entry_number)s '
+                       'ORDER BY entry_number DESC LIMIT 1', {
+                           'key': entry['key'],
                            'entry_number': entry_number
                        })
-        entry_row = cursor.fetchone()
-        prev_item = None
-        if not entry_row:
-            app.logger.info(
-                "No entry found for '%s', using empty entry", entry_number)
-            entry = create_empty_entry(entry_number)
-        else:
-            entry = {
-                "entry-number": entry_number,
-                "entry-timestamp": entry_row['entry_timestamp'].strftime('%Y-%m-%d %H:%M:%S.%f'),
-                "item-hash": entry_row['item_hash'],
-                "key": entry_row['key'],
-                "item-signature": entry_row['item_signature'],
-                "item": entry_row['item']
-            }
+        prev_entry_row = cursor.fetchone()
+        if prev_entry_row:
+            prev_item = prev_entry_row['item']
+
+    action_type = get_action_type(prev_item)
+
+    message = entry
+    message['action-type'] = action_type
+
+    if action_type == 'UPDATED':
+        add_item_changes(message, entry['item'], prev_item)
+        app.logger.info("Created republish for entry '%s' with changes from previous entry '%s'", entry_number,
+                        prev_entry_row['entry_number'])
+    else:
+        app.logger.info("Created republish for entry '%s''", entry_number)
+    return message
 
-            cursor.execute('SELECT e.entry_number, i.item '
-                           'FROM entry e '
-                           'JOIN item i on e.item_hash = i.item_hash '
-                           'WHERE e.key=%(key)s AND entry_number < %(entry_number)s '
-                           'ORDER BY entry_number DESC LIMIT 1', {
-                               'key': entry['key'],
-                               'entry_number': entry_number
-                           })
-            prev_entry_row = cursor.fetchone()
-            if prev_entry_row:
-                prev_item = prev_entry_row['item']
-
-        action_type = get_action_type(prev_item)
-
-        message = entry
-        message['action-type'] = action_type
-
-        if action_type == 'UPDATED':
-            message['item-changes'] = get_item_changes(
-                entry['item'], prev_item)
-            app.logger.info("Created republish for entry '%s' with changes from previous entry '%s'", entry_number,
-                            prev_entry_row['entry_number'])
+
+def _republish_message_from_change(cursor, entry, change_row):
+    # The action and diff recorded when the entry was appended. The diff is only worked out again (from the previous
+    # entry, found by its number) if it wasn't recorded in the current ITEM_CHANGES_FORMAT.
+    message = entry
+    message['action-type'] = change_row['action_type']
+    if change_row['action_type'] == 'UPDATED':
+        changes = change_row['changes'] or {}
+        field = item_changes_field()
+        if field in changes:
+            message[field] = changes[field]
         else:
-            app.logger.info("Created republish for entry '%s''", entry_number)
+            add_item_changes(message, entry['item'], _read_entry_item(cursor, change_row['previous_entry_number']))
+    app.logger.info("Created republish for entry '%s' from its recorded change", entry['entry-number'])
+    return message
 
-        app.logger.info("Sending republish message to exchange '%s' with routing key '%s'",
-                        config.EXCHANGE_NAME, routing_key)
-        app.logger.debug("Sending message '%s''", message)
-        publish_message(message, config.RABBIT_URL, config.EXCHANGE_NAME, routing_key, queue_name=None,
-                        exchange_type=config.EXCHANGE_TYPE, serializer="json",
-                        headers=None)
 
-        app.audit_logger.info(
-            "Entry '%s' republished to routing key '%s'", entry_number, routing_key)
-        return True
+def republish_entry_batch(entry_numbers, routing_key):
+    app.logger.info("Republishing entries '%s'", entry_numbers)
+    result = {"republished_entries": [], "entries_not_found": [], "entries_not_published": []}
+    messages = []
+    cursor = start()
+    try:
+        max_entry = count_entries(cursor)
 
+        for entry_number in entry_numbers:
+            if entry_number > max_entry:
+                app.logger.warning(
+                    "Entry number '%s' is greater than maximum entry '%s'", entry_number, max_entry)
+                result['entries_not_found'].append(entry_number)
+            else:
+                messages.append((entry_number, _read_republish_message(cursor, entry_number)))
     finally:
         commit(cursor)
 
+    if len(messages) == 0:
+        return result
+
+    app.logger.info("Sending %d republish messages to exchange '%s' with routing key '%s'",
+                    len(messages), config.EXCHANGE_NAME, routing_key)
+    # One batch, confirmed by the broker once, rather than a round trip per entry
+    # Partitioned like the original events, so a republish reaches the consumer that owns each record
+    errors = publish_messages([(message, routing_key_for(routing_key, message['key']))
+                               for entry_number, message in messages],
+                              config.RABBIT_URL, config.EXCHANGE_NAME, routing_key, queue_name=None,
+                              exchange_type=config.EXCHANGE_TYPE, serializer=KOMBU_SERIALIZER, headers=None,
+                              compression=config.MESSAGE_COMPRESSION,
+                              compress_min_size=config.MESSAGE_COMPRESSION_MIN_SIZE)
+
+    for (entry_number, message), error in zip(messages, errors):
+        if error is None:
+            app.audit_logger.info(
+                "Entry '%s' republished to routing key '%s'", entry_number, routing_key)
+            result['republished_entries'].append(entry_number)
+        else:
+            app.logger.error("Failed to republish entry '%s': %s", entry_number, repr(error))
+            result['entries_not_published'].append(entry_number)
+    return result
+
 
 def count_all_records(cursor):
     app.logger.info("Count all records")
-    cursor.execute('select count(distinct(key)) from entry')
+    cursor.execute('SELECT COUNT(*) AS count FROM record')
     return cursor.fetchone()['count']
 
 
@@ -384,15 +623,11 @@ def read_all_records(offset, limit):
     cursor = start()
     number = count_all_records(cursor)
     try:
-        cursor.execute('SELECT e2.entry_number, e2.entry_timestamp, e2.item_hash, e2.key, i.item '
-                       'FROM entry e2, item i '
-                       'WHERE e2.item_hash = i.item_hash '
-                       'AND e2.entry_number IN ( '
-                       '  SELECT MAX(e.entry_number) '
-                       '  FROM entry e '
-                       '  GROUP BY e.key '
-                       ') '
-                       'ORDER BY e2.entry_number ASC '
+        cursor.execute('SELECT e.entry_number, e.entry_timestamp, e.item_hash, e.key, i.item '
+                       'FROM record r '
+                       'JOIN entry e on r.entry_number = e.entry_number '
+                       'JOIN item i on r.item_hash = i.item_hash '
+                       'ORDER BY r.entry_number ASC '
                        'LIMIT %(limit)s OFFSET %(offset)s',
                        {'limit': limit, 'offset': offset})
         rows = cursor.fetchall()
@@ -0,0 +1,21 @@
+from register.app import app
+
+# Arbitrary key for the advisory lock that serialises appends to the register across every process. Distinct from
+# the outbox lock.
+SEQUENCER_LOCK_ID = 7302
+
+
+def lock_appends(cursor):
+    # Blocks until no other transaction is appending, and is held until this one commits or rolls back. Everything
+    # before it (validation, signature checks) still runs in parallel. Relies on READ COMMITTED, so that statements
+    # after the lock see entries committed while waiting for it.
+    app.logger.info("Wait for append lock")
+    cursor.execute('SELECT pg_advisory_xact_lock(%(lock_id)s)', {'lock_id': SEQUENCER_LOCK_ID})
+
+
+def next_entry_numbers(cursor, count):
+    # Numbers follow on from the last committed entry, so unlike a sequence a rolled back append leaves no gap.
+    # Only valid while holding the append lock.
+    cursor.execute('SELECT COALESCE(MAX(entry_number), 0) AS last FROM entry')
+    last = cursor.fetchone()['last']
+    return list(range(last + 1, last + count + 1))
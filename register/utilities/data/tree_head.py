@@ -0,0 +1,47 @@
+import json
+from base64 import b16encode
+from datetime import datetime
+from register.app import app
+from register.extensions import crypto
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def tree_head_payload(tree_size, timestamp, root_hash):
+    # What a tree head signature is over: the head as compact JSON with sorted keys
+    return json.dumps({
+        "tree-size": tree_size,
+        "timestamp": timestamp,
+        "root-hash": root_hash
+    }, sort_keys=True, separators=(',', ':'))
+
+
+def record_tree_head(cursor, tree_size, root_hash_bytes):
+    # Called in the append transaction, so there is a head for the size each append leaves the tree at
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    root_hash = b16encode(root_hash_bytes).decode()
+    signature = crypto.sign(tree_head_payload(tree_size, timestamp, "sha-256:" + root_hash))
+    app.audit_logger.info("Insert tree head for tree size %s", str(tree_size))
+    cursor.execute('INSERT INTO tree_head (tree_size, root_hash, timestamp, signature) '
+                   'VALUES (%(size)s, %(root)s, %(timestamp)s, %(signature)s)', {
+                       'size': tree_size,
+                       'root': root_hash,
+                       'timestamp': timestamp,
+                       'signature': signature
+                   })
+
+
+def read_latest_tree_head(cursor):
+    # The latest head along with the latest leaf, to tell whether the head is up to date, in one round trip
+    app.logger.info("Read latest tree head")
+    cursor.execute('SELECT h.tree_size, h.root_hash, h.timestamp, h.signature, '
+                   '(SELECT COALESCE(MAX(entry_number), 0) FROM leaf_hashes) AS latest_entry_number '
+                   'FROM tree_head h ORDER BY h.tree_size DESC LIMIT 1')
+    return cursor.fetchone()
+
+
+def read_tree_head(cursor, tree_size):
+    app.logger.info("Read tree head for tree size %s", str(tree_size))
+    cursor.execute('SELECT tree_size, root_hash, timestamp, signature FROM tree_head '
+                   'WHERE tree_size = %(size)s', {'size': tree_size})
+    return cursor.fetchone()
@@ -0,0 +1,80 @@
+import threading
+from register.app import app
+from register.utilities.data.queries import insert_item, insert_items_bulk
+
+
+class _PendingInsert(object):
+    def __init__(self, item, item_hash, item_signature):
+        self.item = item
+        self.item_hash = item_hash
+        self.item_signature = item_signature
+        self.entry_number = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class GroupCommitter(object):
+    """Collects single-item inserts from concurrent requests into one transaction.
+
+    The first caller to arrive becomes the leader for its group: it waits for up to the window (or until max_size
+    inserts are waiting), then writes the whole group with the bulk insert path, so the group shares one commit and one
+    merkle tree update. Everyone else just waits for their own entry number. If the group's transaction fails, each
+    insert is retried in its own transaction so that one bad item doesn't fail the others.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = []
+        self._leader_waiting = False
+
+    def insert(self, item, item_hash, item_signature, window, max_size):
+        pending = _PendingInsert(item, item_hash, item_signature)
+        with self._condition:
+            self._pending.append(pending)
+            is_leader = not self._leader_waiting
+            if is_leader:
+                self._leader_waiting = True
+                self._condition.wait_for(lambda: len(self._pending) >= max_size, window)
+                group, self._pending = self._pending, []
+                self._leader_waiting = False
+            elif len(self._pending) >= max_size:
+                self._condition.notify_all()
+
+        if is_leader:
+            self._write(group)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.entry_number
+
+    def _write(self, group):
+        app.logger.info("Group commit of %d items", len(group))
+        try:
+            if len(group) == 1:
+                group[0].entry_number = insert_item(group[0].item, group[0].item_hash, group[0].item_signature)
+                return
+
+            try:
+                result = insert_items_bulk([{
+                    'item': pending.item,
+                    'item-hash': pending.item_hash,
+                    'item-signature': pending.item_signature
+                } for pending in group])
+                for pending, inserted in zip(group, result):
+                    pending.entry_number = inserted['entry-number']
+            except Exception as e:
+                app.logger.warning("Group commit failed (%s), inserting items individually", repr(e))
+                for pending in group:
+                    try:
+                        pending.entry_number = insert_item(pending.item, pending.item_hash, pending.item_signature)
+                    except Exception as item_error:
+                        pending.error = item_error
+        except Exception as e:
+            for pending in group:
+                pending.error = e
+        finally:
+            for pending in group:
+                pending.done.set()
+
+
+group_committer = GroupCommitter()
@@ -1,3 +1,6 @@
+from register.app import app
+
+
 def get_action_type(existing_item):
     if existing_item is not None:
         return "UPDATED"
@@ -19,3 +22,88 @@ def get_item_changes(item, existing_item):
             }
 
     return diff_dictionary
+
+
+def item_changes_field():
+    # ITEM_CHANGES_FORMAT 'json-patch' sends an RFC 6902 patch from the previous item as item-patch instead of the
+    # old and new value of each changed field as item-changes
+    return 'item-patch' if app.config['ITEM_CHANGES_FORMAT'] == 'json-patch' else 'item-changes'
+
+
+def add_item_changes(message, item, existing_item):
+    if item_changes_field() == 'item-patch':
+        message['item-patch'] = get_item_patch(item, existing_item, app.config['ITEM_PATCH_MAX_OPERATIONS'])
+    else:
+        message['item-changes'] = get_item_changes(item, existing_item)
+    return message
+
+
+def get_item_patch(item, existing_item, max_operations=1000):
+    """RFC 6902 operations turning existing_item into item.
+
+    Nested objects and arrays are compared member by member (arrays by position), so changing one coordinate of a
+    geometry gives a single replace. An array that would need more operations than it has elements is replaced whole,
+    and if the patch would still be longer than max_operations each changed field is replaced whole instead.
+    Unchanged subtrees are skipped with a single comparison, so the cost follows the size of the items rather than
+    the number of differences.
+    """
+    operations = []
+    _diff(existing_item, item, '', operations)
+    if len(operations) <= max_operations:
+        return operations
+
+    operations = []
+    for key in sorted(set(existing_item.keys()) | set(item.keys())):
+        _diff_member(existing_item, item, key, '', operations, whole=True)
+    return operations
+
+
+def _pointer(path, token):
+    return '{}/{}'.format(path, str(token).replace('~', '~0').replace('/', '~1'))
+
+
+def _diff(old, new, path, operations):
+    # Containers are compared by kind, as incoming items are CanonicalItems (dict subclasses) and stored ones plain
+    # dicts; scalars by exact type, so that e.g. 1 and true aren't taken as equal
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old.keys()) | set(new.keys())):
+            _diff_member(old, new, key, path, operations)
+    elif isinstance(old, list) and isinstance(new, list):
+        _diff_list(old, new, path, operations)
+    elif type(old) is not type(new) or old != new:
+        operations.append({'op': 'replace', 'path': path, 'value': new})
+
+
+def _differs(old, new):
+    # 1 == true in Python but not in JSON
+    return old != new or type(old) is not type(new)
+
+
+def _diff_member(old, new, key, path, operations, whole=False):
+    member_path = _pointer(path, key)
+    if key not in new:
+        operations.append({'op': 'remove', 'path': member_path})
+    elif key not in old:
+        operations.append({'op': 'add', 'path': member_path, 'value': new[key]})
+    elif _differs(old[key], new[key]):
+        if whole:
+            operations.append({'op': 'replace', 'path': member_path, 'value': new[key]})
+        else:
+            _diff(old[key], new[key], member_path, operations)
+
+
+def _diff_list(old, new, path, operations):
+    element_operations = []
+    for index in range(min(len(old), len(new))):
+        if _differs(old[index], new[index]):
+            _diff(old[index], new[index], _pointer(path, index), element_operations)
+    # Trailing elements are removed from the end so earlier indexes stay valid, or appended in order
+    for index in range(len(old) - 1, len(new) - 1, -1):
+        element_operations.append({'op': 'remove', 'path': _pointer(path, index)})
+    for value in new[len(old):]:
+        element_operations.append({'op': 'add', 'path': _pointer(path, '-'), 'value': value})
+
+    if len(element_operations) > len(new):
+        operations.append({'op': 'replace', 'path': path, 'value': new})
+    else:
+        operations.extend(element_operations)
@@ -0,0 +1,111 @@
+import time
+from flask import g
+from register.app import app
+from register.backpressure import queue_monitor
+from register.utilities.background import BackgroundWorker
+from register.utilities.canonical import canonical_records
+from register.utilities.data.bulk import chunks
+from register.utilities.data.connection import start, commit, rollback
+from register.utilities.data.jobs import claim_job, lock_job_progress, store_job_entries, touch_job, finish_job
+from register.utilities.data.queries import insert_items_bulk_in_transaction
+from register.utilities.outbox import outbox_dispatcher
+from register.utilities.validation import get_batch_item_errors, get_batch_signature_errors
+
+
+def _in_transaction(operation, *args):
+    cursor = start()
+    try:
+        result = operation(cursor, *args)
+        commit(cursor)
+    except Exception:
+        rollback(cursor)
+        raise
+    return result
+
+
+def _append_chunk(cursor, job_id, first_index, item_list, last):
+    # Returns False, writing nothing, if another worker has reclaimed the job and moved it on
+    if lock_job_progress(cursor, job_id) != first_index:
+        return False
+    results = insert_items_bulk_in_transaction(cursor, item_list)
+    store_job_entries(cursor, job_id, first_index, results)
+    if last:
+        finish_job(cursor, job_id, 'COMPLETE')
+    return True
+
+
+def _validate(job_id, item_list, chunk_size):
+    # A chunk at a time, touching the job after each so a long validation isn't mistaken for a dead worker
+    item_errors = []
+    signature_errors = []
+    for first_index in range(0, len(item_list), chunk_size):
+        chunk = item_list[first_index:first_index + chunk_size]
+        item_errors.extend(get_batch_item_errors(chunk, first_index))
+        signature_errors.extend(get_batch_signature_errors(chunk, first_index))
+        _in_transaction(touch_job, job_id)
+    return item_errors + signature_errors
+
+
+def _wait_for_capacity(job_id):
+    # Holds the job back while the queues consuming register events are backed up
+    while queue_monitor.overloaded_queue() is not None:
+        app.logger.info("Ingest job '%s' waiting for queues to drain", job_id)
+        _in_transaction(touch_job, job_id)
+        time.sleep(app.config['BACKPRESSURE_SAMPLE_INTERVAL'])
+
+
+def process_job(chunk_size, stale_after):
+    # Claims one ingest job, validates its items and appends them in chunks. Each chunk's entries are committed with
+    # the job's progress, so a job reclaimed after its worker died resumes from the first unwritten item.
+    # Returns False if there was no job to process.
+    job = _in_transaction(claim_job, stale_after)
+    if job is None:
+        return False
+
+    job_id = job['job_id']
+    item_list = canonical_records(job['items'])
+    processed = job['processed_count']
+    app.logger.info("Process ingest job '%s' from item %d", job_id, processed)
+
+    # Validation happens before anything is written, so resumed jobs have already passed it
+    if processed == 0:
+        g.trace_id = job_id
+        errors = _validate(job_id, item_list, chunk_size)
+        if len(errors) > 0:
+            app.logger.warning("There were validation errors in ingest job '%s'", job_id)
+            _in_transaction(finish_job, job_id, 'FAILED', errors)
+            return True
+
+    if len(item_list) == 0:
+        _in_transaction(finish_job, job_id, 'COMPLETE')
+        return True
+
+    remaining = item_list[processed:]
+    try:
+        for chunk in chunks(remaining, chunk_size):
+            _wait_for_capacity(job_id)
+            if not _in_transaction(_append_chunk, job_id, processed, chunk, processed + len(chunk) == len(item_list)):
+                app.logger.warning("Ingest job '%s' was taken over by another worker at item %d", job_id, processed)
+                return True
+            processed += len(chunk)
+            outbox_dispatcher.notify()
+    except Exception as e:
+        app.logger.exception("Ingest job '%s' failed after %d items", job_id, processed)
+        _in_transaction(finish_job, job_id, 'FAILED', [{
+            "error": "Failed after {} items".format(processed),
+            "details": repr(e)
+        }])
+    return True
+
+
+class IngestJobWorker(BackgroundWorker):
+    """Appends the items of jobs submitted to POST /jobs in the background."""
+
+    def __init__(self):
+        super(IngestJobWorker, self).__init__('ingest-job-worker', 'JOB_POLL_INTERVAL', 'JOB_WORKER')
+
+    def work(self):
+        return process_job(int(app.config['JOB_CHUNK_SIZE']), int(app.config['JOB_STALE_AFTER']))
+
+
+job_worker = IngestJobWorker()
@@ -0,0 +1,102 @@
+import json
+from kombu.serialization import register as register_serializer
+from register.app import app
+
+# Name of the kombu serializer that encodes messages with the selected backend
+KOMBU_SERIALIZER = 'register-json'
+
+
+def _stdlib_backend():
+    def dumps(obj):
+        return json.dumps(obj)
+
+    def canonical_dumps(obj):
+        return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    return 'json', dumps, canonical_dumps, json.loads
+
+
+def _orjson_backend():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def canonical_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+
+    return 'orjson', dumps, canonical_dumps, orjson.loads
+
+
+def _ujson_backend():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    def canonical_dumps(obj):
+        return ujson.dumps(obj, sort_keys=True, ensure_ascii=False, escape_forward_slashes=False)
+
+    return 'ujson', dumps, canonical_dumps, ujson.loads
+
+
+BACKENDS = {
+    'orjson': _orjson_backend,
+    'ujson': _ujson_backend,
+    'json': _stdlib_backend
+}
+
+
+def load_backend(name):
+    # 'auto' takes the first of orjson and ujson that is installed, falling back to the standard library
+    if name != 'auto':
+        return BACKENDS[name]()
+    for backend in [_orjson_backend, _ujson_backend]:
+        try:
+            return backend()
+        except ImportError:
+            pass
+    return _stdlib_backend()
+
+
+def _is_plain(obj):
+    # Strings, 64 bit integers, booleans and None are encoded identically by every backend. Floats aren't (1e+16 is
+    # written as 1e16 by orjson, for one), so anything containing them is left to the standard library.
+    if isinstance(obj, str) or obj is None or isinstance(obj, bool):
+        return True
+    if isinstance(obj, int):
+        return -2 ** 63 <= obj < 2 ** 63
+    if isinstance(obj, dict):
+        return all(isinstance(key, str) and _is_plain(value) for key, value in obj.items())
+    if isinstance(obj, list):
+        return all(_is_plain(value) for value in obj)
+    return False
+
+
+BACKEND_NAME, _dumps, _canonical_dumps, loads = load_backend(app.config['JSON_BACKEND'])
+_, _stdlib_dumps, _stdlib_canonical_dumps, _ = _stdlib_backend()
+
+
+def dumps(obj):
+    """Encodes obj with the selected backend, for responses, logs and messages where only the meaning matters."""
+    try:
+        return _dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        return _stdlib_dumps(obj)
+
+
+def canonical_dumps(obj):
+    """Encodes obj with sorted keys, no whitespace and non-ASCII characters kept, as the leaf hash requires.
+
+    The output is always identical to the standard library's: the selected backend is only used for values it is
+    known to encode the same way.
+    """
+    if BACKEND_NAME != 'json' and _is_plain(obj):
+        try:
+            return _canonical_dumps(obj)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return _stdlib_canonical_dumps(obj)
+
+
+register_serializer(KOMBU_SERIALIZER, dumps, loads, content_type='application/json', content_encoding='utf-8')
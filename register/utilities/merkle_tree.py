@@ -3,6 +3,53 @@ from Crypto.Hash import SHA256
 from base64 import b16encode
 
 
+def tree_hash(left, right):
+    digest = SHA256.new()
+    digest.update(b'\x01')
+    digest.update(left)
+    digest.update(right)
+    return digest.digest()
+
+
+def empty_hash():
+    return SHA256.new(b'').digest()
+
+
+def frontier_size(frontier):
+    # The frontier holds the roots of the perfect subtrees the tree splits into, one per set bit of its size, keyed
+    # by height
+    return sum(1 << height for height in frontier)
+
+
+def frontier_root(frontier):
+    """The root hash of the tree with the given frontier (a dict of height to subtree hash bytes)."""
+    root = None
+    for height in sorted(frontier):
+        root = frontier[height] if root is None else tree_hash(frontier[height], root)
+    return root if root is not None else empty_hash()
+
+
+def extend_frontier(frontier, size, leaf_hashes, completed=None):
+    """Returns the frontier of the tree of the given size after appending leaf_hashes (bytes) to it.
+
+    Each leaf merges with the subtrees of equal height to its left, as in binary addition, so an append costs
+    O(log n) hashes at worst and O(1) on average. Every subtree a merge completes is added to the completed list,
+    if given, as a (start, size, hash) tuple with a 0-based start.
+    """
+    frontier = dict(frontier)
+    for leaf_hash in leaf_hashes:
+        node = leaf_hash
+        height = 0
+        while size & (1 << height):
+            node = tree_hash(frontier.pop(height), node)
+            height += 1
+            if completed is not None:
+                completed.append((size + 1 - (1 << height), 1 << height, node))
+        frontier[height] = node
+        size += 1
+    return frontier
+
+
 class MerkleTree(object):
     def __init__(self, data_store):
         self.data_store = data_store
@@ -24,6 +71,56 @@ class MerkleTree(object):
         hash_bytes = self._branch_hash(0, self.tree_size())
         return hash_bytes
 
+    def tree_head(self):
+        # Tree size and root hash from the stored frontier when it is up to date, which takes no tree walk and
+        # writes nothing; otherwise (e.g. the frontier table hasn't been built yet) from the tree itself
+        frontier = self.data_store.frontier()
+        size = frontier_size(frontier)
+        if size == self.data_store.latest_entry_number():
+            return size, frontier_root(frontier)
+        return self.tree_size(), self.root_hash()
+
+    def append_leaves(self, first_entry, leaf_hashes):
+        """Extends the stored frontier with the leaves of the entries from first_entry on.
+
+        leaf_hashes are hex strings. The hash of every perfect subtree they complete is stored too; those subtrees
+        never change, so proofs only have to hash the O(log n) partial subtrees down the right-hand edge of the tree.
+        Returns the new frontier, or None, changing nothing, if the frontier isn't for a tree of first_entry - 1
+        leaves.
+        """
+        frontier = self.data_store.frontier()
+        size = frontier_size(frontier)
+        if size != first_entry - 1:
+            return None
+        completed = []
+        extended = extend_frontier(frontier, size, [bytes.fromhex(leaf_hash) for leaf_hash in leaf_hashes], completed)
+        self.data_store.save_frontier(frontier, extended)
+        self.data_store.save_branch_hashes([(start, length, b16encode(branch_hash).decode())
+                                            for start, length, branch_hash in completed])
+        return extended
+
+    def rebuild_frontier(self, size, batch_size=10000):
+        """Rebuilds the stored frontier from the leaf hashes of entries 1 to size.
+
+        The hash of every perfect subtree is stored on the way, as appends do. Proofs take leaf index to be entry
+        number - 1, so this raises ApplicationError rather than build a frontier over missing leaves.
+        """
+        frontier = {}
+        built = 0
+        while built < size:
+            rows = self.data_store.leaf_hashes_from(built + 1, min(batch_size, size - built))
+            expected = list(range(built + 1, built + 1 + len(rows)))
+            if len(rows) == 0 or [entry_number for entry_number, leaf_hash in rows] != expected:
+                raise ApplicationError("Leaf hashes are missing after entry {}".format(built), "E105")
+            completed = []
+            frontier = extend_frontier(frontier, built, [bytes.fromhex(leaf_hash) for entry_number, leaf_hash in rows],
+                                       completed)
+            self.data_store.save_branch_hashes([(start, length, b16encode(branch_hash).decode())
+                                                for start, length, branch_hash in completed])
+            built += len(rows)
+        self.data_store.save_frontier(self.data_store.frontier(), frontier)
+        return frontier
+
     def entry_proof(self, entry_number, total_entries):
         # TODO(We're going to assume that the leaf index is entry_number-1)
         return self._sub_entry_proof(entry_number - 1, 0, total_entries)
@@ -75,14 +172,10 @@ class MerkleTree(object):
             return branch_hash
 
     def _tree_hash(self, left, right):
-        digest = SHA256.new()
-        digest.update(b'\x01')
-        digest.update(left)
-        digest.update(right)
-        return digest.digest()
+        return tree_hash(left, right)
 
     def _empty_hash(self):
-        return SHA256.new('').digest()
+        return empty_hash()
 
     def _sub_entry_proof(self, leaf_index, start, size):
         if size <= 1:
@@ -0,0 +1,57 @@
+from register import config
+from register.app import app
+from register.dependencies.rabbitmq import publish_messages
+from register.utilities.background import BackgroundWorker
+from register.utilities.data.connection import start, commit, rollback
+from register.utilities.data.outbox import lock_outbox, read_outbox_messages, delete_outbox_messages
+
+
+def dispatch_outbox(batch_size):
+    # Publishes the oldest batch of outbox messages in entry number order, waiting for broker confirms once for the
+    # whole batch, and deletes those that were sent. Messages are sent at least once: anything after the first
+    # failure (or everything, if the commit fails) is sent again by the next dispatch.
+    # Returns the number of messages published.
+    cursor = start()
+    try:
+        if not lock_outbox(cursor):
+            app.logger.info("Outbox is being dispatched by another process")
+            commit(cursor)
+            return 0
+
+        messages = read_outbox_messages(cursor, batch_size)
+        published = []
+        if len(messages) > 0:
+            app.logger.info("Sending %d messages to exchange %s", len(messages), config.EXCHANGE_NAME)
+            results = publish_messages([(row['message'], row['routing_key']) for row in messages],
+                                       config.RABBIT_URL, config.EXCHANGE_NAME, config.REGISTER_ROUTEKEY,
+                                       queue_name=None, exchange_type=config.EXCHANGE_TYPE, serializer=None,
+                                       headers=None, content_type='application/json',
+                                       compression=config.MESSAGE_COMPRESSION,
+                                       compress_min_size=config.MESSAGE_COMPRESSION_MIN_SIZE)
+            for row, error in zip(messages, results):
+                if error is not None:
+                    app.logger.error("Failed to publish message for entry %s: %s", str(row['entry_number']),
+                                     repr(error))
+                    break
+                published.append(row['entry_number'])
+
+        delete_outbox_messages(cursor, published)
+        commit(cursor)
+    except Exception:
+        rollback(cursor)
+        raise
+    return len(published)
+
+
+class OutboxDispatcher(BackgroundWorker):
+    """Drains the outbox to the exchange in the background, so writes don't wait on the broker."""
+
+    def __init__(self):
+        super(OutboxDispatcher, self).__init__('outbox-dispatcher', 'OUTBOX_POLL_INTERVAL', 'OUTBOX_DISPATCHER')
+
+    def work(self):
+        batch_size = int(app.config['OUTBOX_BATCH_SIZE'])
+        return dispatch_outbox(batch_size) == batch_size
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,20 @@
+import zlib
+from register.app import app
+
+
+def partition(key, partitions):
+    # crc32 rather than hash(), which is salted per process; the same key has to land on the same partition from
+    # every worker and across restarts
+    return zlib.crc32(str(key).encode('utf-8')) % partitions
+
+
+def routing_key_for(routing_key, key):
+    """The routing key for an event about the record with key, with a partition suffix if ROUTING_PARTITIONS is set.
+
+    All events for one record go to the same partition, in entry number order, so N consumers (one bound to each
+    partition) can share the work without losing per-record ordering.
+    """
+    partitions = app.config['ROUTING_PARTITIONS']
+    if partitions <= 0:
+        return routing_key
+    return '{}.{}'.format(routing_key, partition(key, partitions))
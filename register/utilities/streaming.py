@@ -0,0 +1,120 @@
+import codecs
+import json
+from register.exceptions import ApplicationError
+
+READ_SIZE = 65536
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader(object):
+    """Decoded text from a byte stream, read a block at a time and discarded once consumed."""
+
+    def __init__(self, stream, read_size, max_item_size):
+        self.stream = stream
+        self.read_size = read_size
+        self.max_item_size = max_item_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, minimum):
+        # Reads until at least minimum characters are unconsumed, or the stream ends. Returns False if nothing was read
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        while not self.eof and len(self.buffer) < minimum:
+            data = self.stream.read(self.read_size)
+            self.eof = len(data) == 0
+            self.buffer += self.decoder.decode(data, final=self.eof)
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill(self.read_size):
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else None
+
+    def value(self):
+        # A value that ends exactly where the buffer does may be the start of a longer one (a number, say), so it's
+        # only accepted once more text has been read or the stream has ended. Each retry at least doubles the text
+        # available, so a large value is parsed a bounded number of times. No more than max_item_size characters are
+        # held for one value, so a malformed one can't buffer the rest of the stream.
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self._check_size(end - self.pos)
+                    self.pos = end
+                    return value
+            except ValueError as e:
+                if self.eof:
+                    raise ApplicationError("Invalid JSON: {}".format(e), "E400", 400)
+            self._check_size(len(self.buffer) - self.pos)
+            minimum = 2 * (len(self.buffer) - self.pos) + self.read_size
+            if self.max_item_size is not None:
+                minimum = min(minimum, self.max_item_size + 1)
+            self.fill(minimum)
+
+    def _check_size(self, size):
+        if self.max_item_size is not None and size > self.max_item_size:
+            raise ApplicationError("Invalid JSON: an array element is longer than {} characters".format(
+                self.max_item_size), "E400", 400)
+
+
+def iter_json_array(stream, read_size=READ_SIZE, max_item_size=None):
+    """Yields the elements of a JSON array read from a byte stream, holding only the current element in memory."""
+    reader = _Reader(stream, read_size, max_item_size)
+    if reader.peek() != '[':
+        raise ApplicationError("Invalid JSON: expected an array", "E400", 400)
+    reader.pos += 1
+    if reader.peek() == ']':
+        reader.pos += 1
+    else:
+        while True:
+            yield reader.value()
+            separator = reader.peek()
+            reader.pos += 1
+            if separator == ']':
+                break
+            if separator != ',':
+                raise ApplicationError("Invalid JSON: expected ',' or ']' in array", "E400", 400)
+    if reader.peek() is not None:
+        raise ApplicationError("Invalid JSON: unexpected data after array", "E400", 400)
+
+
+def iter_ndjson(stream, max_item_size=None):
+    """Yields the value on each non-blank line of a newline delimited JSON byte stream."""
+    # Lines are read at most max_item_size + 1 bytes at a time, so a line without an end isn't buffered whole
+    limit = None if max_item_size is None else max_item_size + 1
+    for number, line in enumerate(iter(lambda: stream.readline(limit), b''), 1):
+        if max_item_size is not None and len(line.rstrip(b'\r\n')) > max_item_size:
+            raise ApplicationError("Invalid JSON on line {}: longer than {} bytes".format(number, max_item_size),
+                                   "E400", 400)
+        if len(line.strip()) == 0:
+            continue
+        try:
+            yield json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            raise ApplicationError("Invalid JSON on line {}: {}".format(number, e), "E400", 400)
+
+
+def iter_chunks(iterable, size):
+    """Yields lists of up to size consecutive values from iterable."""
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
@@ -1,7 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from jsonschema import Draft4Validator
 from register.app import app
+from register.dependencies.http import CircuitBreaker, CircuitOpenError, PooledSession
+from register.exceptions import ApplicationError
+from register.extensions import crypto
+from register.utilities.cache import LRUCache
+from register.utilities.canonical import canonical_json
 from flask import g
+import hashlib
 import json
+import os
+import requests
+import threading
 
 RECORD_SCHEMA = {
     "type": "object",
@@ -19,15 +29,56 @@ LIST_OF_RECORDS_SCHEMA = {
     "items": RECORD_SCHEMA
 }
 
+# Calls to the validation API share one keep-alive session and one bounded thread pool per process
+validation_session = PooledSession()
+validation_breaker = CircuitBreaker('validation-api', app.config['VALIDATION_BREAKER_THRESHOLD'],
+                                    app.config['VALIDATION_BREAKER_RESET'])
+# Validation passes by content hash, validation URI and VALIDATION_VERSION. Failures aren't cached.
+validation_cache = LRUCache('validation', app.config['VALIDATION_CACHE_SIZE'])
+_executor_lock = threading.Lock()
+_executor = None
+_executor_pid = None
 
-def _check_for_errors(data, schema):
-    validator = Draft4Validator(schema)
+
+def _validation_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=app.config['VALIDATION_CONCURRENCY'])
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _item_schema():
+    # The register's item schema: ITEM_SCHEMA if given, otherwise an object with the key field required and, with
+    # ITEM_SCHEMA_CLOSED, no fields beyond those listed in the register record. The validation API applies the rest.
+    if app.config['ITEM_SCHEMA'] is not None:
+        with open(app.config['ITEM_SCHEMA']) as schema_file:
+            return json.load(schema_file)
+    schema = {
+        "type": "object",
+        "required": [app.config['REGISTER_KEY_FIELD']]
+    }
+    if app.config['ITEM_SCHEMA_CLOSED']:
+        with open(app.config['REGISTER_RECORD']) as record_file:
+            fields = json.load(record_file)['fields']
+        schema["properties"] = {field: {} for field in fields}
+        schema["additionalProperties"] = False
+    return schema
+
+
+# Schemas are compiled once, when the app starts
+RECORD_VALIDATOR = Draft4Validator(RECORD_SCHEMA)
+LIST_OF_RECORDS_VALIDATOR = Draft4Validator(LIST_OF_RECORDS_SCHEMA)
+ITEM_VALIDATOR = Draft4Validator(_item_schema()) if app.config['LOCAL_VALIDATION'] else None
+
+
+def _check_for_errors(data, validator):
     errors = []
     for error in validator.iter_errors(data):
         # TODO(do we want to nicify these?)
         path = "$"
-        while len(error.path) > 0:
-            item = error.path.popleft()
+        for item in error.path:
             if isinstance(item, int):  # This is an assumption!
                 path += "[" + str(item) + "]"
             else:
@@ -44,35 +95,138 @@ def _check_for_errors(data, schema):
     return errors if len(errors) > 0 else None
 
 
-def get_envelope_errors(data):
-    app.logger.info("Validate envelope")
-    return _check_for_errors(data, RECORD_SCHEMA)
-
-
-def get_item_errors(data):
-    app.logger.info("Validate item")
+def get_local_item_errors(data):
+    # Checks the item against the compiled item schema, without calling the validation API
     if app.config['REGISTER_KEY_FIELD'] not in data:
         return [{
             'location': '$.',
             'error': 'Key field ({}) is missing'.format(app.config['REGISTER_KEY_FIELD'])
         }]
+    if ITEM_VALIDATOR is not None:
+        return _check_for_errors(data, ITEM_VALIDATOR)
+    return None
 
-    errors = None
 
+def get_envelope_errors(data):
+    app.logger.info("Validate envelope")
+    return _check_for_errors(data, RECORD_VALIDATOR)
+
+
+def _content_hash(data):
+    # Calculated rather than taken from item-hash, which POST /records doesn't check
+    return hashlib.sha256(canonical_json(data).encode('utf-8')).hexdigest()
+
+
+def _post_to_validation_api(validation_uri, data, trace_id):
+    try:
+        validation_breaker.before_call()
+    except CircuitOpenError as e:
+        raise ApplicationError(str(e), "E503", 503)
+
+    session = validation_session.get(app.config['VALIDATION_CONCURRENCY'])
+    try:
+        response = session.post(validation_uri, data=canonical_json(data),
+                                headers={'Content-Type': 'application/json', 'X-Trace-ID': trace_id},
+                                timeout=app.config['VALIDATION_TIMEOUT'])
+    except requests.RequestException:
+        validation_breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        validation_breaker.record_failure()
+    else:
+        validation_breaker.record_success()
+    return response
+
+
+def _get_remote_item_errors(data, trace_id):
+    errors = None
     validation_uri = "{}/{}".format(app.config['VALIDATION_BASE_URI'],
                                     app.config['VALIDATION_ENDPOINT'])
     if validation_uri is not None:
+        cache_key = (_content_hash(data), validation_uri, app.config['VALIDATION_VERSION'])
+        if validation_cache.get(cache_key):
+            app.logger.info("Item previously validated successfully")
+            return None
+
         app.logger.info("Call validation-api")
-        response = g.requests.post(validation_uri, data=json.dumps(data), headers={'Content-Type': 'application/json'})
+        response = _post_to_validation_api(validation_uri, data, trace_id)
         if response.status_code != 200:
             app.logger.warning("Item validation failed")
             errors = json.loads(response.content.decode())
         else:
             app.logger.info("Item validated successfully")
+            validation_cache.put(cache_key, True)
     else:
         app.logger.warning("No validation api configured")
     return errors
 
 
+def get_item_errors(data):
+    app.logger.info("Validate item")
+    errors = get_local_item_errors(data)
+    if errors is not None:
+        return errors
+    return _get_remote_item_errors(data, g.trace_id)
+
+
+def get_batch_item_errors(item_list, first_index=0):
+    # Validates the item in each record of an (envelope-valid) list, returning errors in the same form as POST /records
+    # Every item is checked locally first, then those that pass are sent to the validation API concurrently,
+    # VALIDATION_CONCURRENCY at a time across the process
+    app.logger.info("Validate %d items", len(item_list))
+    results = [get_local_item_errors(record['item']) for record in item_list]
+    remote = [index for index, item_errors in enumerate(results) if item_errors is None]
+    trace_id = g.trace_id
+    if len(remote) > 1:
+        remote_results = _validation_executor().map(
+            lambda index: _get_remote_item_errors(item_list[index]['item'], trace_id), remote)
+    else:
+        remote_results = [_get_remote_item_errors(item_list[index]['item'], trace_id) for index in remote]
+    for index, item_errors in zip(remote, remote_results):
+        results[index] = item_errors
+
+    errors = []
+    for index, item_errors in enumerate(results, first_index):
+        if item_errors is not None:
+            errors.append({
+                "error": "Item {} is invalid".format(index),
+                "details": item_errors
+            })
+    return errors
+
+
+def get_batch_signature_errors(record_list, first_index=0):
+    # Checks the signature of each record in an (envelope-valid) list when VERIFY_BATCH_SIGNATURES is set
+    if not app.config['VERIFY_BATCH_SIGNATURES']:
+        return []
+    results = crypto.validate_signatures([
+        (canonical_json(record['item']), record['item-signature'], record['item-hash'])
+        for record in record_list
+    ])
+    errors = []
+    for index, (valid, message) in enumerate(results, first_index):
+        if not valid:
+            errors.append({
+                "error": "Item {} signature check failure".format(index),
+                "details": message
+            })
+    return errors
+
+
+def get_chunk_errors(record_list, first_index):
+    # Validates part of a streamed list, numbering errors by position in the whole list
+    errors = []
+    for index, record in enumerate(record_list, first_index):
+        record_errors = get_envelope_errors(record)
+        if record_errors is not None:
+            errors.append({
+                "error": "Record {} is invalid".format(index),
+                "details": record_errors
+            })
+    if len(errors) > 0:
+        return errors
+    return get_batch_item_errors(record_list, first_index) + get_batch_signature_errors(record_list, first_index)
+
+
 def get_list_errors(data):
-    return _check_for_errors(data, LIST_OF_RECORDS_SCHEMA)
+    return _check_for_errors(data, LIST_OF_RECORDS_VALIDATOR)
@@ -1,9 +1,9 @@
 from flask import Blueprint, Response, current_app, request
 from register.utilities.data.connection import start, commit
 from register.pagination import paginated_resource
-from register.utilities.data.queries import read_entries, count_entries, republish_entry
+from register.utilities.data.queries import read_entries, count_entries, republish_entry_batch
 from register.exceptions import ApplicationError
-import json
+from register.utilities.json_backend import dumps
 
 entries = Blueprint('entries', __name__)
 
@@ -21,7 +21,7 @@ def get_entries(page):
     finally:
         commit(cursor)
     current_app.logger.info("Returning %d entries", len(entry_list))
-    return Response(json.dumps(entry_list), mimetype='application/json')
+    return Response(dumps(entry_list), mimetype='application/json')
 
 
 @entries.route('/republish', methods=['POST'])
@@ -39,15 +39,11 @@ def republish_entries():
     current_app.logger.info(
         "Republishing entries '%s'", payload['entries'])
 
-    result = {"republished_entries": [], "entries_not_found": []}
+    result = republish_entry_batch(payload['entries'], payload['routing_key'])
 
-    for entry_number in payload['entries']:
-        if republish_entry(entry_number, payload['routing_key']):
-            result['republished_entries'].append(entry_number)
-        else:
-            result['entries_not_found'].append(entry_number)
-
-    if result['entries_not_found']:
+    if result['entries_not_published']:
+        status = 500
+    elif result['entries_not_found']:
         status = 404
     else:
         status = 200
@@ -55,4 +51,4 @@ def republish_entries():
     current_app.logger.info(
         "Republish finished '%s'", result)
 
-    return Response(json.dumps(result), status=status, mimetype='application/json')
+    return Response(dumps(result), status=status, mimetype='application/json')
@@ -1,7 +1,7 @@
 from flask import Blueprint, Response, current_app
 from register.exceptions import ApplicationError
 from register.utilities.data.queries import read_entry
-import json
+from register.utilities.json_backend import dumps
 
 entry = Blueprint('entry', __name__)
 
@@ -15,4 +15,4 @@ def get_entry(entry_number):
         raise ApplicationError("Not found", "E404", 404)
 
     current_app.logger.info("Returning entry")
-    return Response(json.dumps(register_entry), mimetype='application/json')
+    return Response(dumps(register_entry), mimetype='application/json')
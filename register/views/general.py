@@ -1,7 +1,7 @@
 from register.dependencies import postgres
 from flask import request, Blueprint, Response, g
 from flask import current_app
-import json
+from register.utilities.json_backend import dumps
 import datetime
 
 general = Blueprint('general', __name__)
@@ -9,7 +9,7 @@ general = Blueprint('general', __name__)
 
 @general.route("/health")
 def check_status():
-    return Response(response=json.dumps({
+    return Response(response=dumps({
         "app": current_app.config["APP_NAME"],
         "status": "OK",
         "headers": request.headers.to_list(),
@@ -24,7 +24,7 @@ def cascade_health(str_depth):  # pragma: no cover
     if (depth < 0) or (depth > int(current_app.config.get("MAX_HEALTH_CASCADE"))):
         current_app.logger.error("Cascade depth {} out of allowed range (0 - {})".format(
             depth, current_app.config.get("MAX_HEALTH_CASCADE")))
-        return Response(response=json.dumps({
+        return Response(response=dumps({
             "app": current_app.config.get("APP_NAME"),
             "cascade_depth": str_depth,
             "status": "ERROR",
@@ -110,4 +110,4 @@ def cascade_health(str_depth):  # pragma: no cover
         response_json['status'] = "BAD"
     else:
         response_json['status'] = "OK"
-    return Response(response=json.dumps(response_json), mimetype='application/json', status=overall_status)
+    return Response(response=dumps(response_json), mimetype='application/json', status=overall_status)
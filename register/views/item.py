@@ -2,7 +2,7 @@ from flask import Blueprint, Response
 from register.app import app
 from register.exceptions import ApplicationError
 from register.utilities.data.queries import read_item, read_item_entries
-import json
+from register.utilities.json_backend import dumps
 
 item = Blueprint('item', __name__)
 
@@ -15,7 +15,7 @@ def get_item(item_hash):
         app.logger.warning("Item %s not found", item_hash)
         raise ApplicationError("Not found", "E404", 404)
     app.logger.info("Returning item")
-    return Response(json.dumps(item_data), status=200, mimetype='application/json')
+    return Response(dumps(item_data), status=200, mimetype='application/json')
 
 
 @item.route('/<item_hash>/entries', methods=['GET'])
@@ -26,4 +26,4 @@ def get_item_entries(item_hash):
         app.logger.warning("Item %s not found", item_hash)
         raise ApplicationError("Not found", "E404", 404)
     app.logger.info("Returning item entries")
-    return Response(json.dumps(item_data), status=200, mimetype='application/json')
+    return Response(dumps(item_data), status=200, mimetype='application/json')
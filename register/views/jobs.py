@@ -0,0 +1,52 @@
+from flask import Blueprint, Response, request, current_app, url_for
+from register.exceptions import ApplicationError
+from register.utilities.data.connection import start, commit, rollback
+from register.utilities.data.jobs import create_job, read_job
+from register.utilities.jobs import job_worker
+from register.utilities.validation import get_list_errors
+from register.utilities.json_backend import dumps
+import uuid
+
+jobs = Blueprint('jobs', __name__)
+
+
+@jobs.route('', methods=['POST'])
+def add_job():
+    # Takes the same list of already minted items as POST /records, but only checks the envelopes before returning.
+    # The items are validated and appended by the job worker; poll GET /jobs/<job_id> for the outcome.
+    current_app.audit_logger.info("Add ingest job")
+    payload = request.get_json()
+    list_errors = get_list_errors(payload)
+    if list_errors is not None:
+        current_app.logger.warning("There were validation errors")
+        return Response(dumps([{
+            "error": "List is invalid",
+            "details": list_errors
+        }]), status=400, headers={'Content-Type': 'application/json'})
+
+    job_id = uuid.uuid4().hex
+    cursor = start()
+    try:
+        create_job(cursor, job_id, payload)
+        commit(cursor)
+    except Exception:
+        rollback(cursor)
+        raise
+    job_worker.notify()
+    current_app.logger.info("Ingest job %s created", job_id)
+    return Response(dumps({"job-id": job_id}), status=202, mimetype='application/json',
+                    headers={'Location': url_for('jobs.get_job', job_id=job_id)})
+
+
+@jobs.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    current_app.logger.info("Get ingest job %s", job_id)
+    cursor = start()
+    try:
+        job = read_job(cursor, job_id)
+    finally:
+        commit(cursor)
+    if job is None:
+        current_app.logger.warning("Ingest job %s not found", job_id)
+        raise ApplicationError("Not found", "E404", 404)
+    return Response(dumps(job), status=200, mimetype='application/json')
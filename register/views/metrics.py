@@ -0,0 +1,27 @@
+from flask import Blueprint, Response, current_app
+from register.dependencies.rabbitmq import compression_stats
+from register.exceptions import ApplicationError
+from register.utilities.cache import caches
+from register.utilities.json_backend import dumps
+
+metrics = Blueprint('metrics', __name__)
+
+
+@metrics.route('', methods=['GET'])
+def get_metrics():
+    current_app.logger.info("Get metrics")
+    return Response(dumps({
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+        "message-compression": compression_stats.stats()
+    }), mimetype='application/json')
+
+
+@metrics.route('/caches/<name>', methods=['DELETE'])
+def clear_cache(name):
+    # For when the rules behind a cache change, e.g. new validation rules deployed without a VALIDATION_VERSION bump
+    if name not in caches:
+        current_app.logger.warning("Cache %s not found", name)
+        raise ApplicationError("Not found", "E404", 404)
+    current_app.audit_logger.info("Clear cache %s", name)
+    caches[name].clear()
+    return Response(status=204)
@@ -5,8 +5,9 @@ from flask import current_app
 from register.utilities.data.merkle_data import MerkleData
 from register.exceptions import ApplicationError
 from register.utilities.data.connection import start, commit
+from register.utilities.data.tree_head import TIMESTAMP_FORMAT, read_latest_tree_head, read_tree_head
 from register.utilities.merkle_tree import MerkleTree
-import json
+from register.utilities.json_backend import dumps
 
 proof = Blueprint('proof', __name__)
 
@@ -20,22 +21,55 @@ def get_register_proof(proof_identifier):
 
     cursor = start()
     try:
-        mtree_data = MerkleData(cursor)
-        mtree = MerkleTree(mtree_data)
-
-        result = {
-            "proof-identifier": "merkle:sha-256",
-            "tree-size": mtree.tree_size(),
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'),
-            "root-hash": "sha-256:" + b16encode(mtree.root_hash()).decode(),
-            "tree-head-signature": "TODO"  # TODO(signature)
-        }
+        # The latest recorded head is current unless entries were appended without one (e.g. before the frontier
+        # was built), in which case the head comes from the tree and is unsigned
+        head = read_latest_tree_head(cursor)
+        if head is not None and head['tree_size'] == head['latest_entry_number']:
+            result = _tree_head_result(head)
+        else:
+            tree_size, root_hash = MerkleTree(MerkleData(cursor)).tree_head()
+            result = {
+                "proof-identifier": "merkle:sha-256",
+                "tree-size": tree_size,
+                "timestamp": datetime.now().strftime(TIMESTAMP_FORMAT),
+                "root-hash": "sha-256:" + b16encode(root_hash).decode(),
+                "tree-head-signature": None
+            }
         current_app.logger.info("Returning register proof")
-        return Response(json.dumps(result), mimetype='application/json')
+        return Response(dumps(result), mimetype='application/json')
+    finally:
+        commit(cursor)
+
+
+@proof.route('/register/<tree_size>/<proof_identifier>', methods=['GET'])
+def get_historical_register_proof(tree_size, proof_identifier):
+    current_app.logger.info("Get register proof for tree size %s", str(tree_size))
+    if proof_identifier != 'merkle:sha-256':
+        current_app.logger.warning("Invalid proof identifier supplied: %s", proof_identifier)
+        raise ApplicationError("Invalid proof identifier", "E400", 400)
+
+    cursor = start()
+    try:
+        head = read_tree_head(cursor, int(tree_size))
+        if head is None:
+            current_app.logger.warning("No tree head recorded for tree size %s", str(tree_size))
+            raise ApplicationError("Not found", "E404", 404)
+        current_app.logger.info("Returning register proof for tree size %s", str(tree_size))
+        return Response(dumps(_tree_head_result(head)), mimetype='application/json')
     finally:
         commit(cursor)
 
 
+def _tree_head_result(head):
+    return {
+        "proof-identifier": "merkle:sha-256",
+        "tree-size": head['tree_size'],
+        "timestamp": head['timestamp'].strftime(TIMESTAMP_FORMAT),
+        "root-hash": "sha-256:" + head['root_hash'],
+        "tree-head-signature": head['signature']
+    }
+
+
 @proof.route('/entry/<entry_number>/<total_entries>/<proof_identifier>', methods=['GET'])
 def get_entry_proof(entry_number, total_entries, proof_identifier):
     current_app.logger.info("Get entry proof for entry %s of %s", str(entry_number), str())
@@ -60,7 +94,7 @@ def get_entry_proof(entry_number, total_entries, proof_identifier):
             result['merkle-audit-path'].append("sha-256:" + b16encode(item).decode())
 
         current_app.logger.info("Return entry proof (path length %d)", len(result['merkle-audit-path']))
-        return Response(json.dumps(result), mimetype='application/json')
+        return Response(dumps(result), mimetype='application/json')
 
     finally:
         commit(cursor)
@@ -91,7 +125,7 @@ def get_consistency_proof(total_entries_1, total_entries_2, proof_identifier):
             result['merkle-consistency-nodes'].append("sha-256:" + b16encode(item).decode())
 
         current_app.logger.info("Return consistency proof (%d nodes)", len(result['merkle-consistency-nodes']))
-        return Response(json.dumps(result), mimetype='application/json')
+        return Response(dumps(result), mimetype='application/json')
 
     finally:
         commit(cursor)
@@ -1,5 +1,5 @@
 from flask import Blueprint, Response, current_app
-import json
+from register.utilities.json_backend import dumps
 
 proofs = Blueprint('proofs', __name__)
 
@@ -7,4 +7,4 @@ proofs = Blueprint('proofs', __name__)
 @proofs.route('', methods=['GET'])
 def get_proofs():
     current_app.logger.info("Get available proofs")
-    return Response(json.dumps(['merkle:sha-256']), mimetype='application/json')
+    return Response(dumps(['merkle:sha-256']), mimetype='application/json')
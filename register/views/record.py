@@ -1,11 +1,16 @@
-import json
-
+import psycopg2
 from flask import Blueprint, Response, request, current_app
 from flask_negotiate import consumes
+from register.backpressure import admission_control
 from register.exceptions import ApplicationError
 from register.extensions import crypto
+from register.idempotency import idempotency_key, body_hash, replays_stored_responses, remember_response, \
+    replay_after_conflict
+from register.utilities.canonical import CanonicalItem, canonical_json
 from register.utilities.data.queries import read_record_by_field_value, read_record_entries, insert_item
+from register.utilities.group_commit import group_committer
 from register.utilities.validation import get_envelope_errors, get_item_errors
+from register.utilities.json_backend import dumps
 
 record = Blueprint('record', __name__)
 
@@ -18,7 +23,7 @@ def get_record(field_value):
         current_app.logger.warning("Record with field value %s not found", field_value)
         raise ApplicationError("Not found", "E404", 404)
     current_app.logger.info("Return record")
-    return Response(json.dumps(result), mimetype='application/json')
+    return Response(dumps(result), mimetype='application/json')
 
 
 @record.route('/<field_value>/entries', methods=['GET'])
@@ -29,14 +34,20 @@ def get_record_entries(field_value):
         current_app.logger.warning("Record with field value %s not found", field_value)
         raise ApplicationError("Not found", "E404", 404)
     current_app.logger.info("Return record entries")
-    return Response(json.dumps(result), mimetype='application/json')
+    return Response(dumps(result), mimetype='application/json')
 
 
 @record.route('', methods=['POST'])
 @consumes('application/json')
+@replays_stored_responses
+@admission_control
 def add_item():
     # There's no POST stuff currently in the spec. This one takes an already minted item
     current_app.audit_logger.info("Add record to register")
+    key = idempotency_key()
+    if key is not None:
+        request_hash = body_hash(request.get_data())
+
     payload = request.get_json()
 
     errors = []
@@ -48,7 +59,8 @@ def add_item():
         })
     else:
         # Only check signature is envelope ok since may not have correct fields
-        json_string = json.dumps(payload['item'], sort_keys=True, separators=(',', ':'))
+        payload['item'] = CanonicalItem(payload['item'])
+        json_string = canonical_json(payload['item'])
         valid, message = crypto.validate_signature(json_string, payload['item-signature'], payload['item-hash'])
         if not valid:
             errors.append({
@@ -66,12 +78,29 @@ def add_item():
 
     if len(errors) > 0:
         current_app.logger.warning("Record failed validation")
-        return Response(json.dumps(errors), status=400, headers={'Content-Type': 'application/json'})
+        return Response(dumps(errors), status=400, headers={'Content-Type': 'application/json'})
 
     else:
-        entry_number = insert_item(payload['item'], payload['item-hash'], payload['item-signature'])
-        headers = {
-            'Location': '/entry/{}'.format(entry_number)
-        }
+        if key is not None:
+            # The stored response has to commit with the entry, so keyed requests don't join a group commit
+            try:
+                entry_number = insert_item(payload['item'], payload['item-hash'], payload['item-signature'],
+                                           remember_response(key, request_hash, 202, _render_added))
+            except psycopg2.IntegrityError:
+                replayed = replay_after_conflict(key, request_hash)
+                if replayed is None:
+                    raise
+                return replayed
+        elif current_app.config['GROUP_COMMIT_WINDOW_MS'] > 0:
+            entry_number = group_committer.insert(payload['item'], payload['item-hash'], payload['item-signature'],
+                                                  current_app.config['GROUP_COMMIT_WINDOW_MS'] / 1000.0,
+                                                  current_app.config['GROUP_COMMIT_MAX_SIZE'])
+        else:
+            entry_number = insert_item(payload['item'], payload['item-hash'], payload['item-signature'])
+        body, headers = _render_added(entry_number)
         current_app.audit_logger.info("Added new entry number %s", str(entry_number))
-        return Response(json.dumps({'entry_number': entry_number}), status=202, headers=headers)
+        return Response(body, status=202, headers=headers)
+
+
+def _render_added(entry_number):
+    return dumps({'entry_number': entry_number}), {'Location': '/entry/{}'.format(entry_number)}
@@ -1,8 +1,20 @@
+import psycopg2
+import tempfile
 from flask import Blueprint, Response, request, current_app
+from register.backpressure import admission_control
+from register.idempotency import idempotency_key, body_hash, replays_stored_responses, remember_response, \
+    replay_after_conflict, HashingStream
 from register.pagination import paginated_resource
-from register.utilities.data.queries import read_all_records, read_records_by_attribute, insert_items
-from register.utilities.validation import get_list_errors, get_item_errors
-import json
+from register.utilities.canonical import canonical_records, message_json
+from register.utilities.data.connection import start, commit, rollback
+from register.utilities.data.idempotency import store_response
+from register.utilities.data.queries import read_all_records, read_records_by_attribute, insert_items, \
+    insert_items_bulk, insert_items_bulk_in_transaction
+from register.utilities.outbox import outbox_dispatcher
+from register.utilities.streaming import iter_json_array, iter_ndjson, iter_chunks
+from register.utilities.validation import get_list_errors, get_batch_item_errors, get_batch_signature_errors, \
+    get_chunk_errors
+from register.utilities.json_backend import dumps
 
 records = Blueprint('records', __name__)
 
@@ -14,7 +26,7 @@ def get_records(page):
     data, count = read_all_records(page.start, page.limit)
     page.set_count(count)
     current_app.logger.info("Return %d records", len(data))
-    return Response(json.dumps(data), mimetype='application/json')
+    return Response(dumps(data), mimetype='application/json')
 
 
 @records.route('/<field_name>/<field_value>')
@@ -22,13 +34,24 @@ def get_records_by_field_value(field_name, field_value):
     current_app.logger.info("Get records by %s = %s", field_name, field_value)
     data = read_records_by_attribute(field_name, field_value)
     current_app.logger.info("Return %d records", len(data))
-    return Response(json.dumps(data), mimetype='application/json')
+    return Response(dumps(data), mimetype='application/json')
 
 
 @records.route('', methods=['POST'])
+@replays_stored_responses
+@admission_control
 def add_items():
     # There's no POST stuff currently in the spec. This one takes a list of already minted items
     current_app.audit_logger.info("Add multiple items")
+    if request.mimetype == 'application/x-ndjson':
+        return _add_items_streamed(iter_ndjson)
+    if current_app.config['STREAM_INGEST']:
+        return _add_items_streamed(iter_json_array)
+
+    key = idempotency_key()
+    if key is not None:
+        request_hash = body_hash(request.get_data())
+
     payload = request.get_json()
     errors = []
     list_errors = get_list_errors(payload)
@@ -38,18 +61,75 @@ def add_items():
             "details": list_errors
         })
     else:
-        for index, item in enumerate(payload):
-            item_errors = get_item_errors(item['item'])
-            if item_errors is not None:
-                errors.append({
-                    "error": "Item {} is invalid".format(index),
-                    "details": item_errors
-                })
+        canonical_records(payload)
+        errors.extend(get_batch_item_errors(payload))
+        errors.extend(get_batch_signature_errors(payload))
 
     if len(errors) > 0:
         current_app.logger.warning("There were validation errors")
-        return Response(json.dumps(errors), status=400, headers={'Content-Type': 'application/json'})
+        return Response(dumps(errors), status=400, headers={'Content-Type': 'application/json'})
+
+    before_commit = None
+    if key is not None:
+        before_commit = remember_response(key, request_hash, 202, lambda result: (dumps(result), None))
+    try:
+        if current_app.config['BULK_INGEST']:
+            resp = insert_items_bulk(payload, before_commit)
+        else:
+            resp = insert_items(payload, before_commit)
+    except psycopg2.IntegrityError:
+        # A concurrent request with the same key committed first
+        replayed = replay_after_conflict(key, request_hash) if key is not None else None
+        if replayed is None:
+            raise
+        return replayed
+    current_app.logger.info("Items added to register")
+    return Response(dumps(resp), status=202)
+
+
+def _add_items_streamed(parse):
+    # Validates the records STREAM_INGEST_CHUNK_SIZE at a time as they are parsed and spools them to a temporary
+    # file, so only one chunk is held in memory. Appending takes the append lock, which blocks every other writer, so
+    # nothing is written until the whole body has been read and validated; the spooled records are then appended in
+    # one transaction.
+    chunk_size = int(current_app.config['STREAM_INGEST_CHUNK_SIZE'])
+    max_item_size = int(current_app.config['STREAM_MAX_ITEM_SIZE'])
+    stream = request.stream
+    key = idempotency_key()
+    if key is not None:
+        stream = HashingStream(stream)
+    with tempfile.TemporaryFile() as spool:
+        count = 0
+        for chunk in iter_chunks(parse(stream, max_item_size=max_item_size), chunk_size):
+            errors = get_chunk_errors(canonical_records(chunk), count)
+            if len(errors) > 0:
+                current_app.logger.warning("There were validation errors")
+                return Response(dumps(errors), status=400, headers={'Content-Type': 'application/json'})
+            for record in chunk:
+                spool.write(message_json(record).encode('utf-8') + b'\n')
+            count += len(chunk)
+        current_app.logger.info("%d items validated", count)
+        spool.seek(0)
 
-    resp = insert_items(payload)
+        resp = []
+        cursor = start()
+        try:
+            for chunk in iter_chunks(iter_ndjson(spool), chunk_size):
+                resp.extend(insert_items_bulk_in_transaction(cursor, canonical_records(chunk)))
+                current_app.logger.info("%d items written", len(resp))
+            if key is not None:
+                store_response(cursor, key, stream.hexdigest(), 202, None, dumps(resp),
+                               current_app.config['IDEMPOTENCY_TTL'])
+            commit(cursor)
+        except psycopg2.IntegrityError:
+            rollback(cursor)
+            replayed = replay_after_conflict(key, stream.hexdigest()) if key is not None else None
+            if replayed is None:
+                raise
+            return replayed
+        except Exception:
+            rollback(cursor)
+            raise
+    outbox_dispatcher.notify()
     current_app.logger.info("Items added to register")
-    return Response(json.dumps(resp), status=202)
+    return Response(dumps(resp), status=202)
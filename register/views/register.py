@@ -3,6 +3,7 @@ from register.utilities.data.connection import start, commit
 from register.app import app
 from register.utilities.data.queries import count_all_records, count_entries, count_items, get_lastest_update
 import json
+from register.utilities.json_backend import dumps
 
 register_blueprint = Blueprint('register', __name__)
 
@@ -21,6 +22,6 @@ def get_register():
             "total-items": count_items(cursor),
             "total-records": count_all_records(cursor)
         }
-        return Response(json.dumps(response_data), mimetype='application/json')
+        return Response(dumps(response_data), mimetype='application/json')
     finally:
         commit(cursor)
@@ -0,0 +1,84 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from register.backpressure import QueueDepthMonitor, queue_monitor
+from register.main import app
+from register.utilities.jobs import process_job
+
+RECORDS = [{"item": {"local-land-charge": 1}, "item-hash": "sha-256:aa", "item-signature": "sig"}]
+
+
+@patch.dict(app.config, {'BACKPRESSURE_QUEUES': ['search'], 'BACKPRESSURE_MAX_DEPTH': 100,
+                         'BACKPRESSURE_RETRY_AFTER': 30, 'BACKPRESSURE_SAMPLE_INTERVAL': 5})
+class TestBackpressure(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        queue_monitor._sampled_at = None
+        queue_monitor._depths = {}
+
+    def tearDown(self):
+        queue_monitor._sampled_at = None
+        queue_monitor._depths = {}
+
+    @patch('register.views.records.insert_items')
+    @patch('register.backpressure.get_queue_count')
+    def test_post_records_refused(self, mock_count, mock_insert):
+        mock_count.return_value = 101
+        response = self.app.post('/records', data=json.dumps(RECORDS), headers={'Content-Type': 'application/json'})
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('30', response.headers['Retry-After'])
+        self.assertEqual('E503', json.loads(response.data.decode())['error_code'])
+        mock_insert.assert_not_called()
+
+    @patch('register.views.record.insert_item')
+    @patch('register.backpressure.get_queue_count')
+    def test_post_record_refused(self, mock_count, mock_insert):
+        mock_count.return_value = 101
+        response = self.app.post('/record', data=json.dumps(RECORDS[0]), headers={'Content-Type': 'application/json'})
+        self.assertEqual(503, response.status_code)
+        mock_insert.assert_not_called()
+
+    @patch('register.backpressure.time')
+    @patch('register.backpressure.get_queue_count')
+    def test_sampled_on_interval(self, mock_count, mock_time):
+        monitor = QueueDepthMonitor()
+        mock_count.return_value = 50
+        mock_time.monotonic.return_value = 100
+        self.assertIsNone(monitor.overloaded_queue())
+        mock_count.return_value = 150
+        mock_time.monotonic.return_value = 104
+        self.assertIsNone(monitor.overloaded_queue())
+        mock_time.monotonic.return_value = 105
+        self.assertEqual('search', monitor.overloaded_queue())
+        self.assertEqual(2, mock_count.call_count)
+
+    @patch('register.backpressure.get_queue_count')
+    def test_unknown_depth_admits(self, mock_count):
+        mock_count.side_effect = IOError("No broker")
+        self.assertIsNone(QueueDepthMonitor().overloaded_queue())
+
+    @patch('register.utilities.jobs.time')
+    @patch('register.utilities.jobs.queue_monitor')
+    @patch('register.utilities.jobs.touch_job')
+    @patch('register.utilities.jobs.finish_job')
+    @patch('register.utilities.jobs.store_job_entries')
+    @patch('register.utilities.jobs.insert_items_bulk_in_transaction')
+    @patch('register.utilities.jobs.lock_job_progress')
+    @patch('register.utilities.jobs.get_batch_item_errors')
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_job_waits(self, mock_start, mock_commit, mock_claim, mock_errors, mock_progress, mock_insert, mock_store,
+                       mock_finish, mock_touch, mock_monitor, mock_time):
+        mock_claim.return_value = {'job_id': 'abc', 'processed_count': 0, 'items': RECORDS}
+        mock_errors.return_value = []
+        mock_progress.return_value = 0
+        mock_monitor.overloaded_queue.side_effect = ['search', 'search', None]
+        with app.app_context():
+            process_job(10, 600)
+        # Once after validating, then while waiting
+        self.assertEqual(3, mock_touch.call_count)
+        self.assertEqual(2, mock_time.sleep.call_count)
+        mock_insert.assert_called_once_with(mock_start.return_value, RECORDS)
@@ -0,0 +1,36 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from register.utilities.canonical import CanonicalItem, canonical_json, canonical_records, message_json
+
+ITEM = {"local-land-charge": 1, "geometry": {"type": "Point", "coordinates": [1.5, 2]}, "charge-type": "Café"}
+
+
+class TestCanonical(unittest.TestCase):
+
+    def test_signing_form(self):
+        expected = json.dumps(ITEM, sort_keys=True, separators=(',', ':'))
+        self.assertEqual(expected, canonical_json(ITEM))
+        self.assertEqual(expected, canonical_json(CanonicalItem(ITEM)))
+
+    @patch('register.utilities.canonical._encode')
+    def test_encoded_once(self, mock_encode):
+        mock_encode.return_value = '{}'
+        item = CanonicalItem(ITEM)
+        canonical_json(item)
+        canonical_json(item)
+        message_json({"entry-number": 1, "item": item})
+        mock_encode.assert_called_once_with(item)
+
+    def test_message_json(self):
+        message = {"entry-number": 1, "action-type": "NEW", "item": CanonicalItem(ITEM)}
+        self.assertEqual(json.loads(json.dumps(message)), json.loads(message_json(message)))
+        self.assertEqual({"item": ITEM}, json.loads(message_json({"item": CanonicalItem(ITEM)})))
+        self.assertEqual({"a": 1}, json.loads(message_json({"a": 1})))
+
+    def test_canonical_records(self):
+        records = canonical_records([{"item": dict(ITEM)}, {"item": "not an object"}, []])
+        self.assertIsInstance(records[0]['item'], CanonicalItem)
+        self.assertEqual(ITEM, records[0]['item'])
+        self.assertEqual("not an object", records[1]['item'])
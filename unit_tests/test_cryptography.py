@@ -1,7 +1,11 @@
 import unittest
+from unittest.mock import patch, MagicMock
+from concurrent.futures.process import BrokenProcessPool
 from flask import g
 from register import cryptography
 from register.main import app
+from register.utilities.cache import LRUCache
+from register.utilities.validation import get_batch_signature_errors
 
 
 test_payload = '{"thing": "ame"}'
@@ -46,3 +50,115 @@ class TestValidate(unittest.TestCase):
             g.trace_id = 'test'
             self.assertEqual(self.cypto.validate_signature(test_payload, test_sig.replace('0', '2'), test_hash),
                              (False, 'Signature and payload do not match.'))
+
+
+class TestValidateBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cypto = cryptography.CryptographicSigning()
+        self.signed_payloads = [(test_payload, test_sig, "NOTAHASH"),
+                                (test_payload, "NOTASIG", test_hash),
+                                (test_payload, test_sig, "sha-256:MADEUP"),
+                                (test_payload, test_sig.replace('0', '2'), test_hash)] * 3
+
+    def _expected(self):
+        with app.test_request_context():
+            g.trace_id = 'test'
+            return [self.cypto.validate_signature(*signed_payload) for signed_payload in self.signed_payloads]
+
+    def test_in_process(self):
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.assertEqual(self._expected(), self.cypto.validate_signatures(self.signed_payloads))
+
+    @patch('register.cryptography.SIGNATURE_POOL_THRESHOLD', 0)
+    @patch.dict(app.config, {'SIGNATURE_WORKERS': 2})
+    def test_process_pool(self):
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.assertEqual(self._expected(), self.cypto.validate_signatures(self.signed_payloads))
+
+    @patch('register.cryptography.SIGNATURE_POOL_THRESHOLD', 0)
+    @patch.dict(app.config, {'SIGNATURE_WORKERS': 2})
+    @patch('register.cryptography.ProcessPoolExecutor')
+    def test_broken_pool_rebuilt(self, mock_executor):
+        broken = MagicMock()
+        broken.map.side_effect = BrokenProcessPool("A worker died")
+        rebuilt = MagicMock()
+        rebuilt.map.return_value = [[(True, "Signature and payload match.")]]
+        mock_executor.side_effect = [broken, rebuilt]
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.assertEqual([(True, "Signature and payload match.")],
+                             self.cypto.validate_signatures([(test_payload, test_sig, test_hash)]))
+        broken.shutdown.assert_called_once_with(wait=False)
+        self.assertIs(rebuilt, self.cypto._process_pool)
+
+    @patch.dict(app.config, {'VERIFY_BATCH_SIGNATURES': True})
+    @patch('register.utilities.validation.crypto')
+    def test_batch_signature_errors(self, mock_crypto):
+        mock_crypto.validate_signatures.return_value = [(True, "Signature and payload match."),
+                                                        (False, "Signature and payload do not match.")]
+        records = [{"item": {"b": 1, "a": 2}, "item-signature": "rs256:0", "item-hash": "sha-256:0"},
+                   {"item": {"a": 3}, "item-signature": "rs256:1", "item-hash": "sha-256:1"}]
+        self.assertEqual([{"error": "Item 6 signature check failure",
+                           "details": "Signature and payload do not match."}],
+                         get_batch_signature_errors(records, 5))
+        self.assertEqual([('{"a":2,"b":1}', "rs256:0", "sha-256:0"), ('{"a":3}', "rs256:1", "sha-256:1")],
+                         mock_crypto.validate_signatures.call_args[0][0])
+
+
+class TestSignatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cypto = cryptography.CryptographicSigning()
+        self.cypto.cyptosign_validate = MagicMock()
+        self.cypto.cyptosign_validate.verify.return_value = True
+        self.cypto.signature_cache = LRUCache('test-signatures', 10)
+
+    @patch.dict('register.utilities.cache.caches')
+    def test_init_app_builds_verifier(self):
+        cypto = cryptography.CryptographicSigning(app)
+        self.assertIsNotNone(cypto.cyptosign_validate)
+        self.assertEqual(app.config['SIGNATURE_CACHE_SIZE'], cypto.signature_cache.maxsize)
+
+    def test_repeat_skips_verify(self):
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.assertEqual((True, "Signature and payload match."),
+                             self.cypto.validate_signature(test_payload, test_sig, test_hash))
+            self.assertEqual((True, "Signature and payload match."),
+                             self.cypto.validate_signature(test_payload, test_sig, test_hash))
+            self.assertEqual([(True, "Signature and payload match.")] * 2,
+                             self.cypto.validate_signatures([(test_payload, test_sig, test_hash)] * 2))
+        self.assertEqual(1, self.cypto.cyptosign_validate.verify.call_count)
+        self.assertEqual({"size": 1, "maxsize": 10, "hits": 3, "misses": 1}, self.cypto.signature_cache.stats())
+
+    def test_different_payload_misses(self):
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.cypto.validate_signature(test_payload, test_sig)
+            self.cypto.validate_signature('{"thing": "other"}', test_sig)
+        self.assertEqual(2, self.cypto.cyptosign_validate.verify.call_count)
+
+    def test_failures_not_cached(self):
+        self.cypto.cyptosign_validate.verify.return_value = False
+        with app.test_request_context():
+            g.trace_id = 'test'
+            self.cypto.validate_signature(test_payload, test_sig, test_hash)
+            self.cypto.validate_signature(test_payload, test_sig, test_hash)
+        self.assertEqual(2, self.cypto.cyptosign_validate.verify.call_count)
+
+
+class TestSign(unittest.TestCase):
+
+    def test_unsigned_without_key(self):
+        self.assertIsNone(cryptography.CryptographicSigning().sign('{"tree-size":1}'))
+
+    def test_sign(self):
+        cypto = cryptography.CryptographicSigning()
+        cypto.signer = MagicMock()
+        cypto.signer.sign.return_value = b'signature'
+        self.assertEqual('rs256:c2lnbmF0dXJl', cypto.sign('{"tree-size":1}'))
+        self.assertEqual(cryptography.SHA256.new(b'{"tree-size":1}').digest(),
+                         cypto.signer.sign.call_args[0][0].digest())
@@ -0,0 +1,64 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from register.main import app
+from register.utilities.group_commit import GroupCommitter
+
+
+class TestGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.committer = GroupCommitter()
+
+    def _insert_concurrently(self, count, window, max_size):
+        results = [None] * count
+
+        def insert(index):
+            try:
+                results[index] = self.committer.insert({'local-land-charge': index}, 'hash{}'.format(index),
+                                                       'sig', window, max_size)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=insert, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    @patch('register.utilities.group_commit.insert_item')
+    @patch('register.utilities.group_commit.insert_items_bulk')
+    def test_concurrent_inserts_share_a_transaction(self, mock_bulk, mock_insert):
+        mock_bulk.side_effect = lambda items: [{'item-hash': item['item-hash'],
+                                                'entry-number': 100 + int(item['item-hash'][4:])}
+                                               for item in items]
+        results = self._insert_concurrently(3, 5, 3)
+        self.assertEqual([100, 101, 102], results)
+        mock_bulk.assert_called_once()
+        mock_insert.assert_not_called()
+
+    @patch('register.utilities.group_commit.insert_item')
+    @patch('register.utilities.group_commit.insert_items_bulk')
+    def test_single_insert(self, mock_bulk, mock_insert):
+        mock_insert.return_value = 17
+        self.assertEqual(17, self.committer.insert({'local-land-charge': 1}, 'hash', 'sig', 0.01, 10))
+        mock_bulk.assert_not_called()
+
+    @patch('register.utilities.group_commit.insert_item')
+    @patch('register.utilities.group_commit.insert_items_bulk')
+    def test_failed_group_retried_individually(self, mock_bulk, mock_insert):
+        mock_bulk.side_effect = ValueError("Bad item")
+
+        def insert_item(item, item_hash, item_signature):
+            if item_hash == 'hash1':
+                raise ValueError("Bad item")
+            return 200 + int(item_hash[4:])
+
+        mock_insert.side_effect = insert_item
+        results = self._insert_concurrently(3, 5, 3)
+        self.assertEqual(200, results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(202, results[2])
@@ -0,0 +1,133 @@
+import io
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+import psycopg2
+
+from register.idempotency import HashingStream, body_hash, remember_response
+from register.main import app
+
+RECORDS = [{"item": {"local-land-charge": 343}, "item-hash": "totallyfakehash", "item-signature": "STUFF"}]
+BODY = json.dumps(RECORDS)
+KEY = {'Content-Type': 'application/json', 'Idempotency-Key': 'abc123'}
+
+
+def stored(body, request_hash=None, headers=None):
+    return {
+        'request_hash': request_hash or body_hash(BODY.encode()),
+        'response_status': 202,
+        'response_headers': headers,
+        'response_body': body
+    }
+
+
+class TestIdempotency(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    @patch('register.views.records.insert_items')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_replayed(self, commit, start, mock_read, mock_insert):
+        mock_read.return_value = stored('[{"item-hash": "totallyfakehash", "entry-number": 20}]')
+        response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('true', response.headers['Idempotent-Replayed'])
+        self.assertEqual(20, json.loads(response.data.decode())[0]['entry-number'])
+        self.assertEqual('abc123', mock_read.call_args[0][1])
+        mock_insert.assert_not_called()
+
+    @patch('register.backpressure.queue_monitor')
+    @patch('register.views.records.insert_items')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_replayed_while_busy(self, commit, start, mock_read, mock_insert, mock_monitor):
+        # Writes are being turned away, but a retry of one that committed still gets its response
+        mock_monitor.overloaded_queue.return_value = 'search'
+        mock_read.return_value = stored('[{"item-hash": "totallyfakehash", "entry-number": 20}]')
+        response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('true', response.headers['Idempotent-Replayed'])
+        mock_read.return_value = None
+        response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(503, response.status_code)
+
+    @patch('register.views.record.insert_item')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_replayed_record_location(self, commit, start, mock_read, mock_insert):
+        body = json.dumps(RECORDS[0])
+        mock_read.return_value = stored('{"entry_number": 17}', body_hash(body.encode()), {'Location': '/entry/17'})
+        response = self.app.post('/record', data=body, headers=KEY)
+        self.assertEqual(202, response.status_code)
+        self.assertTrue(response.headers['Location'].endswith('/entry/17'))
+        mock_insert.assert_not_called()
+
+    @patch('register.views.records.insert_items')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_reused_for_different_body(self, commit, start, mock_read, mock_insert):
+        mock_read.return_value = stored('[]', 'somethingelse')
+        response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(422, response.status_code)
+        self.assertEqual('E422', json.loads(response.data.decode())['error_code'])
+        mock_insert.assert_not_called()
+
+    @patch('register.utilities.validation._get_remote_item_errors')
+    @patch('register.views.records.insert_items')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_first_request_stores_response(self, commit, start, mock_read, mock_insert, post):
+        post.return_value = None
+        mock_read.return_value = None
+        mock_insert.return_value = [{'item-hash': 'totallyfakehash', 'entry-number': 20}]
+        with patch.dict(app.config, {'BULK_INGEST': False}):
+            response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(202, response.status_code)
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        before_commit = mock_insert.call_args[0][1]
+        cursor = MagicMock()
+        before_commit(cursor, mock_insert.return_value)
+        params = cursor.execute.call_args[0][1]
+        self.assertEqual('abc123', params['key'])
+        self.assertEqual(body_hash(BODY.encode()), params['hash'])
+        self.assertEqual(20, json.loads(params['body'])[0]['entry-number'])
+
+    @patch('register.utilities.validation._get_remote_item_errors')
+    @patch('register.views.records.insert_items')
+    @patch('register.idempotency.read_stored_response')
+    @patch('register.idempotency.start')
+    @patch('register.idempotency.commit')
+    def test_concurrent_duplicate_replayed(self, commit, start, mock_read, mock_insert, post):
+        post.return_value = None
+        mock_read.side_effect = [None, stored('[{"item-hash": "totallyfakehash", "entry-number": 20}]')]
+        mock_insert.side_effect = psycopg2.IntegrityError()
+        with patch.dict(app.config, {'BULK_INGEST': False}):
+            response = self.app.post('/records', data=BODY, headers=KEY)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('true', response.headers['Idempotent-Replayed'])
+
+    def test_remember_response_headers(self):
+        cursor = MagicMock()
+        before_commit = remember_response('k', 'h', 202, lambda n: ('{}', {'Location': '/entry/{}'.format(n)}))
+        with app.app_context():
+            before_commit(cursor, 5)
+        params = cursor.execute.call_args[0][1]
+        self.assertEqual({'Location': '/entry/5'}, json.loads(params['headers']))
+        self.assertEqual(202, params['status'])
+
+    def test_hashing_stream(self):
+        data = b'{"a": 1}\n{"b": 2}\n  '
+        stream = HashingStream(io.BytesIO(data))
+        stream.read(3)
+        self.assertEqual(body_hash(data), stream.hexdigest())
+        stream = HashingStream(io.BytesIO(data))
+        self.assertEqual(2, len([line for line in stream if line.strip()]))
+        self.assertEqual(body_hash(data), stream.hexdigest())
@@ -5,7 +5,20 @@ from unittest.mock import patch, MagicMock
 from flask import g
 
 from register.main import app
-from register.utilities.data.queries import insert_item_in_transaction
+from register.utilities.canonical import CanonicalItem
+from register.utilities.data.queries import insert_item_in_transaction, insert_items_bulk_in_transaction
+from register.utilities.data.sequencer import next_entry_numbers
+from register.utilities.outbox import dispatch_outbox
+
+# The frontier of a 42 entry tree: subtrees of 32, 8 and 2 leaves
+FRONTIER_42 = [{'height': 5, 'branch_hash': 'AA' * 32}, {'height': 3, 'branch_hash': 'BB' * 32},
+               {'height': 1, 'branch_hash': 'CC' * 32}]
+
+
+def _executed(cursor, statement):
+    # The (SQL, parameters) of each execute call whose SQL contains statement, in the order they were made
+    return [(call[0][0], call[0][1] if len(call[0]) > 1 else None) for call in cursor.execute.call_args_list
+            if statement in call[0][0]]
 
 
 class TestInsert(unittest.TestCase):
@@ -74,7 +87,7 @@ class TestInsert(unittest.TestCase):
         self.assertEqual(1, len(data))
         self.assertEqual({'error': 'Signature check failure', 'details': 'Check yo sig'}, data[0])
 
-    @patch('register.views.records.get_item_errors')
+    @patch('register.utilities.validation._get_remote_item_errors')
     @patch('register.utilities.data.queries.start')
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.insert_item_in_transaction')
@@ -136,13 +149,13 @@ class TestInsert(unittest.TestCase):
         self.assertEqual(1, len(data))
         self.assertEqual("List is invalid", data[0]['error'])
 
-    @patch('register.app.requests.Session')
+    @patch('register.utilities.validation.validation_session')
     def test_insert_multiple_list_with_rubbish(self, session):
         with app.test_request_context():
             g.session = MagicMock()
             response = MagicMock()
             response.status_code = 200
-            session.return_value.post.return_value = response  # 3rd item will get this far
+            session.get.return_value.post.return_value = response  # 3rd item will get this far
             payload = [
                 {"item": {"obtusity": "342"}, "item-signature": "STUFF", "item-hash": "totallyfakehash"},
                 {"item": {"challenge": "344"}, "item-signature": "STUFF", "item-hash": "totallyfakehash2"},
@@ -188,7 +201,7 @@ class TestInsert(unittest.TestCase):
         self.assertEqual("Envelope is invalid", data[0]['error'])
 
     @patch('register.views.record.crypto')
-    @patch('register.app.requests.Session')
+    @patch('register.utilities.validation.validation_session')
     def test_insert_item_bad_item_key(self, session, mock_crypto):
         mock_crypto.validate_signature.return_value = True, ""
         with app.test_request_context():
@@ -196,7 +209,7 @@ class TestInsert(unittest.TestCase):
             response = MagicMock()
             response.status_code = 400
             response.content = b'[{"location": "$.", "error": "too lazy"}]'
-            session.return_value.post.return_value = response
+            session.get.return_value.post.return_value = response
 
             payload = {
                 "item": {"local-land-charge": "Law 342", "squamous": "place 342", "elongated": "342"},
@@ -225,14 +238,15 @@ class TestInsert(unittest.TestCase):
         self.assertEqual(1, len(data))
         self.assertEqual("Item is invalid", data[0]['error'])
 
-    @patch('register.utilities.data.queries.read_record_by_field_value')
-    @patch('register.utilities.data.queries.publish_message')
-    def test_insert_item_in_transaction_not_existing(self, mock_pub, mock_get_record):
+    def test_insert_item_in_transaction_not_existing(self):
         cursor = MagicMock()
-        # Fiddly: this calls two SQL reads (until we get 9.6 and its UPSERTS at least):
+        cursor.fetchall.return_value = FRONTIER_42
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        # Fiddly: this calls three SQL reads (until we get 9.6 and its UPSERTS at least):
         cursor.fetchone.side_effect = [
+            None,
             {'c': 0},
-            {'entry_number': 43}
+            {'last': 42}
         ]
         outcome = insert_item_in_transaction(
             cursor,
@@ -240,17 +254,26 @@ class TestInsert(unittest.TestCase):
             'hashhashhash',
             'sigsigsig'
         )
-        self.assertEqual(cursor.execute.call_count, 5)
         self.assertEqual(43, outcome)
+        # The append lock is taken before anything is read
+        self.assertIn('pg_advisory_xact_lock', cursor.execute.call_args_list[0][0][0])
+        self.assertEqual([43], [params['number'] for sql, params in _executed(cursor, 'INSERT INTO entry ')])
+        self.assertEqual(1, len(_executed(cursor, 'INSERT INTO record')))
+        self.assertEqual([], _executed(cursor, 'UPDATE record'))
+        self.assertEqual(1, len(_executed(cursor, 'INSERT INTO merkle_frontier')))
+        self.assertEqual([43], [params['size'] for sql, params in _executed(cursor, 'INSERT INTO tree_head')])
+        self.assertEqual([(43, 'NEW', None, None)],
+                         [params for sql, params in _executed(cursor, 'INSERT INTO entry_change')])
 
-    @patch('register.utilities.data.queries.read_record_by_field_value')
-    @patch('register.utilities.data.queries.publish_message')
-    def test_insert_item_in_transaction_existing(self, mock_pub, mock_get_record):
+    def test_insert_item_in_transaction_existing(self):
         cursor = MagicMock()
-        # Fiddly: this calls two SQL reads (until we get 9.6 and its UPSERTS at least):
+        cursor.fetchall.return_value = FRONTIER_42
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        # Fiddly: this calls three SQL reads (until we get 9.6 and its UPSERTS at least):
         cursor.fetchone.side_effect = [
+            {'item': {'local-land-charge': '777666555', 'charge-type': 'Old'}, 'entry_number': 12},
             {'c': 1},
-            {'entry_number': 43}
+            {'last': 42}
         ]
         outcome = insert_item_in_transaction(
             cursor,
@@ -258,5 +281,131 @@ class TestInsert(unittest.TestCase):
             'hashhashhash',
             'sigsigsig'
         )
-        self.assertEqual(cursor.execute.call_count, 4)
         self.assertEqual(43, outcome)
+        self.assertEqual(1, len(_executed(cursor, 'UPDATE record')))
+        self.assertEqual([], _executed(cursor, 'INSERT INTO record'))
+        [(sql, change)] = _executed(cursor, 'INSERT INTO entry_change')
+        self.assertEqual((43, 'UPDATED', 12), change[:3])
+        self.assertEqual({'charge-type': {'old': 'Old', 'new': None}}, json.loads(change[3])['item-changes'])
+
+    @patch('register.utilities.data.queries.store_outbox_message')
+    def test_insert_item_in_transaction_patch(self, mock_outbox):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = FRONTIER_42
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        cursor.fetchone.side_effect = [
+            {'item': {'local-land-charge': '777666555', 'geometry': {'coordinates': [[0, 1], [2, 3]]}},
+             'entry_number': 12},
+            {'c': 1},
+            {'last': 42}
+        ]
+        item = CanonicalItem({'local-land-charge': '777666555', 'geometry': {'coordinates': [[0, 1], [2, 4]]}})
+        with patch.dict(app.config, {'ITEM_CHANGES_FORMAT': 'json-patch', 'ITEM_PATCH_MAX_OPERATIONS': 1000}):
+            insert_item_in_transaction(cursor, item, 'hashhashhash', 'sigsigsig')
+        message = mock_outbox.call_args[0][3]
+        self.assertEqual([{'op': 'replace', 'path': '/geometry/coordinates/1/1', 'value': 4}], message['item-patch'])
+
+    def test_next_entry_numbers(self):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {'last': 0}
+        self.assertEqual([1, 2, 3], next_entry_numbers(cursor, 3))
+        cursor.fetchone.return_value = {'last': 41}
+        self.assertEqual([42], next_entry_numbers(cursor, 1))
+
+    @patch('register.utilities.data.queries.store_outbox_messages')
+    def test_insert_items_bulk_in_transaction(self, mock_outbox):
+        cursor = MagicMock()
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        cursor.fetchall.side_effect = [
+            [{'key': '777666555', 'item': {'local-land-charge': '777666555', 'charge-type': 'Old'},
+              'entry_number': 12}],
+            [{'item_hash': 'hash1'}],
+            FRONTIER_42
+        ]
+        cursor.fetchone.return_value = {'last': 42}
+        outcome = insert_items_bulk_in_transaction(cursor, [
+            {'item': {'local-land-charge': '777666555', 'charge-type': 'New'},
+             'item-hash': 'hash1', 'item-signature': 'sig1'},
+            {'item': {'local-land-charge': '777666556'}, 'item-hash': 'hash2', 'item-signature': 'sig2'},
+            {'item': {'local-land-charge': '777666556', 'charge-type': 'New'},
+             'item-hash': 'hash3', 'item-signature': 'sig3'}
+        ])
+        self.assertEqual([{'item-hash': 'hash1', 'entry-number': 43},
+                          {'item-hash': 'hash2', 'entry-number': 44},
+                          {'item-hash': 'hash3', 'entry-number': 45}], outcome)
+        # Completed subtrees are stored as branch hashes, and a single head is recorded for the whole batch
+        [(branches, params)] = _executed(cursor, 'INSERT INTO branch_hashes')
+        self.assertIn("(43, 44, ", branches)
+        self.assertIn("(41, 44, ", branches)
+        self.assertEqual([45], [params['size'] for sql, params in _executed(cursor, 'INSERT INTO tree_head')])
+        [(changes, params)] = _executed(cursor, 'INSERT INTO entry_change')
+        self.assertIn("(43, 'UPDATED', 12,", changes)
+        self.assertIn("(44, 'NEW', None, None)", changes)
+        self.assertIn("(45, 'UPDATED', 44,", changes)
+        messages = [message for entry_number, routing_key, message in mock_outbox.call_args[0][1]]
+        self.assertEqual(['UPDATED', 'NEW', 'UPDATED'], [message['action-type'] for message in messages])
+        self.assertEqual({'charge-type': {'old': 'Old', 'new': 'New'}}, messages[0]['item-changes'])
+        self.assertEqual({'charge-type': {'old': None, 'new': 'New'}}, messages[2]['item-changes'])
+
+    @patch('register.utilities.validation._get_remote_item_errors')
+    @patch('register.views.records.insert_items_bulk')
+    def test_insert_many_items_bulk(self, mock_insert, post):
+        post.return_value = None
+        payload = [{
+            "item": {"local-land-charge": 343},
+            "item-signature": "STUFF",
+            "item-hash": "totallyfakehash"
+        }]
+        mock_insert.return_value = [{'item-hash': 'totallyfakehash', 'entry-number': 20}]
+        with patch.dict(app.config, {'BULK_INGEST': True}):
+            response = self.app.post('/records', data=json.dumps(payload),
+                                     headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 202)
+        mock_insert.assert_called_once_with(payload, None)
+        data = json.loads(response.data.decode())
+        self.assertEqual(20, data[0]['entry-number'])
+
+    @patch('register.utilities.outbox.publish_messages')
+    @patch('register.utilities.outbox.commit')
+    @patch('register.utilities.outbox.start')
+    def test_dispatch_outbox(self, mock_start, mock_commit, mock_pub):
+        cursor = mock_start.return_value
+        cursor.fetchone.return_value = {'locked': True}
+        cursor.fetchall.return_value = [
+            {'entry_number': 7, 'routing_key': 'llc.local-land-charge', 'message': {'entry-number': 7}},
+            {'entry_number': 8, 'routing_key': 'llc.local-land-charge', 'message': {'entry-number': 8}}
+        ]
+        mock_pub.return_value = [None, None]
+        self.assertEqual(2, dispatch_outbox(10))
+        self.assertEqual([({'entry-number': 7}, 'llc.local-land-charge'),
+                          ({'entry-number': 8}, 'llc.local-land-charge')],
+                         mock_pub.call_args[0][0])
+        self.assertEqual('application/json', mock_pub.call_args[1]['content_type'])
+        cursor.execute.assert_called_with('DELETE FROM outbox WHERE entry_number = ANY(%(numbers)s)',
+                                          {'numbers': [7, 8]})
+        mock_commit.assert_called_once_with(cursor)
+
+    @patch('register.utilities.outbox.publish_messages')
+    @patch('register.utilities.outbox.commit')
+    @patch('register.utilities.outbox.start')
+    def test_dispatch_outbox_publish_failure(self, mock_start, mock_commit, mock_pub):
+        cursor = mock_start.return_value
+        cursor.fetchone.return_value = {'locked': True}
+        cursor.fetchall.return_value = [
+            {'entry_number': 7, 'routing_key': 'llc.local-land-charge', 'message': {'entry-number': 7}},
+            {'entry_number': 8, 'routing_key': 'llc.local-land-charge', 'message': {'entry-number': 8}}
+        ]
+        mock_pub.return_value = [None, IOError("Not confirmed")]
+        self.assertEqual(1, dispatch_outbox(10))
+        # Only the message that was sent is removed from the outbox
+        cursor.execute.assert_called_with('DELETE FROM outbox WHERE entry_number = ANY(%(numbers)s)',
+                                          {'numbers': [7]})
+        mock_commit.assert_called_once_with(cursor)
+
+    @patch('register.utilities.outbox.publish_messages')
+    @patch('register.utilities.outbox.commit')
+    @patch('register.utilities.outbox.start')
+    def test_dispatch_outbox_locked(self, mock_start, mock_commit, mock_pub):
+        mock_start.return_value.fetchone.return_value = {'locked': False}
+        self.assertEqual(0, dispatch_outbox(10))
+        mock_pub.assert_not_called()
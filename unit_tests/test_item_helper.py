@@ -1,5 +1,8 @@
 from register.main import app
-from register.utilities.item_helper import get_action_type, get_item_changes
+from register.utilities.canonical import CanonicalItem
+from register.utilities.item_helper import get_action_type, get_item_changes, get_item_patch, add_item_changes
+from unittest.mock import patch
+import copy
 import unittest
 
 
@@ -17,6 +20,36 @@ def get_existing_item():
     }
 
 
+def apply_patch(document, operations):
+    document = copy.deepcopy(document)
+    for operation in operations:
+        tokens = [t.replace('~1', '/').replace('~0', '~') for t in operation['path'].split('/')[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            if operation['op'] == 'add' and last == '-':
+                parent.append(operation['value'])
+            elif operation['op'] == 'remove':
+                del parent[int(last)]
+            else:
+                parent[int(last)] = operation['value']
+        elif operation['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = operation['value']
+    return document
+
+
+def get_geometry_item(coordinates):
+    return {
+        'local-land-charge': 1,
+        'geometry': {'type': 'Polygon', 'coordinates': [coordinates]},
+        'charge-type': 'Smoke Control Order'
+    }
+
+
 class TestItemHelper(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
@@ -84,3 +117,62 @@ class TestItemHelper(unittest.TestCase):
         }
         item_changes = get_item_changes(item, existing_item)
         self.assertEqual(item_changes, expected_item_changes)
+
+    def test_get_item_patch_nested_change(self):
+        coordinates = [[x, x + 1] for x in range(100)]
+        existing_item = get_geometry_item(coordinates)
+        moved = copy.deepcopy(coordinates)
+        moved[42][1] = 7
+        item = get_geometry_item(moved)
+        operations = get_item_patch(item, existing_item)
+        self.assertEqual([{'op': 'replace', 'path': '/geometry/coordinates/0/42/1', 'value': 7}], operations)
+        self.assertEqual(item, apply_patch(existing_item, operations))
+
+    def test_get_item_patch_fields_and_arrays(self):
+        existing_item = {'a/b': 1, 'removed': 'x', 'list': [1, 2, 3, 4, 5, 6], 'type': {'k': 1}}
+        item = {'a/b': 2, 'added': 'y', 'list': [1, 2, 3, 4], 'type': [1]}
+        operations = get_item_patch(item, existing_item)
+        self.assertIn({'op': 'replace', 'path': '/a~1b', 'value': 2}, operations)
+        self.assertIn({'op': 'remove', 'path': '/removed'}, operations)
+        self.assertIn({'op': 'remove', 'path': '/list/5'}, operations)
+        self.assertIn({'op': 'replace', 'path': '/type', 'value': [1]}, operations)
+        self.assertEqual(item, apply_patch(existing_item, operations))
+
+    def test_get_item_patch_mostly_changed_array_replaced(self):
+        existing_item = get_geometry_item([[0, 0], [1, 1], [2, 2], [3, 3]])
+        item = get_geometry_item([[5, 5], [6, 6], [7, 7], [3, 3], [4, 4]])
+        operations = get_item_patch(item, existing_item)
+        self.assertEqual([{'op': 'replace', 'path': '/geometry/coordinates/0',
+                           'value': item['geometry']['coordinates'][0]}], operations)
+        self.assertEqual(item, apply_patch(existing_item, operations))
+
+    def test_get_item_patch_bounded(self):
+        existing_item = {'a': list(range(100)), 'b': 1, 'c': 2}
+        changed = list(range(100))
+        for index in range(0, 100, 3):
+            changed[index] = -1
+        item = {'a': changed, 'b': 1, 'd': 3}
+        operations = get_item_patch(item, existing_item, max_operations=10)
+        self.assertEqual([{'op': 'replace', 'path': '/a', 'value': changed},
+                          {'op': 'remove', 'path': '/c'},
+                          {'op': 'add', 'path': '/d', 'value': 3}], operations)
+        self.assertEqual(item, apply_patch(existing_item, operations))
+
+    def test_add_item_changes_format(self):
+        item = get_item()
+        existing_item = get_existing_item()
+        with patch.dict(app.config, {'ITEM_CHANGES_FORMAT': 'json-patch', 'ITEM_PATCH_MAX_OPERATIONS': 1000}):
+            message = add_item_changes({}, item, existing_item)
+        self.assertNotIn('item-changes', message)
+        self.assertEqual(item, apply_patch(existing_item, message['item-patch']))
+        with patch.dict(app.config, {'ITEM_CHANGES_FORMAT': 'fields'}):
+            message = add_item_changes({}, item, existing_item)
+        self.assertEqual(get_item_changes(item, existing_item), message['item-changes'])
+
+    def test_item_patch_canonical_item(self):
+        # Incoming items are CanonicalItems and stored ones plain dicts; they still diff member by member
+        existing_item = {'geometry': {'coordinates': [[0, 1], [2, 3]]}, 'flag': 1}
+        item = CanonicalItem({'geometry': {'coordinates': [[0, 1], [2, 4]]}, 'flag': True})
+        self.assertEqual([{'op': 'replace', 'path': '/flag', 'value': True},
+                          {'op': 'replace', 'path': '/geometry/coordinates/1/1', 'value': 4}],
+                         get_item_patch(item, existing_item, max_operations=1000))
@@ -0,0 +1,157 @@
+import datetime
+import json
+import unittest
+from unittest.mock import patch
+
+from register.main import app
+from register.utilities.jobs import process_job
+
+ITEMS = [
+    {"item": {"local-land-charge": 1}, "item-hash": "sha-256:aa", "item-signature": "sig"},
+    {"item": {"local-land-charge": 2}, "item-hash": "sha-256:bb", "item-signature": "sig"},
+    {"item": {"local-land-charge": 3}, "item-hash": "sha-256:cc", "item-signature": "sig"}
+]
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    @patch('register.views.jobs.job_worker')
+    @patch('register.views.jobs.commit')
+    @patch('register.views.jobs.start')
+    def test_post_job(self, mock_start, mock_commit, mock_worker):
+        response = self.app.post('/jobs', data=json.dumps(ITEMS), headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.data.decode())['job-id']
+        self.assertTrue(response.headers['Location'].endswith('/jobs/' + job_id))
+        cursor = mock_start.return_value
+        params = cursor.execute.call_args[0][1]
+        self.assertEqual(params['job_id'], job_id)
+        self.assertEqual(params['count'], 3)
+        self.assertEqual(json.loads(params['items']), ITEMS)
+        mock_commit.assert_called_once_with(cursor)
+        mock_worker.notify.assert_called_once_with()
+
+    @patch('register.views.jobs.start')
+    def test_post_job_invalid_list(self, mock_start):
+        response = self.app.post('/jobs', data=json.dumps([{"item": {}}]),
+                                 headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data.decode())[0]['error'], "List is invalid")
+        mock_start.assert_not_called()
+
+    @patch('register.views.jobs.commit')
+    @patch('register.views.jobs.start')
+    def test_get_job(self, mock_start, mock_commit):
+        timestamp = datetime.datetime(2017, 1, 1, 12, 0)
+        cursor = mock_start.return_value
+        cursor.fetchone.return_value = {'job_id': 'abc', 'status': 'RUNNING', 'created': timestamp,
+                                        'updated': timestamp, 'item_count': 3, 'processed_count': 1,
+                                        'errors': None}
+        cursor.fetchall.return_value = [{'item_index': 0, 'item_hash': 'sha-256:aa', 'entry_number': 7}]
+        response = self.app.get('/jobs/abc')
+        self.assertEqual(response.status_code, 200)
+        job = json.loads(response.data.decode())
+        self.assertEqual(job['status'], 'RUNNING')
+        self.assertEqual(job['processed-count'], 1)
+        self.assertEqual(job['entries'], [{'index': 0, 'item-hash': 'sha-256:aa', 'entry-number': 7}])
+
+    @patch('register.views.jobs.commit')
+    @patch('register.views.jobs.start')
+    def test_get_job_not_found(self, mock_start, mock_commit):
+        mock_start.return_value.fetchone.return_value = None
+        response = self.app.get('/jobs/abc')
+        self.assertEqual(response.status_code, 404)
+
+    @patch('register.utilities.jobs.outbox_dispatcher')
+    @patch('register.utilities.jobs.finish_job')
+    @patch('register.utilities.jobs.store_job_entries')
+    @patch('register.utilities.jobs.insert_items_bulk_in_transaction')
+    @patch('register.utilities.jobs.lock_job_progress')
+    @patch('register.utilities.jobs.touch_job')
+    @patch('register.utilities.jobs.get_batch_item_errors')
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_process_job(self, mock_start, mock_commit, mock_claim, mock_errors, mock_touch, mock_progress,
+                         mock_insert, mock_store, mock_finish, mock_outbox):
+        mock_claim.return_value = {'job_id': 'abc', 'processed_count': 0, 'items': ITEMS}
+        mock_errors.return_value = []
+        mock_progress.side_effect = [0, 2]
+        mock_insert.side_effect = lambda cursor, items: [{'item-hash': i['item-hash'], 'entry-number': 1}
+                                                         for i in items]
+        with app.app_context():
+            self.assertTrue(process_job(2, 600))
+        self.assertEqual([ITEMS[0:2], ITEMS[2:3]], [c[0][1] for c in mock_insert.call_args_list])
+        self.assertEqual([0, 2], [c[0][2] for c in mock_store.call_args_list])
+        mock_finish.assert_called_once_with(mock_start.return_value, 'abc', 'COMPLETE')
+        # Validated a chunk at a time, touching the job after each
+        self.assertEqual([(ITEMS[0:2], 0), (ITEMS[2:3], 2)], [c[0] for c in mock_errors.call_args_list])
+        self.assertEqual(2, mock_touch.call_count)
+        self.assertEqual(5, mock_commit.call_count)
+        self.assertEqual(2, mock_outbox.notify.call_count)
+
+    @patch('register.utilities.jobs.store_job_entries')
+    @patch('register.utilities.jobs.insert_items_bulk_in_transaction')
+    @patch('register.utilities.jobs.lock_job_progress')
+    @patch('register.utilities.jobs.get_batch_item_errors')
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_process_job_resumes(self, mock_start, mock_commit, mock_claim, mock_errors, mock_progress, mock_insert,
+                                 mock_store):
+        mock_claim.return_value = {'job_id': 'abc', 'processed_count': 2, 'items': ITEMS}
+        mock_progress.return_value = 2
+        mock_insert.return_value = [{'item-hash': 'sha-256:cc', 'entry-number': 9}]
+        with app.app_context():
+            self.assertTrue(process_job(2, 600))
+        mock_errors.assert_not_called()
+        mock_insert.assert_called_once_with(mock_start.return_value, ITEMS[2:3])
+        mock_store.assert_called_once_with(mock_start.return_value, 'abc', 2, mock_insert.return_value)
+
+    @patch('register.utilities.jobs.finish_job')
+    @patch('register.utilities.jobs.insert_items_bulk_in_transaction')
+    @patch('register.utilities.jobs.get_batch_item_errors')
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_process_job_invalid_items(self, mock_start, mock_commit, mock_claim, mock_errors, mock_insert,
+                                       mock_finish):
+        mock_claim.return_value = {'job_id': 'abc', 'processed_count': 0, 'items': ITEMS}
+        errors = [{"error": "Item 1 is invalid", "details": []}]
+        mock_errors.side_effect = [errors, []]
+        with app.app_context():
+            self.assertTrue(process_job(2, 600))
+        mock_insert.assert_not_called()
+        mock_finish.assert_called_once_with(mock_start.return_value, 'abc', 'FAILED', errors)
+
+    @patch('register.utilities.jobs.outbox_dispatcher')
+    @patch('register.utilities.jobs.finish_job')
+    @patch('register.utilities.jobs.store_job_entries')
+    @patch('register.utilities.jobs.insert_items_bulk_in_transaction')
+    @patch('register.utilities.jobs.lock_job_progress')
+    @patch('register.utilities.jobs.get_batch_item_errors')
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_process_job_taken_over(self, mock_start, mock_commit, mock_claim, mock_errors, mock_progress,
+                                    mock_insert, mock_store, mock_finish, mock_outbox):
+        # Another worker reclaimed the job and appended the first chunk while this one was validating
+        mock_claim.return_value = {'job_id': 'abc', 'processed_count': 0, 'items': ITEMS}
+        mock_errors.return_value = []
+        mock_progress.return_value = 2
+        with app.app_context():
+            self.assertTrue(process_job(2, 600))
+        mock_insert.assert_not_called()
+        mock_store.assert_not_called()
+        mock_finish.assert_not_called()
+
+    @patch('register.utilities.jobs.claim_job')
+    @patch('register.utilities.jobs.commit')
+    @patch('register.utilities.jobs.start')
+    def test_process_job_none_pending(self, mock_start, mock_commit, mock_claim):
+        mock_claim.return_value = None
+        with app.app_context():
+            self.assertFalse(process_job(2, 600))
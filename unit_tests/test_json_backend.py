@@ -0,0 +1,91 @@
+import importlib.util
+import json
+import random
+import unittest
+from unittest.mock import patch
+
+from register.utilities import json_backend
+from register.utilities.json_backend import load_backend, canonical_dumps, dumps, loads
+
+STRINGS = ['', 'plain', 'with "quotes" and \\ backslashes', 'a/b', 'tab\there\nnewline\r\x08\x0c',
+           ''.join(chr(c) for c in range(0x20)) + '\x7f', 'café', 'Ærøskøbing', '中文', '\U0001F600 emoji',
+           'line separator ', '﻿bom', '<script>&amp;</script>']
+INTEGERS = [0, 1, -1, 342, 2 ** 31, 2 ** 53 + 1, 2 ** 63 - 1, -2 ** 63]
+
+
+def _random_value(rng, depth=0):
+    choice = rng.randrange(7 if depth < 3 else 4)
+    if choice == 0:
+        return rng.choice(STRINGS) + ''.join(chr(rng.randrange(0x20, 0x3000)) for _ in range(rng.randrange(5)))
+    if choice == 1:
+        return rng.choice(INTEGERS + [rng.randrange(-2 ** 63, 2 ** 63)])
+    if choice == 2:
+        return rng.choice([True, False])
+    if choice == 3:
+        return None
+    if choice in (4, 5):
+        return {rng.choice(STRINGS) + chr(rng.randrange(0x20, 0x10FFFF) & 0xD7FF): _random_value(rng, depth + 1)
+                for _ in range(rng.randrange(6))}
+    return [_random_value(rng, depth + 1) for _ in range(rng.randrange(6))]
+
+
+def _samples():
+    entry = {"entry-number": 17, "entry-timestamp": "2017-01-01 12:00:00.000001", "item-hash": "sha-256:ab",
+             "key": "Ærøskøbing", "item-signature": "rs256:PQ/+=="}
+    samples = [entry, dict(entry, key=342), {}, [], {s: s for s in STRINGS}, {str(i): i for i in INTEGERS},
+               {'Z': 1, 'a': 2, 'é': 3, 'z': 4, '\U0001F600': 5, '￿': 6, '': 7}]
+    rng = random.Random(1024)
+    samples.extend(_random_value(rng) for _ in range(2000))
+    return samples
+
+
+def _stdlib_canonical(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class BackendDifferentialTest(object):
+    """Checks a backend's canonical encoding of plain values is byte-identical to the standard library's."""
+    backend = None
+
+    def setUp(self):
+        self.name, self.dumps, self.canonical_dumps, self.loads = load_backend(self.backend)
+
+    def test_canonical_identical(self):
+        for sample in _samples():
+            self.assertEqual(_stdlib_canonical(sample), self.canonical_dumps(sample), repr(sample))
+
+    def test_round_trip(self):
+        for sample in _samples():
+            self.assertEqual(sample, self.loads(self.dumps(sample)))
+
+    def test_canonical_dumps_with_floats(self):
+        # Floats aren't given to the backend, so the result still matches
+        with patch.multiple(json_backend, BACKEND_NAME=self.name, _canonical_dumps=self.canonical_dumps):
+            for sample in [{"a": 1e16}, {"b": [0.1, 1.5e-07, -0.0, 12345678901234567.0]}, {"c": 2 ** 64}]:
+                self.assertEqual(_stdlib_canonical(sample), canonical_dumps(sample))
+
+
+# orjson needs Python 3.6 or later, so it isn't in requirements.txt
+@unittest.skipUnless(importlib.util.find_spec('orjson'), 'orjson is not installed')
+class TestOrjsonBackend(BackendDifferentialTest, unittest.TestCase):
+    backend = 'orjson'
+
+
+class TestUjsonBackend(BackendDifferentialTest, unittest.TestCase):
+    backend = 'ujson'
+
+
+class TestStdlibBackend(BackendDifferentialTest, unittest.TestCase):
+    backend = 'json'
+
+
+class TestSelectedBackend(unittest.TestCase):
+
+    def test_canonical_dumps(self):
+        for sample in _samples()[:100]:
+            self.assertEqual(_stdlib_canonical(sample), canonical_dumps(sample))
+
+    def test_dumps_falls_back(self):
+        self.assertEqual({"a": 1}, loads(dumps({"a": 1})))
+        with patch.object(json_backend, '_dumps', side_effect=TypeError):
+            self.assertEqual('{"a": 1}', dumps({"a": 1}))
@@ -1,11 +1,59 @@
 import unittest
-from unittest.mock import MagicMock
-from register.utilities.data.merkle_data import MerkleData
+from base64 import b16encode
+from unittest.mock import MagicMock, patch
+from Crypto.Hash import SHA256
+from register.utilities.data.merkle_data import MerkleData, append_merkle_leaves, prune_merkle_tree
+from register.utilities.data.tree_head import record_tree_head, tree_head_payload
+from register.utilities.merkle_tree import MerkleTree, extend_frontier, frontier_root, frontier_size
+from register.exceptions import ApplicationError
 from register.main import app
 from register.utilities.data.empty_entry import create_empty_entry
 from register.utilities.leaf_hash import calculate_leaf_hash
 
 
+def fake_leaf(entry_number):
+    return b16encode(SHA256.new(str(entry_number).encode()).digest()).decode()
+
+
+class MemoryMerkleData(object):
+    # Leaves only; every branch hash is worked out from them
+
+    def __init__(self, size, frontier=None, missing=()):
+        self.size = size
+        self._frontier = frontier or {}
+        self.missing = missing
+        self.branches = {}
+
+    def leaf_hash(self, entry_number):
+        return fake_leaf(entry_number)
+
+    def branch_hash(self, start, length):
+        return None
+
+    def save_branch_hash(self, start, length, hash_string):
+        pass
+
+    def leaf_count(self):
+        return self.size
+
+    def latest_entry_number(self):
+        return self.size
+
+    def frontier(self):
+        return self._frontier
+
+    def leaf_hashes_from(self, first_entry, limit):
+        return [(entry_number, fake_leaf(entry_number))
+                for entry_number in range(first_entry, min(first_entry + limit, self.size + 1))
+                if entry_number not in self.missing]
+
+    def save_frontier(self, frontier, extended):
+        self._frontier = extended
+
+    def save_branch_hashes(self, branches):
+        self.branches.update({(start, length): branch_hash for start, length, branch_hash in branches})
+
+
 class TestMerkle(unittest.TestCase):
 
     def setUp(self):
@@ -41,3 +89,117 @@ class TestMerkle(unittest.TestCase):
     def test_empty_leaf_hash(self):
         leaf_hash = calculate_leaf_hash(create_empty_entry(698)).decode()
         self.assertEqual(leaf_hash, 'F0C3DCD45728134CF63D4C59B9BA442D6056E24B46EBF76E9F6648E8E7068E3B')
+
+    def test_frontier_root_matches_tree(self):
+        frontier = {}
+        for size in range(1, 70):
+            frontier = extend_frontier(frontier, size - 1, [bytes.fromhex(fake_leaf(size))])
+            self.assertEqual(size, frontier_size(frontier))
+            self.assertEqual(bin(size).count('1'), len(frontier))
+            self.assertEqual(MerkleTree(MemoryMerkleData(size)).root_hash(), frontier_root(frontier))
+
+    def test_frontier_extended_in_batches(self):
+        leaves = [bytes.fromhex(fake_leaf(entry_number)) for entry_number in range(1, 100)]
+        one_at_a_time = {}
+        for size, leaf in enumerate(leaves):
+            one_at_a_time = extend_frontier(one_at_a_time, size, [leaf])
+        batched = extend_frontier(extend_frontier({}, 0, leaves[:37]), 37, leaves[37:])
+        self.assertEqual(one_at_a_time, batched)
+
+    def test_tree_head_from_frontier(self):
+        frontier = extend_frontier({}, 0, [bytes.fromhex(fake_leaf(n)) for n in range(1, 12)])
+        data = MemoryMerkleData(11, frontier)
+        data.leaf_hash = MagicMock(side_effect=AssertionError("Tree walked"))
+        self.assertEqual((11, frontier_root(frontier)), MerkleTree(data).tree_head())
+
+    def test_tree_head_stale_frontier(self):
+        frontier = extend_frontier({}, 0, [bytes.fromhex(fake_leaf(n)) for n in range(1, 10)])
+        tree = MerkleTree(MemoryMerkleData(11, frontier))
+        self.assertEqual((11, tree.root_hash()), tree.tree_head())
+
+    def test_append_merkle_leaves(self):
+        cursor = MagicMock()
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        # A tree of 3: subtrees of 2 and 1 leaves
+        frontier = extend_frontier({}, 0, [bytes.fromhex(fake_leaf(n)) for n in range(1, 4)])
+        cursor.fetchall.return_value = [{'height': height, 'branch_hash': b16encode(branch_hash).decode()}
+                                        for height, branch_hash in frontier.items()]
+        append_merkle_leaves(cursor, 4, [fake_leaf(4)])
+        # Both merge into one subtree of 4
+        self.assertEqual([0, 1, 2], sorted(cursor.execute.call_args_list[1][0][1]['heights']))
+        self.assertIn('(2, ', cursor.execute.call_args_list[2][0][0])
+        # Completing entries 3 to 4 and 1 to 4, whose hashes are stored
+        self.assertIn('(3, 4)', cursor.execute.call_args_list[3][0][0])
+        self.assertIn('(1, 4, ', cursor.execute.call_args_list[4][0][0])
+        self.assertIn('(3, 4, ', cursor.execute.call_args_list[4][0][0])
+        # And the head of the tree of 4 recorded
+        head = cursor.execute.call_args_list[5][0][1]
+        self.assertEqual(4, head['size'])
+        self.assertEqual(b16encode(MerkleTree(MemoryMerkleData(4)).root_hash()).decode(), head['root'])
+
+    @patch('register.utilities.data.tree_head.crypto')
+    def test_record_tree_head_signed(self, mock_crypto):
+        mock_crypto.sign.return_value = 'rs256:SIGNATURE'
+        cursor = MagicMock()
+        record_tree_head(cursor, 4, b'\xe1\xce')
+        head = cursor.execute.call_args[0][1]
+        self.assertEqual('rs256:SIGNATURE', head['signature'])
+        self.assertEqual('E1CE', head['root'])
+        self.assertEqual(tree_head_payload(4, head['timestamp'], 'sha-256:E1CE'), mock_crypto.sign.call_args[0][0])
+        self.assertEqual('{"root-hash":"sha-256:E1CE","timestamp":"%s","tree-size":4}' % head['timestamp'],
+                         mock_crypto.sign.call_args[0][0])
+
+    def test_append_merkle_leaves_missing_leaves(self):
+        # The frontier is out of step and can't be rebuilt, so the append fails
+        cursor = MagicMock()
+        cursor.fetchall.return_value = []
+        with self.assertRaises(ApplicationError):
+            append_merkle_leaves(cursor, 5, [fake_leaf(5)])
+
+    @patch('register.utilities.data.merkle_data.record_tree_head')
+    @patch('register.utilities.data.merkle_data.MerkleData')
+    def test_append_merkle_leaves_recovers(self, mock_data, mock_record):
+        # A frontier for 3 entries, though 9 are stored
+        data = MemoryMerkleData(10, extend_frontier({}, 0, [bytes.fromhex(fake_leaf(n)) for n in range(1, 4)]))
+        mock_data.return_value = data
+        append_merkle_leaves('cursor', 10, [fake_leaf(10)])
+        reference = MerkleTree(MemoryMerkleData(10))
+        self.assertEqual(10, frontier_size(data.frontier()))
+        mock_record.assert_called_once_with('cursor', 10, reference.root_hash())
+        self.assertEqual(b16encode(reference._branch_hash(0, 8, save_hash=False)).decode(), data.branches[(0, 8)])
+        # Later appends follow on from the rebuilt frontier
+        data.size = 11
+        append_merkle_leaves('cursor', 11, [fake_leaf(11)])
+        self.assertEqual((11, MerkleTree(MemoryMerkleData(11)).root_hash()), MerkleTree(data).tree_head())
+
+    def test_rebuild_frontier_in_batches(self):
+        data = MemoryMerkleData(13)
+        frontier = MerkleTree(data).rebuild_frontier(13, batch_size=5)
+        self.assertEqual(extend_frontier({}, 0, [bytes.fromhex(fake_leaf(n)) for n in range(1, 14)]), frontier)
+        self.assertEqual(frontier, data.frontier())
+        self.assertEqual(10, len(data.branches))
+
+    def test_rebuild_frontier_missing_leaf(self):
+        with self.assertRaises(ApplicationError):
+            MerkleTree(MemoryMerkleData(13, missing=(6,))).rebuild_frontier(13, batch_size=5)
+
+    def test_append_leaves_completes_subtrees(self):
+        data = MemoryMerkleData(0)
+        data.save_frontier = MagicMock()
+        data.save_branch_hashes = MagicMock()
+        tree = MerkleTree(data)
+        self.assertTrue(tree.append_leaves(1, [fake_leaf(n) for n in range(1, 13)]))
+        branches = data.save_branch_hashes.call_args[0][0]
+        # Pairs, fours and the first eight of twelve leaves
+        self.assertEqual([(0, 2), (2, 2), (0, 4), (4, 2), (6, 2), (4, 4), (0, 8), (8, 2), (10, 2), (8, 4)],
+                         [(start, length) for start, length, branch_hash in branches])
+        reference = MerkleTree(MemoryMerkleData(12))
+        for start, length, branch_hash in branches:
+            self.assertEqual(b16encode(reference._branch_hash(start, length, save_hash=False)).decode(), branch_hash)
+        self.assertEqual(12, frontier_size(data.save_frontier.call_args[0][1]))
+
+    def test_prune_keeps_perfect_subtrees(self):
+        cursor = MagicMock()
+        prune_merkle_tree(cursor, 13)
+        self.assertIn('end_entry_number=%(number)s AND NOT', cursor.execute.call_args[0][0])
+        self.assertEqual({'number': 12}, cursor.execute.call_args[0][1])
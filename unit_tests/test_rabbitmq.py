@@ -0,0 +1,133 @@
+import json
+import unittest
+from collections import defaultdict
+from unittest.mock import patch
+
+from kombu.compression import decompress
+
+from register.dependencies.rabbitmq import EmitterPool, Emitter, compression_stats
+
+
+class TestEmitterPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = EmitterPool(limit=1)
+
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_emitter_reused(self, mock_connection):
+        with self.pool.emitter('amqp://', 'exchange', 'key') as first:
+            pass
+        with self.pool.emitter('amqp://', 'exchange', 'other.key') as second:
+            pass
+        self.assertIs(first, second)
+
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_emitter_keyed_on_exchange(self, mock_connection):
+        with self.pool.emitter('amqp://', 'exchange', 'key') as first:
+            pass
+        with self.pool.emitter('amqp://', 'other-exchange', 'key') as second:
+            pass
+        self.assertIsNot(first, second)
+
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_emitter_discarded_on_error(self, mock_connection):
+        with self.assertRaises(IOError):
+            with self.pool.emitter('amqp://', 'exchange', 'key') as first:
+                first.connect()
+                raise IOError("Broker went away")
+        mock_connection.return_value.release.assert_called_once_with()
+        with self.pool.emitter('amqp://', 'exchange', 'key') as second:
+            pass
+        self.assertIsNot(first, second)
+
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_idle_limit(self, mock_connection):
+        with self.pool.emitter('amqp://', 'exchange', 'key') as first:
+            first.connect()
+            with self.pool.emitter('amqp://', 'exchange', 'key') as second:
+                pass
+        # Only one idle emitter is kept, so the one returned last is disconnected
+        mock_connection.return_value.release.assert_called_once_with()
+        with self.pool.emitter('amqp://', 'exchange', 'key') as third:
+            pass
+        self.assertIs(second, third)
+
+    @patch('register.dependencies.rabbitmq.os.getpid')
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_emitters_dropped_after_fork(self, mock_connection, mock_getpid):
+        mock_getpid.return_value = 100
+        pool = EmitterPool()
+        with pool.emitter('amqp://', 'exchange', 'key') as first:
+            first.connect()
+        mock_getpid.return_value = 101
+        with pool.emitter('amqp://', 'exchange', 'key') as second:
+            pass
+        self.assertIsNot(first, second)
+        # The parent's connection is left alone
+        mock_connection.return_value.release.assert_not_called()
+
+
+class TestConfirms(unittest.TestCase):
+
+    @patch('register.dependencies.rabbitmq.Producer')
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_nack_fails_only_nacked_messages(self, mock_connection, mock_producer):
+        channel = mock_producer.return_value.channel
+        channel.events = defaultdict(set)
+        # The broker nacks the second message, then acks the rest together
+
+        def drain_events(timeout):
+            for callback in channel.events['basic_nack']:
+                callback(2, False)
+            for callback in channel.events['basic_ack']:
+                callback(4, True)
+        mock_connection.return_value.drain_events.side_effect = drain_events
+        emitter = Emitter('amqp://', 'exchange', 'key')
+        results = emitter.send_messages([({"n": n}, None) for n in range(4)])
+        self.assertEqual([None, None, None], [results[0], results[2], results[3]])
+        self.assertIsInstance(results[1], IOError)
+        self.assertEqual(1, mock_connection.return_value.drain_events.call_count)
+
+    def test_multiple_nack(self):
+        emitter = Emitter('amqp://', 'exchange', 'key')
+        emitter._unconfirmed = {5: 0, 6: 1, 7: 2}
+        emitter._confirm_nack(6, True)
+        self.assertEqual({7: 2}, emitter._unconfirmed)
+        self.assertEqual([0, 1], sorted(emitter._nacked))
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        compression_stats.clear()
+
+    @patch('register.dependencies.rabbitmq.Producer')
+    @patch('register.dependencies.rabbitmq.Connection')
+    def test_large_messages_compressed(self, mock_connection, mock_producer):
+        large = json.dumps({"geometry": [[x, x + 1] for x in range(1000)]})
+        emitter = Emitter('amqp://', 'exchange', 'key')
+        emitter._unconfirmed = {}
+        emitter.CONFIRM_TIMEOUT = 0
+        emitter.send_messages([(large, None), ('{"small": 1}', None)], serializer=None,
+                              content_type='application/json', compression='gzip', compress_min_size=100)
+        publish = mock_producer.return_value.publish
+        body = publish.call_args_list[0][0][0]
+        headers = publish.call_args_list[0][1]['headers']
+        self.assertEqual(large, decompress(body, headers['compression']).decode())
+        self.assertEqual('utf-8', publish.call_args_list[0][1]['content_encoding'])
+        self.assertIsNone(publish.call_args_list[1][1]['headers'])
+        self.assertEqual(b'{"small": 1}', publish.call_args_list[1][0][0])
+
+        stats = compression_stats.stats()
+        self.assertEqual(1, stats['compressed'])
+        self.assertEqual(1, stats['uncompressed'])
+        self.assertEqual(len(large), stats['bytes-in'])
+        self.assertLess(stats['ratio'], 0.5)
+
+    def test_serialized_before_compressing(self):
+        body, content_type, content_encoding, headers = Emitter._compress(
+            {"a": "b" * 200}, 'json', None, {'x': 1}, 'gzip', 100)
+        self.assertEqual('application/json', content_type)
+        self.assertEqual(1, headers['x'])
+        data = decompress(body, headers['compression']).decode(content_encoding)
+        self.assertEqual({"a": "b" * 200}, json.loads(data))
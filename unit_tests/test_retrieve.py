@@ -14,6 +14,13 @@ entry_row = {
     "item_signature": "SIGNATURE"
 }
 
+tree_head_row = {
+    "tree_size": 4,
+    "root_hash": "E1CEEBC7BE6FA1DE812C7C2B08440BAF65317978E125C35FFBE93F6613BCABA7",
+    "timestamp": datetime.datetime(2017, 1, 30, 12, 32, 45, 123654),
+    "signature": "rs256:SIGNATURE"
+}
+
 item_row = {
     "item": {"local-land-charge": "LC001234", "originator": "Generic Local Authority"}
 }
@@ -24,14 +31,18 @@ entry_rows = [
         "entry_timestamp": datetime.datetime(2017, 1, 30, 12, 32, 45, 123654),
         "item_hash": "sha-256:7f9c9e31ac8256ca2f258583df262dbc7d6f68f2a03043d5c99a4ae5a7396ce9",
         "key": "1",
-        "item_signature": "SIGNATURE"
+        "item_signature": "SIGNATURE",
+        "action_type": "UPDATED",
+        "previous_entry_number": 1
     },
     {
         "entry_number": 1,
         "entry_timestamp": datetime.datetime(2017, 1, 30, 12, 32, 45, 999888),
         "item_hash": "sha-256:aaaccd31ac8256ca2f258583df262dbc7d6f68f2a03043d5c99a4ae5a7396ce9",
         "key": "2",
-        "item_signature": "SIGNATURE"
+        "item_signature": "SIGNATURE",
+        "action_type": None,
+        "previous_entry_number": None
     }
 ]
 
@@ -68,7 +79,10 @@ record_rows = [
         "item_hash": "sha-256:7f9c9e31ac8256ca2f258583df262dbc7d6f68f2a03043d5c99a4ae5a7396ce9",
         "key": "1",
         "item_signature": "SIGNATURE",
-        "item": {"local-land-charge": "LC001234", "originator": "Generic Local Authority"}
+        "item": {"local-land-charge": "LC001234", "originator": "Generic Local Authority"},
+        "action_type": None,
+        "previous_entry_number": None,
+        "changes": None
     },
     {
         "entry_number": 2,
@@ -76,7 +90,10 @@ record_rows = [
         "item_hash": "sha-256:aaaccd31ac8256ca2f258583df262dbc7d6f68f2a03043d5c99a4ae5a7396ce9",
         "key": "2",
         "item_signature": "SIGNATURE",
-        "item": {"local-land-charge": "LC001234", "originator": "Generic Local Authority"}
+        "item": {"local-land-charge": "LC001234", "originator": "Generic Local Authority"},
+        "action_type": None,
+        "previous_entry_number": None,
+        "changes": None
     }
 ]
 
@@ -151,9 +168,10 @@ class TestRetrieve(unittest.TestCase):
     @patch('register.utilities.data.queries.count_entries')
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
-    @patch('register.utilities.data.queries.publish_message')
+    @patch('register.utilities.data.queries.publish_messages')
     def test_republish_entries_ok(self, mock_publish, mock_start, mock_commit, mock_count):
         mock_count.return_value = 100
+        mock_publish.return_value = [None]
         mock_start.return_value.fetchone.side_effect = [
             record_rows[1], record_rows[0]]
         response = self.app.post("/entries/republish",
@@ -164,14 +182,55 @@ class TestRetrieve(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         mock_commit.assert_called_once()
         self.assertEqual(
-            data, {"republished_entries": [2], "entries_not_found": []})
+            data, {"republished_entries": [2], "entries_not_found": [], "entries_not_published": []})
+
+    @patch('register.utilities.data.queries.count_entries')
+    @patch('register.utilities.data.queries.commit')
+    @patch('register.utilities.data.queries.start')
+    @patch('register.utilities.data.queries.publish_messages')
+    def test_republish_entries_recorded_change(self, mock_publish, mock_start, mock_commit, mock_count):
+        mock_count.return_value = 100
+        mock_publish.return_value = [None]
+        changes = {'item-changes': {'originator': {'old': 'Someone', 'new': 'Generic Local Authority'}}}
+        mock_start.return_value.fetchone.side_effect = [
+            dict(record_rows[1], action_type='UPDATED', previous_entry_number=1, changes=changes)]
+        with patch.dict(app.config, {'ITEM_CHANGES_FORMAT': 'fields'}):
+            response = self.app.post("/entries/republish", data=json.dumps({"entries": [2], "routing_key": "key"}),
+                                     headers={"Content-type": "application/json"})
+        self.assertEqual(response.status_code, 200)
+        # No second query for the previous version
+        self.assertEqual(1, mock_start.return_value.execute.call_count)
+        message = mock_publish.call_args[0][0][0][0]
+        self.assertEqual('UPDATED', message['action-type'])
+        self.assertEqual(changes['item-changes'], message['item-changes'])
+
+    @patch('register.utilities.data.queries.count_entries')
+    @patch('register.utilities.data.queries.commit')
+    @patch('register.utilities.data.queries.start')
+    @patch('register.utilities.data.queries.publish_messages')
+    def test_republish_entries_recorded_change_other_format(self, mock_publish, mock_start, mock_commit, mock_count):
+        mock_count.return_value = 100
+        mock_publish.return_value = [None]
+        changes = {'item-changes': {'originator': {'old': 'Someone', 'new': 'Generic Local Authority'}}}
+        mock_start.return_value.fetchone.side_effect = [
+            dict(record_rows[1], action_type='UPDATED', previous_entry_number=1, changes=changes),
+            {'item': {"local-land-charge": "LC001234", "originator": "Someone"}}]
+        with patch.dict(app.config, {'ITEM_CHANGES_FORMAT': 'json-patch', 'ITEM_PATCH_MAX_OPERATIONS': 1000}):
+            response = self.app.post("/entries/republish", data=json.dumps({"entries": [2], "routing_key": "key"}),
+                                     headers={"Content-type": "application/json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, mock_start.return_value.execute.call_args_list[1][0][1]['entry_number'])
+        message = mock_publish.call_args[0][0][0][0]
+        self.assertEqual([{'op': 'replace', 'path': '/originator', 'value': 'Generic Local Authority'}],
+                         message['item-patch'])
 
     @patch('register.utilities.data.queries.count_entries')
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
-    @patch('register.utilities.data.queries.publish_message')
+    @patch('register.utilities.data.queries.publish_messages')
     def test_republish_entries_missing(self, mock_publish, mock_start, mock_commit, mock_count):
         mock_count.return_value = 100
+        mock_publish.return_value = [None]
         mock_start.return_value.fetchone.side_effect = [None]
         response = self.app.post("/entries/republish",
                                  data=json.dumps(
@@ -181,14 +240,15 @@ class TestRetrieve(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         mock_commit.assert_called_once()
         self.assertEqual(
-            data, {"republished_entries": [2], "entries_not_found": []})
+            data, {"republished_entries": [2], "entries_not_found": [], "entries_not_published": []})
 
     @patch('register.utilities.data.queries.count_entries')
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
-    @patch('register.utilities.data.queries.publish_message')
+    @patch('register.utilities.data.queries.publish_messages')
     def test_republish_entries_ok_multi(self, mock_publish, mock_start, mock_commit, mock_count):
         mock_count.return_value = 100
+        mock_publish.return_value = [None, None]
         mock_start.return_value.fetchone.side_effect = [
             record_rows[1], record_rows[0], record_rows[1], record_rows[0]]
         response = self.app.post("/entries/republish",
@@ -197,16 +257,18 @@ class TestRetrieve(unittest.TestCase):
                                  headers={"Content-type": "application/json"})
         data = json.loads(response.data.decode())
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(mock_commit.call_count, 2)
+        mock_commit.assert_called_once()
+        mock_publish.assert_called_once()
         self.assertEqual(
-            data, {"republished_entries": [1, 2], "entries_not_found": []})
+            data, {"republished_entries": [1, 2], "entries_not_found": [], "entries_not_published": []})
 
     @patch('register.utilities.data.queries.count_entries')
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
-    @patch('register.utilities.data.queries.publish_message')
+    @patch('register.utilities.data.queries.publish_messages')
     def test_republish_entries_over_max(self, mock_publish, mock_start, mock_commit, mock_count):
         mock_count.return_value = 1
+        mock_publish.return_value = [None]
         mock_start.return_value.fetchone.side_effect = [
             record_rows[1], record_rows[0], record_rows[1], record_rows[0]]
         response = self.app.post("/entries/republish",
@@ -215,9 +277,27 @@ class TestRetrieve(unittest.TestCase):
                                  headers={"Content-type": "application/json"})
         data = json.loads(response.data.decode())
         self.assertEqual(response.status_code, 404)
-        self.assertEqual(mock_commit.call_count, 2)
+        mock_commit.assert_called_once()
+        self.assertEqual(
+            data, {"republished_entries": [1], "entries_not_found": [2], "entries_not_published": []})
+
+    @patch('register.utilities.data.queries.count_entries')
+    @patch('register.utilities.data.queries.commit')
+    @patch('register.utilities.data.queries.start')
+    @patch('register.utilities.data.queries.publish_messages')
+    def test_republish_entries_not_published(self, mock_publish, mock_start, mock_commit, mock_count):
+        mock_count.return_value = 100
+        mock_publish.return_value = [None, IOError("Not confirmed")]
+        mock_start.return_value.fetchone.side_effect = [
+            record_rows[1], record_rows[0], record_rows[1], record_rows[0]]
+        response = self.app.post("/entries/republish",
+                                 data=json.dumps(
+                                     {"entries": [1, 2], "routing_key": "key"}),
+                                 headers={"Content-type": "application/json"})
+        data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 500)
         self.assertEqual(
-            data, {"republished_entries": [1], "entries_not_found": [2]})
+            data, {"republished_entries": [1], "entries_not_found": [], "entries_not_published": [2]})
 
     def test_republish_no_entries(self):
         response = self.app.post("/entries/republish",
@@ -275,6 +355,7 @@ class TestRetrieve(unittest.TestCase):
     @patch('register.views.proof.commit')
     @patch('register.views.proof.start')
     def test_get_register_proof_empty(self, mock_start, mock_commit, mock_treedata):
+        mock_start.return_value.fetchone.return_value = None
         leaf_hash = '7fa394d1c4a1a9d393147e37ce536a66c539c8da326932e87a9260d98f4678dc'
         branch_hash = '7fa394d1c4a1a9d393147e37ce536a66c539c8da326932e87a9260d98f4678dc'
         mock_treedata.return_value.leaf_hash.return_value = leaf_hash
@@ -286,6 +367,55 @@ class TestRetrieve(unittest.TestCase):
             'sha-256:E3B0C44298FC1C149AFBF4C8996FB92427AE41E4649B934CA495991B7852B855', data['root-hash'])
         self.assertEqual(0, data['tree-size'])
 
+    @patch('register.views.proof.MerkleData')
+    @patch('register.views.proof.commit')
+    @patch('register.views.proof.start')
+    def test_get_register_proof_recorded(self, mock_start, mock_commit, mock_treedata):
+        mock_start.return_value.fetchone.return_value = dict(tree_head_row, latest_entry_number=4)
+        response = self.app.get('/proof/register/merkle:sha-256')
+        data = json.loads(response.data.decode())
+        self.assertEqual({
+            "proof-identifier": "merkle:sha-256",
+            "tree-size": 4,
+            "timestamp": "2017-01-30 12:32:45.123654",
+            "root-hash": "sha-256:E1CEEBC7BE6FA1DE812C7C2B08440BAF65317978E125C35FFBE93F6613BCABA7",
+            "tree-head-signature": "rs256:SIGNATURE"
+        }, data)
+        mock_treedata.assert_not_called()
+
+    @patch('register.views.proof.MerkleData')
+    @patch('register.views.proof.commit')
+    @patch('register.views.proof.start')
+    def test_get_register_proof_behind(self, mock_start, mock_commit, mock_treedata):
+        mock_start.return_value.fetchone.return_value = dict(tree_head_row, latest_entry_number=5)
+        mock_treedata.return_value.frontier.return_value = {}
+        mock_treedata.return_value.latest_entry_number.return_value = 5
+        mock_treedata.return_value.leaf_hash = self.fake_leaf_hash
+        mock_treedata.return_value.branch_hash.return_value = None
+        mock_treedata.return_value.leaf_count.return_value = 4
+        response = self.app.get('/proof/register/merkle:sha-256')
+        data = json.loads(response.data.decode())
+        self.assertEqual(4, data['tree-size'])
+        self.assertIsNone(data['tree-head-signature'])
+
+    @patch('register.views.proof.commit')
+    @patch('register.views.proof.start')
+    def test_get_historical_register_proof(self, mock_start, mock_commit):
+        mock_start.return_value.fetchone.return_value = tree_head_row
+        response = self.app.get('/proof/register/4/merkle:sha-256')
+        data = json.loads(response.data.decode())
+        self.assertEqual(4, data['tree-size'])
+        self.assertEqual("rs256:SIGNATURE", data['tree-head-signature'])
+        self.assertEqual({'size': 4}, mock_start.return_value.execute.call_args[0][1])
+
+    @patch('register.views.proof.commit')
+    @patch('register.views.proof.start')
+    def test_get_historical_register_proof_404(self, mock_start, mock_commit):
+        mock_start.return_value.fetchone.return_value = None
+        response = self.app.get('/proof/register/3/merkle:sha-256')
+        self.assertEqual(response.status_code, 404)
+        mock_commit.assert_called_once()
+
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
     def test_get_register_proof_bad(self, mock_start, mock_commit):
@@ -296,6 +426,7 @@ class TestRetrieve(unittest.TestCase):
     @patch('register.views.proof.commit')
     @patch('register.views.proof.start')
     def test_get_register_proof_nonempty(self, mock_start, mock_commit, mock_treedata):
+        mock_start.return_value.fetchone.return_value = None
         mock_treedata.return_value.leaf_hash = self.fake_leaf_hash
         mock_treedata.return_value.branch_hash.return_value = None
         mock_treedata.return_value.leaf_count.return_value = 4
@@ -366,6 +497,15 @@ class TestRetrieve(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         mock_commit.assert_called_once()
 
+    @patch('register.utilities.data.queries.commit')
+    @patch('register.utilities.data.queries.start')
+    def test_get_record_entries_change(self, mock_start, mock_commit):
+        mock_start.return_value.fetchall.return_value = entry_rows
+        data = json.loads(self.app.get("/record/1/entries").data.decode())
+        self.assertEqual('UPDATED', data[0]['action-type'])
+        self.assertEqual(1, data[0]['previous-entry-number'])
+        self.assertNotIn('action-type', data[1])
+
     @patch('register.utilities.data.queries.commit')
     @patch('register.utilities.data.queries.start')
     def test_get_record_entries_404(self, mock_start, mock_commit):
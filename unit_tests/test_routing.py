@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from register.main import app
+from register.utilities.data.queries import insert_items_bulk_in_transaction, republish_entry_batch
+from register.utilities.routing import routing_key_for, partition
+
+
+class TestRouting(unittest.TestCase):
+
+    @patch.dict(app.config, {'ROUTING_PARTITIONS': 0})
+    def test_unpartitioned(self):
+        self.assertEqual('llc.local-land-charge', routing_key_for('llc.local-land-charge', '777666555'))
+
+    @patch.dict(app.config, {'ROUTING_PARTITIONS': 8})
+    def test_partitioned(self):
+        routing_key = routing_key_for('llc.local-land-charge', '777666555')
+        self.assertEqual('llc.local-land-charge.{}'.format(partition('777666555', 8)), routing_key)
+        # Keys are compared as strings, and the partition doesn't depend on the process
+        self.assertEqual(routing_key, routing_key_for('llc.local-land-charge', 777666555))
+        self.assertEqual(0, partition('777666555', 8))
+        self.assertEqual(8, len(set(partition(str(key), 8) for key in range(1000))))
+
+    @patch.dict(app.config, {'ROUTING_PARTITIONS': 4})
+    @patch('register.utilities.data.queries.store_outbox_messages')
+    def test_bulk_insert_partitioned(self, mock_outbox):
+        cursor = MagicMock()
+        cursor.mogrify.side_effect = lambda template, row: repr(row).encode()
+        cursor.fetchall.side_effect = [[], [], []]
+        cursor.fetchone.return_value = {'last': 0}
+        insert_items_bulk_in_transaction(cursor, [
+            {'item': {'local-land-charge': str(key)}, 'item-hash': 'hash{}'.format(key), 'item-signature': 'sig'}
+            for key in range(20)
+        ])
+        for entry_number, routing_key, message in mock_outbox.call_args[0][1]:
+            self.assertEqual(routing_key_for(app.config['REGISTER_ROUTEKEY'], message['key']), routing_key)
+            self.assertTrue(routing_key.startswith(app.config['REGISTER_ROUTEKEY'] + '.'))
+
+    @patch.dict(app.config, {'ROUTING_PARTITIONS': 4})
+    @patch('register.utilities.data.queries.count_entries')
+    @patch('register.utilities.data.queries.commit')
+    @patch('register.utilities.data.queries.start')
+    @patch('register.utilities.data.queries.publish_messages')
+    def test_republish_partitioned(self, mock_publish, mock_start, mock_commit, mock_count):
+        mock_count.return_value = 100
+        mock_publish.return_value = [None]
+        mock_start.return_value.fetchone.side_effect = [{
+            'entry_number': 1, 'entry_timestamp': datetime(2017, 1, 1), 'item_hash': 'hash', 'key': '12',
+            'item': {'local-land-charge': '12'}, 'item_signature': 'sig', 'action_type': 'NEW',
+            'previous_entry_number': None, 'changes': None
+        }]
+        republish_entry_batch([1], 'resync')
+        self.assertEqual(['resync.{}'.format(partition('12', 4))],
+                         [routing_key for message, routing_key in mock_publish.call_args[0][0]])
@@ -0,0 +1,115 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from register.exceptions import ApplicationError
+from register.main import app
+from register.utilities.canonical import CanonicalItem
+from register.utilities.streaming import iter_json_array, iter_ndjson, iter_chunks
+
+RECORDS = [
+    {"item": {"local-land-charge": 1, "geometry": {"coordinates": [[1.5, 2], [3, 4]]}},
+     "item-hash": "sha-256:aa", "item-signature": "sig"},
+    {"item": {"local-land-charge": 2, "description": "café [1], {2}"},
+     "item-hash": "sha-256:bb", "item-signature": "sig"},
+    {"item": {"local-land-charge": 3}, "item-hash": "sha-256:cc", "item-signature": "sig"}
+]
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_iter_json_array(self):
+        body = json.dumps(RECORDS, indent=2, ensure_ascii=False).encode()
+        for read_size in [1, 2, 7, 65536]:
+            self.assertEqual(RECORDS, list(iter_json_array(io.BytesIO(body), read_size)))
+
+    def test_iter_json_array_numbers_across_reads(self):
+        self.assertEqual([12345, 678], list(iter_json_array(io.BytesIO(b'[12345, 678]'), 2)))
+
+    def test_iter_json_array_empty(self):
+        self.assertEqual([], list(iter_json_array(io.BytesIO(b' [ ] '), 1)))
+
+    def test_iter_json_array_invalid(self):
+        for body in [b'{}', b'[{"a": 1}', b'[{"a": 1} {"b": 2}]', b'[{"a": }]', b'[1] 2']:
+            with self.assertRaises(ApplicationError):
+                list(iter_json_array(io.BytesIO(body), 3))
+
+    def test_iter_json_array_max_item_size(self):
+        self.assertEqual([[1, 2], "abc"], list(iter_json_array(io.BytesIO(b'[[1, 2], "abc"]'), 2, 6)))
+        with self.assertRaises(ApplicationError):
+            list(iter_json_array(io.BytesIO(b'[[1, 2], "abcde"]'), 2, 6))
+
+    def test_iter_json_array_large_malformed(self):
+        # An unterminated string would otherwise be buffered until the end of the body
+        stream = io.BytesIO(b'[{"a": "' + b'x' * 1000000)
+        with self.assertRaises(ApplicationError) as context:
+            list(iter_json_array(stream, 1024, 4096))
+        self.assertIn('longer than 4096', context.exception.message)
+        self.assertLess(stream.tell(), 10000)
+
+    def test_iter_ndjson_max_item_size(self):
+        stream = io.BytesIO(b'{"a": 1}\n{"a": "' + b'x' * 1000000)
+        values = iter_ndjson(stream, 4096)
+        self.assertEqual({"a": 1}, next(values))
+        with self.assertRaises(ApplicationError):
+            next(values)
+        self.assertLess(stream.tell(), 10000)
+
+    def test_iter_ndjson(self):
+        body = b'\n'.join(json.dumps(record).encode() for record in RECORDS) + b'\n\n'
+        self.assertEqual(RECORDS, list(iter_ndjson(io.BytesIO(body))))
+
+    def test_iter_chunks(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(iter_chunks(iter(range(5)), 2)))
+
+    @patch.dict(app.config, {'STREAM_INGEST_CHUNK_SIZE': 2})
+    @patch('register.views.records.outbox_dispatcher')
+    @patch('register.views.records.insert_items_bulk_in_transaction')
+    @patch('register.utilities.validation._get_remote_item_errors')
+    @patch('register.views.records.commit')
+    @patch('register.views.records.start')
+    def test_post_records_ndjson(self, mock_start, mock_commit, mock_errors, mock_insert, mock_outbox):
+        # Every chunk is validated before the transaction (and with it the append lock) is started
+        validated_in_transaction = []
+        mock_errors.side_effect = lambda data, trace_id: validated_in_transaction.append(mock_start.called)
+        mock_insert.side_effect = lambda cursor, records: [{'item-hash': record['item-hash'], 'entry-number': 1}
+                                                           for record in records]
+        body = '\n'.join(json.dumps(record) for record in RECORDS)
+        response = self.app.post('/records', data=body, headers={'Content-Type': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(3, len(json.loads(response.data.decode())))
+        self.assertEqual([False] * 3, validated_in_transaction)
+        self.assertEqual([RECORDS[0:2], RECORDS[2:3]], [c[0][1] for c in mock_insert.call_args_list])
+        self.assertIsInstance(mock_insert.call_args[0][1][0]['item'], CanonicalItem)
+        mock_commit.assert_called_once_with(mock_start.return_value)
+        mock_outbox.notify.assert_called_once_with()
+
+    @patch.dict(app.config, {'STREAM_INGEST': True, 'STREAM_MAX_ITEM_SIZE': 4096})
+    @patch('register.views.records.insert_items_bulk_in_transaction')
+    @patch('register.views.records.start')
+    def test_post_records_large_malformed(self, mock_start, mock_insert):
+        body = b'[{"item": {"local-land-charge": "' + b'1' * 100000
+        response = self.app.post('/records', data=body, headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('longer than 4096', response.data.decode())
+        mock_insert.assert_not_called()
+        mock_start.assert_not_called()
+
+    @patch.dict(app.config, {'STREAM_INGEST_CHUNK_SIZE': 2})
+    @patch('register.views.records.insert_items_bulk_in_transaction')
+    @patch('register.views.records.rollback')
+    @patch('register.views.records.commit')
+    @patch('register.views.records.start')
+    def test_post_records_ndjson_invalid(self, mock_start, mock_commit, mock_rollback, mock_insert):
+        body = '\n'.join(json.dumps(record) for record in [RECORDS[0], {"item": {}}])
+        response = self.app.post('/records', data=body, headers={'Content-Type': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual("Record 1 is invalid", json.loads(response.data.decode())[0]['error'])
+        mock_insert.assert_not_called()
+        mock_start.assert_not_called()
+        mock_commit.assert_not_called()
+        mock_rollback.assert_not_called()
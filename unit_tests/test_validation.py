@@ -0,0 +1,180 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from flask import g
+from jsonschema import Draft4Validator
+
+from register.dependencies.http import CircuitBreaker, CircuitOpenError
+from register.exceptions import ApplicationError
+from register.main import app
+from register.utilities.cache import LRUCache
+from register.utilities.validation import _item_schema, get_batch_item_errors, get_item_errors, \
+    get_local_item_errors, validation_cache
+
+
+def _closed_validator():
+    with patch.dict(app.config, {'ITEM_SCHEMA_CLOSED': True}):
+        return Draft4Validator(_item_schema())
+
+
+def _response(status_code, content=b''):
+    response = MagicMock()
+    response.status_code = status_code
+    response.content = content
+    return response
+
+
+class TestValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        validation_cache.clear()
+
+    @patch('register.utilities.validation.validation_session')
+    def test_batch_item_errors_keep_indices(self, session):
+        def post(uri, data, headers, timeout):
+            self.assertEqual('trace', headers['X-Trace-ID'])
+            if json.loads(data)['local-land-charge'] % 2 == 1:
+                return _response(400, json.dumps([{"error": str(json.loads(data)['local-land-charge'])}]).encode())
+            return _response(200)
+        session.get.return_value.post.side_effect = post
+        items = [{"item": {"local-land-charge": number}} for number in range(20)]
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            errors = get_batch_item_errors(items, 100)
+        self.assertEqual(10, len(errors))
+        for number, error in zip(range(1, 20, 2), errors):
+            self.assertEqual("Item {} is invalid".format(100 + number), error['error'])
+            self.assertEqual([{"error": str(number)}], error['details'])
+
+    @patch('register.utilities.validation.validation_breaker')
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_circuit_open(self, session, breaker):
+        breaker.before_call.side_effect = CircuitOpenError("Circuit breaker for validation-api is open")
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            with self.assertRaises(ApplicationError) as context:
+                get_item_errors({"local-land-charge": 1})
+        self.assertEqual(503, context.exception.http_code)
+        session.get.assert_not_called()
+
+    @patch('register.utilities.validation.validation_breaker')
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_server_error_counts_as_failure(self, session, breaker):
+        session.get.return_value.post.return_value = _response(503, b'[]')
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            get_item_errors({"local-land-charge": 1})
+        breaker.record_failure.assert_called_once_with()
+        breaker.record_success.assert_not_called()
+
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_cached_on_success(self, session):
+        session.get.return_value.post.return_value = _response(200)
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            self.assertIsNone(get_item_errors({"local-land-charge": 1, "a": "b"}))
+            self.assertIsNone(get_item_errors({"a": "b", "local-land-charge": 1}))
+        self.assertEqual(1, session.get.return_value.post.call_count)
+
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_failures_not_cached(self, session):
+        session.get.return_value.post.return_value = _response(400, b'[{"error": "bad"}]')
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            get_item_errors({"local-land-charge": 1})
+            get_item_errors({"local-land-charge": 1})
+        self.assertEqual(2, session.get.return_value.post.call_count)
+
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_cache_keyed_by_version(self, session):
+        session.get.return_value.post.return_value = _response(200)
+        with app.test_request_context():
+            g.trace_id = 'trace'
+            get_item_errors({"local-land-charge": 1})
+            with patch.dict(app.config, {'VALIDATION_VERSION': '2'}):
+                get_item_errors({"local-land-charge": 1})
+        self.assertEqual(2, session.get.return_value.post.call_count)
+
+    @patch('register.utilities.validation.validation_session')
+    def test_item_errors_local_schema(self, session):
+        with patch('register.utilities.validation.ITEM_VALIDATOR', _closed_validator()), app.test_request_context():
+            g.trace_id = 'trace'
+            errors = get_item_errors({"local-land-charge": 1, "squamous": "place 342"})
+        self.assertEqual(1, len(errors))
+        self.assertEqual('$.', errors[0]['location'])
+        self.assertIn('squamous', errors[0]['error_message'])
+        session.get.assert_not_called()
+
+    def test_item_schema_open_by_default(self):
+        self.assertEqual({"type": "object", "required": ["local-land-charge"]}, _item_schema())
+        self.assertIsNone(get_local_item_errors({"local-land-charge": 1, "squamous": "place 342"}))
+
+    @patch('register.utilities.validation.validation_session')
+    def test_batch_item_errors_local_first(self, session):
+        session.get.return_value.post.return_value = _response(200)
+        items = [{"item": {"local-land-charge": 1}}, {"item": {"elongated": 2}},
+                 {"item": {"local-land-charge": 3, "rubose": 3}}, {"item": {"local-land-charge": 4}}]
+        with patch('register.utilities.validation.ITEM_VALIDATOR', _closed_validator()), app.test_request_context():
+            g.trace_id = 'trace'
+            errors = get_batch_item_errors(items)
+        self.assertEqual(["Item 1 is invalid", "Item 2 is invalid"], [error['error'] for error in errors])
+        self.assertEqual(2, session.get.return_value.post.call_count)
+
+    def test_metrics_and_clear_cache(self):
+        validation_cache.put('key', True)
+        response = self.app.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, json.loads(response.data.decode())['caches']['validation']['size'])
+        self.assertEqual(204, self.app.delete('/metrics/caches/validation').status_code)
+        self.assertIsNone(validation_cache.get('key'))
+        self.assertEqual(404, self.app.delete('/metrics/caches/nothing').status_code)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache('test', 2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual({"size": 2, "maxsize": 2, "hits": 2, "misses": 1}, cache.stats())
+
+    def test_disabled(self):
+        cache = LRUCache('test', 0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    @patch('register.dependencies.http.time')
+    def test_opens_and_closes(self, mock_time):
+        mock_time.monotonic.return_value = 100
+        breaker = CircuitBreaker('test', 2, 30)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        # One trial call is let through after the reset timeout
+        mock_time.monotonic.return_value = 131
+        breaker.before_call()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        breaker.record_success()
+        breaker.before_call()
+        self.assertFalse(breaker.is_open)
+
+    @patch('register.dependencies.http.time')
+    def test_failed_trial_reopens(self, mock_time):
+        mock_time.monotonic.return_value = 100
+        breaker = CircuitBreaker('test', 1, 30)
+        breaker.record_failure()
+        mock_time.monotonic.return_value = 131
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.before_call)